@@ -0,0 +1,66 @@
+"""
+Alembic migration environment
+
+Migrations run over a synchronous (psycopg2) connection; the application
+itself uses the async engine from app.core.database.
+"""
+
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import create_engine, pool
+
+from app.core.config import settings
+from app.core.database import Base
+from app.models import models  # noqa: F401  (registers all tables on Base.metadata)
+
+config = context.config
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+def get_url() -> str:
+    """
+    Resolve the database URL: `-x db_url=...`, then sqlalchemy.url, then DATABASE_URL
+    """
+    x_args = context.get_x_argument(as_dictionary=True)
+    return x_args.get("db_url") or config.get_main_option("sqlalchemy.url") or settings.DATABASE_URL
+
+def run_migrations_offline() -> None:
+    """
+    Emit migration SQL to stdout without connecting to the database
+    """
+    context.configure(
+        url=get_url(),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations_online() -> None:
+    """
+    Run migrations against a live database connection
+    """
+    connectable = create_engine(get_url(), poolclass=pool.NullPool)
+
+    with connectable.connect() as connection:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            # Each migration runs in its own transaction so that migrations
+            # using CREATE INDEX CONCURRENTLY can step outside of it
+            transaction_per_migration=True,
+        )
+
+        with context.begin_transaction():
+            context.run_migrations()
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
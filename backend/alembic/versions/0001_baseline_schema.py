@@ -0,0 +1,112 @@
+"""Baseline schema
+
+Tables as created by Base.metadata.create_all before migrations were
+introduced. Databases created that way are stamped at this revision
+(create_tables.py does this automatically) instead of running it.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('email', sa.String(), nullable=True),
+        sa.Column('google_id', sa.String(), nullable=True),
+        sa.Column('hashed_password', sa.String(), nullable=True),
+        sa.Column('display_name', sa.String(), nullable=True),
+        sa.Column('photo_url', sa.String(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('payment_status', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_users_id', 'users', ['id'])
+    op.create_index('ix_users_email', 'users', ['email'], unique=True)
+    op.create_index('ix_users_google_id', 'users', ['google_id'], unique=True)
+
+    op.create_table(
+        'prompts',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(), nullable=True),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('content', sa.Text(), nullable=True),
+        sa.Column('is_shared', sa.Boolean(), nullable=True),
+        sa.Column('meta_data', sa.JSON(), nullable=True),
+        sa.Column('owner_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_prompts_id', 'prompts', ['id'])
+    op.create_index('ix_prompts_title', 'prompts', ['title'])
+
+    op.create_table(
+        'tags',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_tags_id', 'tags', ['id'])
+    op.create_index('ix_tags_name', 'tags', ['name'], unique=True)
+
+    op.create_table(
+        'prompt_tags',
+        sa.Column('prompt_id', sa.Integer(), sa.ForeignKey('prompts.id'), nullable=False),
+        sa.Column('tag_id', sa.Integer(), sa.ForeignKey('tags.id'), nullable=False),
+        sa.PrimaryKeyConstraint('prompt_id', 'tag_id'),
+    )
+
+    op.create_table(
+        'prompt_history',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=255), nullable=True),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('original_prompt', sa.Text(), nullable=False),
+        sa.Column('improved_prompt', sa.Text(), nullable=False),
+        sa.Column('url', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_prompt_history_id', 'prompt_history', ['id'])
+
+    op.create_table(
+        'user_library',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(), nullable=True),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('variables', sa.JSON(), nullable=True),
+        sa.Column('icon_id', sa.String(), nullable=True),
+        sa.Column('color_id', sa.String(), nullable=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_user_library_id', 'user_library', ['id'])
+    op.create_index('ix_user_library_title', 'user_library', ['title'])
+
+
+def downgrade() -> None:
+    op.drop_table('user_library')
+    op.drop_table('prompt_history')
+    op.drop_table('prompt_tags')
+    op.drop_table('tags')
+    op.drop_table('prompts')
+    op.drop_table('users')
@@ -0,0 +1,35 @@
+"""Per-user usage counters
+
+Adds users.prompts_count and users.improvements_count. A constant
+DEFAULT on ADD COLUMN is a catalog-only change on PostgreSQL 11+, so the
+table is not rewritten; the backfill only touches the users table.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS prompts_count INTEGER NOT NULL DEFAULT 0")
+    op.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS improvements_count INTEGER NOT NULL DEFAULT 0")
+    op.execute(
+        "UPDATE users SET "
+        "prompts_count = (SELECT COUNT(*) FROM user_library WHERE user_library.user_id = users.id), "
+        "improvements_count = (SELECT COUNT(*) FROM prompt_history WHERE prompt_history.user_id = users.id)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'improvements_count')
+    op.drop_column('users', 'prompts_count')
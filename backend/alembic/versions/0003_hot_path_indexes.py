@@ -0,0 +1,40 @@
+"""Hot-path composite indexes
+
+(user_id, created_at DESC, id DESC) indexes for keyset pagination of the
+library and history listings, in the listings' order (created_at DESC,
+id DESC) so that a page is a single forward index scan. Built with CREATE INDEX CONCURRENTLY so
+writes are not blocked while the index is created.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_user_library_user_created_id "
+            "ON user_library (user_id, created_at DESC, id DESC)"
+        )
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_prompt_history_user_created_id "
+            "ON prompt_history (user_id, created_at DESC, id DESC)"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_prompt_history_user_created_id")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_user_library_user_created_id")
@@ -0,0 +1,96 @@
+"""Full-text search vectors
+
+Adds tsvector columns to user_library and prompt_history with GIN indexes
+for the search endpoints. The columns are plain nullable columns kept up
+to date by BEFORE triggers: unlike STORED generated columns, adding them
+does not rewrite the table under an exclusive lock. Existing rows are
+backfilled in batches of BACKFILL_BATCH ids, each in its own transaction,
+and the GIN indexes are then built CONCURRENTLY.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+# Rows updated per backfill transaction
+BACKFILL_BATCH = 10000
+
+LIBRARY_SEARCH_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce({row}title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce({row}description, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce({row}content, '')), 'C')"
+)
+
+HISTORY_SEARCH_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce({row}original_prompt, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce({row}improved_prompt, '')), 'B')"
+)
+
+# (table, vector expression, columns it is computed from)
+SEARCH_VECTORS = (
+    ("user_library", LIBRARY_SEARCH_VECTOR, "title, description, content"),
+    ("prompt_history", HISTORY_SEARCH_VECTOR, "original_prompt, improved_prompt"),
+)
+
+
+def _backfill(table: str, vector: str) -> None:
+    connection = op.get_bind()
+    first, last = connection.execute(sa.text(f"SELECT min(id), max(id) FROM {table}")).one()
+    if first is None:
+        return
+    for start in range(first, last + 1, BACKFILL_BATCH):
+        connection.execute(sa.text(
+            f"UPDATE {table} SET search_vector = {vector.format(row='')} "
+            "WHERE id >= :start AND id < :stop AND search_vector IS NULL"
+        ), {"start": start, "stop": start + BACKFILL_BATCH})
+
+
+def upgrade() -> None:
+    for table, vector, columns in SEARCH_VECTORS:
+        op.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector")
+        op.execute(
+            f"CREATE OR REPLACE FUNCTION {table}_search_vector() RETURNS trigger AS $$ "
+            f"BEGIN NEW.search_vector := {vector.format(row='NEW.')}; RETURN NEW; END "
+            "$$ LANGUAGE plpgsql"
+        )
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_search_vector ON {table}")
+        op.execute(
+            f"CREATE TRIGGER {table}_search_vector "
+            f"BEFORE INSERT OR UPDATE OF {columns} ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION {table}_search_vector()"
+        )
+
+    # Rows written from here on get their vector from the trigger. Outside a
+    # transaction block every batch commits on its own, and CONCURRENTLY
+    # cannot run inside one
+    with op.get_context().autocommit_block():
+        for table, vector, _ in SEARCH_VECTORS:
+            _backfill(table, vector)
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_user_library_search_vector "
+            "ON user_library USING gin (search_vector)"
+        )
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_prompt_history_search_vector "
+            "ON prompt_history USING gin (search_vector)"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_prompt_history_search_vector")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_user_library_search_vector")
+    for table, _, _ in SEARCH_VECTORS:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_search_vector ON {table}")
+        op.execute(f"DROP FUNCTION IF EXISTS {table}_search_vector()")
+        op.drop_column(table, 'search_vector')
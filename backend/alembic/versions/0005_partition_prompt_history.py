@@ -0,0 +1,157 @@
+"""Partition prompt_history by month
+
+Rebuilds prompt_history as a table partitioned by RANGE (created_at) with
+one partition per calendar month and a default partition, and adds
+prompt_history_archive for compressed copies of expired partitions (see
+app/services/history_retention.py).
+
+The primary key becomes (id, created_at), since a partitioned table's
+unique constraints must include the partition key; ids keep coming from
+the existing sequence. The rows are copied into the new table, so run
+this migration in a maintenance window on large databases. The search
+vector trigger moves to the partitioned table, which requires PostgreSQL
+13 or later (BEFORE ROW triggers on partitioned tables).
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19 00:00:00
+"""
+
+from datetime import date, datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+# Months of partitions created ahead of the current one
+PARTITIONS_AHEAD = 2
+
+COLUMNS = "id, title, description, original_prompt, improved_prompt, url, created_at, user_id, search_vector"
+
+
+def _add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _create_search_trigger() -> None:
+    # The prompt_history_search_vector() function comes from revision 0004
+    op.execute(
+        "CREATE TRIGGER prompt_history_search_vector "
+        "BEFORE INSERT OR UPDATE OF original_prompt, improved_prompt ON prompt_history "
+        "FOR EACH ROW EXECUTE FUNCTION prompt_history_search_vector()"
+    )
+
+
+def _create_indexes() -> None:
+    op.execute("CREATE INDEX ix_prompt_history_id ON prompt_history (id)")
+    op.execute("CREATE INDEX ix_prompt_history_user_created_id ON prompt_history (user_id, created_at DESC, id DESC)")
+    op.execute("CREATE INDEX ix_prompt_history_search_vector ON prompt_history USING gin (search_vector)")
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+
+    op.execute(
+        "CREATE TABLE prompt_history_partitioned ("
+        "id INTEGER NOT NULL DEFAULT nextval('prompt_history_id_seq'), "
+        "title VARCHAR(255), "
+        "description TEXT, "
+        "original_prompt TEXT NOT NULL, "
+        "improved_prompt TEXT NOT NULL, "
+        "url VARCHAR, "
+        "created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(), "
+        "user_id INTEGER, "
+        "search_vector tsvector, "
+        "CONSTRAINT prompt_history_pkey_partitioned PRIMARY KEY (id, created_at), "
+        "CONSTRAINT prompt_history_user_id_fkey_partitioned FOREIGN KEY (user_id) REFERENCES users (id)"
+        ") PARTITION BY RANGE (created_at)"
+    )
+
+    # Monthly partitions from the oldest row up to PARTITIONS_AHEAD months from now
+    oldest = connection.execute(sa.text("SELECT min(created_at) FROM prompt_history")).scalar()
+    today = datetime.now(timezone.utc).date()
+    month = (oldest.astimezone(timezone.utc).date() if oldest else today).replace(day=1)
+    last = _add_months(today.replace(day=1), PARTITIONS_AHEAD)
+    while month <= last:
+        following = _add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE prompt_history_y{month.year}m{month.month:02d} "
+            "PARTITION OF prompt_history_partitioned "
+            f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{following.isoformat()} 00:00:00+00')"
+        )
+        month = following
+    op.execute("CREATE TABLE prompt_history_default PARTITION OF prompt_history_partitioned DEFAULT")
+
+    op.execute(
+        f"INSERT INTO prompt_history_partitioned ({COLUMNS}) "
+        "SELECT id, title, description, original_prompt, improved_prompt, url, "
+        "coalesce(created_at, now()), user_id, search_vector FROM prompt_history"
+    )
+
+    # Swap the tables, keeping the id sequence
+    op.execute("ALTER SEQUENCE prompt_history_id_seq OWNED BY NONE")
+    op.execute("DROP TABLE prompt_history")
+    op.execute("ALTER TABLE prompt_history_partitioned RENAME TO prompt_history")
+    op.execute("ALTER TABLE prompt_history RENAME CONSTRAINT prompt_history_pkey_partitioned TO prompt_history_pkey")
+    op.execute(
+        "ALTER TABLE prompt_history RENAME CONSTRAINT prompt_history_user_id_fkey_partitioned "
+        "TO prompt_history_user_id_fkey"
+    )
+    op.execute("ALTER SEQUENCE prompt_history_id_seq OWNED BY prompt_history.id")
+
+    _create_search_trigger()
+    _create_indexes()
+    # Lets the retention job find expired anonymous rows without scanning user rows
+    op.execute(
+        "CREATE INDEX ix_prompt_history_anonymous_created ON prompt_history (created_at) "
+        "WHERE user_id IS NULL"
+    )
+
+    op.create_table(
+        'prompt_history_archive',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('period_start', sa.Date(), nullable=False),
+        sa.Column('period_end', sa.Date(), nullable=False),
+        sa.Column('entry_count', sa.Integer(), nullable=False),
+        sa.Column('payload', sa.LargeBinary(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'period_start', name='uq_prompt_history_archive_user_period'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('prompt_history_archive')
+
+    op.execute(
+        "CREATE TABLE prompt_history_plain ("
+        "id INTEGER NOT NULL DEFAULT nextval('prompt_history_id_seq'), "
+        "title VARCHAR(255), "
+        "description TEXT, "
+        "original_prompt TEXT NOT NULL, "
+        "improved_prompt TEXT NOT NULL, "
+        "url VARCHAR, "
+        "created_at TIMESTAMP WITH TIME ZONE DEFAULT now(), "
+        "user_id INTEGER REFERENCES users (id), "
+        "search_vector tsvector, "
+        "CONSTRAINT prompt_history_plain_pkey PRIMARY KEY (id)"
+        ")"
+    )
+    op.execute(f"INSERT INTO prompt_history_plain ({COLUMNS}) SELECT {COLUMNS} FROM prompt_history")
+
+    op.execute("ALTER SEQUENCE prompt_history_id_seq OWNED BY NONE")
+    op.execute("DROP TABLE prompt_history CASCADE")
+    op.execute("ALTER TABLE prompt_history_plain RENAME TO prompt_history")
+    op.execute("ALTER TABLE prompt_history RENAME CONSTRAINT prompt_history_plain_pkey TO prompt_history_pkey")
+    op.execute("ALTER SEQUENCE prompt_history_id_seq OWNED BY prompt_history.id")
+
+    _create_search_trigger()
+    _create_indexes()
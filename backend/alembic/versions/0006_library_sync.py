@@ -0,0 +1,54 @@
+"""Incremental library sync
+
+Adds users.library_version (per-user change sequence), and
+user_library.change_seq and user_library.deleted_at (soft deletes kept
+as tombstones), plus the (user_id, change_seq) index used by
+GET /library/sync. Existing items are numbered 1..n per user in id order.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS library_version BIGINT NOT NULL DEFAULT 0")
+    op.execute("ALTER TABLE user_library ADD COLUMN IF NOT EXISTS change_seq BIGINT NOT NULL DEFAULT 0")
+    op.execute("ALTER TABLE user_library ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP WITH TIME ZONE")
+
+    op.execute(
+        "UPDATE user_library SET change_seq = numbered.seq "
+        "FROM (SELECT id, row_number() OVER (PARTITION BY user_id ORDER BY id) AS seq FROM user_library) AS numbered "
+        "WHERE user_library.id = numbered.id"
+    )
+    op.execute(
+        "UPDATE users SET library_version = "
+        "(SELECT COALESCE(MAX(change_seq), 0) FROM user_library WHERE user_library.user_id = users.id)"
+    )
+
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_user_library_user_change_seq "
+            "ON user_library (user_id, change_seq)"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_user_library_user_change_seq")
+    # Tombstones have no meaning without the sync protocol
+    op.execute("DELETE FROM user_library WHERE deleted_at IS NOT NULL")
+    op.drop_column('user_library', 'deleted_at')
+    op.drop_column('user_library', 'change_seq')
+    op.drop_column('users', 'library_version')
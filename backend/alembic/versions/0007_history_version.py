@@ -0,0 +1,27 @@
+"""History version stamp
+
+Adds users.history_version, bumped with every history change of the user
+and used to build ETags for GET /prompts/history.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS history_version BIGINT NOT NULL DEFAULT 0")
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'history_version')
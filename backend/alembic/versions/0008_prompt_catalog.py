@@ -0,0 +1,51 @@
+"""Prompt catalog indexes
+
+Indexes for the user prompts and the shared catalog: (owner_id,
+created_at DESC, id DESC) for per-user listings, a partial index on the
+shared prompts in feed order for snapshot reloads, an expression index
+on the change time for incremental catalog refreshes, and
+(tag_id, prompt_id) for tag lookups.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_prompts_owner_created_id "
+            "ON prompts (owner_id, created_at DESC, id DESC)"
+        )
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_prompts_shared_created_id "
+            "ON prompts (created_at DESC, id DESC) WHERE is_shared"
+        )
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_prompts_changed_at "
+            "ON prompts (coalesce(updated_at, created_at))"
+        )
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_prompt_tags_tag_prompt "
+            "ON prompt_tags (tag_id, prompt_id)"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_prompt_tags_tag_prompt")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_prompts_changed_at")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_prompts_shared_created_id")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_prompts_owner_created_id")
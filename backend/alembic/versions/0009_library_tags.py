@@ -0,0 +1,43 @@
+"""Library tags
+
+Adds user_library_tags (per-user tags with precomputed item counts) and
+user_library_item_tags (tag assignments) with the (tag_id, item_id)
+inverted index used to filter the library by tag.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'user_library_tags',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('item_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.UniqueConstraint('user_id', 'name', name='uq_user_library_tags_user_name'),
+    )
+    op.create_table(
+        'user_library_item_tags',
+        sa.Column('item_id', sa.Integer(), sa.ForeignKey('user_library.id'), primary_key=True),
+        sa.Column('tag_id', sa.Integer(), sa.ForeignKey('user_library_tags.id'), primary_key=True),
+    )
+    op.create_index('ix_user_library_item_tags_tag_item', 'user_library_item_tags', ['tag_id', 'item_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_user_library_item_tags_tag_item', table_name='user_library_item_tags')
+    op.drop_table('user_library_item_tags')
+    op.drop_table('user_library_tags')
@@ -0,0 +1,193 @@
+"""Content-addressed prompt texts
+
+Moves user_library.content and prompt_history.improved_prompt into
+prompt_texts, which stores each distinct text once keyed by its SHA-256;
+the tables reference it through content_hash and improved_hash.
+
+The search vectors of both tables stay plain columns set by BEFORE
+triggers, which now read the tsvector that prompt_texts computes once per
+text. The tables are rewritten, so run this migration in a maintenance
+window on large databases.
+
+Requires PostgreSQL 13 or later: the search vector trigger of the
+partitioned prompt_history is a BEFORE ROW trigger.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-19 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+LIBRARY_SEARCH_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce({row}title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce({row}description, '')), 'B') || "
+    "setweight(coalesce({text}, ''::tsvector), 'C')"
+)
+
+HISTORY_SEARCH_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce({row}original_prompt, '')), 'A') || "
+    "setweight(coalesce({text}, ''::tsvector), 'B')"
+)
+
+
+def _create_search_triggers() -> None:
+    library_vector = LIBRARY_SEARCH_VECTOR.format(
+        row="NEW.", text="(SELECT search_vector FROM prompt_texts WHERE hash = NEW.content_hash)"
+    )
+    history_vector = HISTORY_SEARCH_VECTOR.format(
+        row="NEW.", text="(SELECT search_vector FROM prompt_texts WHERE hash = NEW.improved_hash)"
+    )
+    op.execute(
+        "CREATE OR REPLACE FUNCTION user_library_search_vector() RETURNS trigger AS $$ "
+        f"BEGIN NEW.search_vector := {library_vector}; RETURN NEW; END "
+        "$$ LANGUAGE plpgsql"
+    )
+    op.execute(
+        "CREATE TRIGGER user_library_search_vector "
+        "BEFORE INSERT OR UPDATE OF title, description, content_hash ON user_library "
+        "FOR EACH ROW EXECUTE FUNCTION user_library_search_vector()"
+    )
+    op.execute(
+        "CREATE OR REPLACE FUNCTION prompt_history_search_vector() RETURNS trigger AS $$ "
+        f"BEGIN NEW.search_vector := {history_vector}; RETURN NEW; END "
+        "$$ LANGUAGE plpgsql"
+    )
+    op.execute(
+        "CREATE TRIGGER prompt_history_search_vector "
+        "BEFORE INSERT OR UPDATE OF original_prompt, improved_hash ON prompt_history "
+        "FOR EACH ROW EXECUTE FUNCTION prompt_history_search_vector()"
+    )
+
+
+def upgrade() -> None:
+    op.execute(
+        "CREATE TABLE prompt_texts ("
+        "hash BYTEA PRIMARY KEY, "
+        "content TEXT NOT NULL, "
+        "size INTEGER NOT NULL, "
+        "created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(), "
+        "search_vector tsvector GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED"
+        ")"
+    )
+    for table, column in (("user_library", "content"), ("prompt_history", "improved_prompt")):
+        op.execute(
+            "INSERT INTO prompt_texts (hash, content, size) "
+            f"SELECT sha256(convert_to({column}, 'UTF8')), {column}, octet_length({column}) FROM {table} "
+            "ON CONFLICT (hash) DO NOTHING"
+        )
+
+    # The triggers of revision 0004 read the columns being moved; dropping the
+    # vectors also drops their GIN indexes
+    op.execute("DROP TRIGGER IF EXISTS user_library_search_vector ON user_library")
+    op.execute("DROP TRIGGER IF EXISTS prompt_history_search_vector ON prompt_history")
+    op.execute("ALTER TABLE user_library DROP COLUMN search_vector")
+    op.execute("ALTER TABLE prompt_history DROP COLUMN search_vector")
+
+    op.execute("ALTER TABLE user_library ADD COLUMN content_hash BYTEA")
+    op.execute("UPDATE user_library SET content_hash = sha256(convert_to(content, 'UTF8'))")
+    op.execute("ALTER TABLE user_library ALTER COLUMN content_hash SET NOT NULL")
+    op.execute(
+        "ALTER TABLE user_library ADD CONSTRAINT user_library_content_hash_fkey "
+        "FOREIGN KEY (content_hash) REFERENCES prompt_texts (hash)"
+    )
+    op.execute("ALTER TABLE user_library DROP COLUMN content")
+
+    op.execute("ALTER TABLE prompt_history ADD COLUMN improved_hash BYTEA")
+    op.execute("UPDATE prompt_history SET improved_hash = sha256(convert_to(improved_prompt, 'UTF8'))")
+    op.execute("ALTER TABLE prompt_history ALTER COLUMN improved_hash SET NOT NULL")
+    op.execute(
+        "ALTER TABLE prompt_history ADD CONSTRAINT prompt_history_improved_hash_fkey "
+        "FOREIGN KEY (improved_hash) REFERENCES prompt_texts (hash)"
+    )
+    op.execute("ALTER TABLE prompt_history DROP COLUMN improved_prompt")
+
+    op.execute("ALTER TABLE user_library ADD COLUMN search_vector tsvector")
+    op.execute("ALTER TABLE prompt_history ADD COLUMN search_vector tsvector")
+    op.execute(
+        "UPDATE user_library SET search_vector = "
+        + LIBRARY_SEARCH_VECTOR.format(row="user_library.", text="t.search_vector")
+        + " FROM prompt_texts t WHERE t.hash = user_library.content_hash"
+    )
+    op.execute(
+        "UPDATE prompt_history SET search_vector = "
+        + HISTORY_SEARCH_VECTOR.format(row="prompt_history.", text="t.search_vector")
+        + " FROM prompt_texts t WHERE t.hash = prompt_history.improved_hash"
+    )
+    _create_search_triggers()
+
+    # Indexes on partitioned tables cannot be built CONCURRENTLY
+    op.execute("CREATE INDEX ix_prompt_history_search_vector ON prompt_history USING gin (search_vector)")
+    op.execute("CREATE INDEX ix_prompt_history_improved_hash ON prompt_history (improved_hash)")
+
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_user_library_search_vector "
+            "ON user_library USING gin (search_vector)"
+        )
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_user_library_content_hash "
+            "ON user_library (content_hash)"
+        )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS prompt_history_search_vector ON prompt_history")
+    op.execute("DROP TRIGGER IF EXISTS user_library_search_vector ON user_library")
+    op.execute("DROP FUNCTION IF EXISTS prompt_history_search_vector()")
+    op.execute("DROP FUNCTION IF EXISTS user_library_search_vector()")
+    op.execute("ALTER TABLE user_library DROP COLUMN search_vector")
+    op.execute("ALTER TABLE prompt_history DROP COLUMN search_vector")
+
+    op.execute("ALTER TABLE user_library ADD COLUMN content TEXT")
+    op.execute(
+        "UPDATE user_library SET content = t.content FROM prompt_texts t WHERE t.hash = user_library.content_hash"
+    )
+    op.execute("ALTER TABLE user_library ALTER COLUMN content SET NOT NULL")
+    op.execute("ALTER TABLE user_library DROP COLUMN content_hash")
+
+    op.execute("ALTER TABLE prompt_history ADD COLUMN improved_prompt TEXT")
+    op.execute(
+        "UPDATE prompt_history SET improved_prompt = t.content "
+        "FROM prompt_texts t WHERE t.hash = prompt_history.improved_hash"
+    )
+    op.execute("ALTER TABLE prompt_history ALTER COLUMN improved_prompt SET NOT NULL")
+    op.execute("ALTER TABLE prompt_history DROP COLUMN improved_hash")
+
+    op.drop_table('prompt_texts')
+
+    # Back to the triggers of revision 0004, which read the restored columns
+    op.execute("ALTER TABLE user_library ADD COLUMN search_vector tsvector")
+    op.execute("ALTER TABLE prompt_history ADD COLUMN search_vector tsvector")
+    library_vector = LIBRARY_SEARCH_VECTOR.format(row="{row}", text="to_tsvector('simple', {row}content)")
+    history_vector = HISTORY_SEARCH_VECTOR.format(row="{row}", text="to_tsvector('simple', {row}improved_prompt)")
+    for table, vector, columns in (
+        ("user_library", library_vector, "title, description, content"),
+        ("prompt_history", history_vector, "original_prompt, improved_prompt"),
+    ):
+        op.execute(f"UPDATE {table} SET search_vector = {vector.format(row='')}")
+        op.execute(
+            f"CREATE OR REPLACE FUNCTION {table}_search_vector() RETURNS trigger AS $$ "
+            f"BEGIN NEW.search_vector := {vector.format(row='NEW.')}; RETURN NEW; END "
+            "$$ LANGUAGE plpgsql"
+        )
+        op.execute(
+            f"CREATE TRIGGER {table}_search_vector "
+            f"BEFORE INSERT OR UPDATE OF {columns} ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION {table}_search_vector()"
+        )
+    op.execute("CREATE INDEX ix_prompt_history_search_vector ON prompt_history USING gin (search_vector)")
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_user_library_search_vector "
+            "ON user_library USING gin (search_vector)"
+        )
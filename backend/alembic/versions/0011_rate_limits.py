@@ -0,0 +1,49 @@
+"""Rate limit state
+
+Adds rate_limit_buckets (token bucket levels) and rate_limit_leases
+(in-flight slots) used by the shared rate limit backend
+(RATE_LIMIT_BACKEND=database). Both tables are UNLOGGED: they are written
+on every limited request, and losing them on a crash only resets limits.
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-19 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'rate_limit_buckets',
+        sa.Column('key', sa.String(), primary_key=True),
+        sa.Column('tokens', sa.Float(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('full_at', sa.DateTime(timezone=True), nullable=False),
+        prefixes=['UNLOGGED'],
+    )
+    op.create_index('ix_rate_limit_buckets_full_at', 'rate_limit_buckets', ['full_at'])
+    op.create_table(
+        'rate_limit_leases',
+        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+        prefixes=['UNLOGGED'],
+    )
+    op.create_index('ix_rate_limit_leases_key_expires', 'rate_limit_leases', ['key', 'expires_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_rate_limit_leases_key_expires', table_name='rate_limit_leases')
+    op.drop_table('rate_limit_leases')
+    op.drop_index('ix_rate_limit_buckets_full_at', table_name='rate_limit_buckets')
+    op.drop_table('rate_limit_buckets')
@@ -0,0 +1,51 @@
+"""Stripe event log
+
+Adds stripe_events: verified Stripe webhook events keyed by event ID,
+stored by the webhook and applied by the Stripe event worker. The partial
+index on next_attempt_at is the queue of pending events; the
+(customer_id, created, received_at) index orders each customer's events.
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-19 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0012'
+down_revision = '0011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'stripe_events',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('type', sa.String(), nullable=False),
+        sa.Column('customer_id', sa.String(), nullable=True),
+        sa.Column('created', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False, server_default='pending'),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('next_attempt_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('received_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.Column('processed_at', sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index(
+        'ix_stripe_events_pending', 'stripe_events', ['next_attempt_at'],
+        postgresql_where=sa.text("status = 'pending'")
+    )
+    op.create_index(
+        'ix_stripe_events_customer_created', 'stripe_events', ['customer_id', 'created', 'received_at']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_stripe_events_customer_created', table_name='stripe_events')
+    op.drop_index('ix_stripe_events_pending', table_name='stripe_events')
+    op.drop_table('stripe_events')
@@ -0,0 +1,36 @@
+"""Stripe customer of users
+
+Adds users.stripe_customer_id with a unique index. It is set when a
+checkout session completes (or the first time a subscription event is
+resolved by the customer's email), so later subscription events find
+their user with one indexed lookup instead of a Stripe API call.
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-19 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0013'
+down_revision = '0012'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('stripe_customer_id', sa.String(), nullable=True))
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_users_stripe_customer_id "
+            "ON users (stripe_customer_id)"
+        )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_stripe_customer_id', table_name='users')
+    op.drop_column('users', 'stripe_customer_id')
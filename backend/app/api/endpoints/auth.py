@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.database import get_db
 from app.services.auth import AuthService
@@ -12,12 +12,12 @@ auth_service = AuthService()
 @router.post("/login", response_model=Token)
 async def login_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     OAuth2 compatible token login, get an access token for future requests
     """
-    user = auth_service.authenticate_user(
+    user = await auth_service.authenticate_user(
         db, email=form_data.username, password=form_data.password
     )
     if not user:
@@ -37,7 +37,7 @@ async def login_access_token(
 @router.post("/google", response_model=GoogleAuthResponse)
 async def login_with_google(
     auth_request: GoogleAuthRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Authenticate with Google token
@@ -46,7 +46,7 @@ async def login_with_google(
     print(f"login_with_google: Token length: {len(auth_request.token)}")
     
     try:
-        user = auth_service.authenticate_google(db, auth_request.token)
+        user = await auth_service.authenticate_google(db, auth_request.token)
         
         if not user:
             print("login_with_google: Authentication failed, user is None")
@@ -0,0 +1,195 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.schemas.schemas import PromptCreate, PromptUpdate, PromptWithTags, PromptList, SharedTagList
+from app.services.prompt_catalog import prompt_catalog_service
+from app.core.caching import check_etag
+from app.core.database import get_db
+from app.core.pagination import decode_cursor
+from app.core.responses import fast_json_enabled, fast_json_response
+from app.api.endpoints.users import get_current_user
+from app.models.models import User
+
+router = APIRouter()
+
+def _validate_cursor(cursor: Optional[str]) -> None:
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@router.get("", response_model=PromptList)
+async def get_user_prompts(
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of prompts to return"),
+    cursor: Optional[str] = Query(None, description="Cursor returned with the previous page"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Get the current user's prompts, newest first
+    """
+    _validate_cursor(cursor)
+
+    try:
+        items, next_cursor = await prompt_catalog_service.list_user_prompts(
+            db=db,
+            owner_id=current_user.id,
+            limit=limit,
+            cursor=cursor
+        )
+        return {"items": items, "next_cursor": next_cursor}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting prompts: {str(e)}")
+
+@router.post("", response_model=PromptWithTags)
+async def create_prompt(
+    prompt: PromptCreate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Create a prompt, optionally shared and tagged
+    """
+    try:
+        return await prompt_catalog_service.create_prompt(
+            db=db,
+            data=prompt,
+            owner_id=current_user.id
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error creating prompt: {str(e)}")
+
+@router.get("/shared", response_model=PromptList)
+async def get_shared_prompts(
+    request: Request,
+    response: Response,
+    limit: int = Query(20, ge=1, le=100, description="Maximum number of prompts to return"),
+    cursor: Optional[str] = Query(None, description="Cursor returned with the previous page"),
+    tag: Optional[str] = Query(None, max_length=64, description="Only prompts with this tag"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get the shared prompt catalog, newest first
+
+    Served from the instance's in-memory catalog snapshot; the only database
+    query is the lookup of the signed-in user. Supports If-None-Match: the ETag is derived from the snapshot's
+    fingerprint, so it is the same on every instance holding the same
+    shared prompts and changes whenever they do.
+    """
+    _validate_cursor(cursor)
+
+    try:
+        snapshot = await prompt_catalog_service.get_snapshot()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting shared prompts: {str(e)}")
+
+    not_modified = check_etag(request, response, "shared", snapshot.fingerprint, limit, cursor, tag)
+    if not_modified:
+        return not_modified
+
+    items, next_cursor = snapshot.page(limit=limit, cursor=cursor, tag=tag)
+    content = {"items": items, "next_cursor": next_cursor}
+    if fast_json_enabled():
+        return fast_json_response(content, response)
+    return content
+
+@router.get("/shared/tags", response_model=SharedTagList)
+async def get_shared_tags(
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get the tags of the shared catalog with their prompt counts, most used first
+
+    Supports If-None-Match like GET /prompts/shared.
+    """
+    try:
+        snapshot = await prompt_catalog_service.get_snapshot()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting shared tags: {str(e)}")
+
+    not_modified = check_etag(request, response, "shared-tags", snapshot.fingerprint)
+    if not_modified:
+        return not_modified
+
+    return {"items": snapshot.tag_counts()}
+
+@router.get("/{prompt_id}", response_model=PromptWithTags)
+async def get_prompt(
+    prompt_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Get one of the user's prompts or a shared prompt
+    """
+    try:
+        prompt = await prompt_catalog_service.get_prompt(
+            db=db,
+            prompt_id=prompt_id,
+            user_id=current_user.id
+        )
+
+        if not prompt:
+            raise HTTPException(status_code=404, detail="Prompt not found")
+
+        return prompt
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting prompt: {str(e)}")
+
+@router.put("/{prompt_id}", response_model=PromptWithTags)
+async def update_prompt(
+    prompt_id: int,
+    prompt: PromptUpdate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Update one of the user's prompts; tags, when given, replace the current tags
+    """
+    try:
+        updated_prompt = await prompt_catalog_service.update_prompt(
+            db=db,
+            prompt_id=prompt_id,
+            data=prompt,
+            owner_id=current_user.id
+        )
+
+        if not updated_prompt:
+            raise HTTPException(status_code=404, detail="Prompt not found")
+
+        return updated_prompt
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating prompt: {str(e)}")
+
+@router.delete("/{prompt_id}")
+async def delete_prompt(
+    prompt_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Delete one of the user's prompts
+    """
+    try:
+        deleted = await prompt_catalog_service.delete_prompt(
+            db=db,
+            prompt_id=prompt_id,
+            owner_id=current_user.id
+        )
+
+        if not deleted:
+            raise HTTPException(status_code=404, detail="Prompt not found")
+
+        return {"message": "Prompt deleted successfully"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error deleting prompt: {str(e)}")
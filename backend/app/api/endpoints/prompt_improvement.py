@@ -1,78 +1,201 @@
-from fastapi import APIRouter, HTTPException, Depends, Query, status
-from typing import Optional
-from app.schemas.prompts import PromptRequest, PromptResponse, PromptHistory, PromptHistoryList
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from typing import Literal, Optional, Union
+from app.schemas.prompts import (
+    PromptRequest, PromptResponse, PromptHistory, PromptHistoryList, PromptHistorySummaryList,
+    PromptHistorySearchResults
+)
 from app.services.prompt_improvement import prompt_improvement_service
+from app.services.search import search_service
+from app.services.bulk_transfer import bulk_transfer_service
 from app.services.usage_limits import usage_limits_service
-from app.core.database import SessionLocal
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.admission import improve_admission
+from app.core.caching import check_etag
+from app.core.database import get_db
+from app.core.pagination import decode_cursor
+from app.core.rate_limit import improve_policy, rate_limiter
+from app.core.responses import fast_json_enabled, fast_json_response
 from app.api.endpoints.users import get_current_user
 from app.models.models import User, PromptHistory as PromptHistoryModel
 
 router = APIRouter()
 
+# Columns of a history entry in the API representation
+HISTORY_FIELDS = tuple(PromptHistory.model_fields)
+
 @router.post("/improve", response_model=PromptResponse)
 async def improve_prompt(
     request: PromptRequest,
-    current_user: Optional[User] = Depends(get_current_user)
+    http_request: Request,
+    response: Response,
+    current_user: Optional[User] = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Improve a prompt using Claude AI
     
     This endpoint takes a prompt and returns an improved version of it.
     If the user is not a paid user and has reached their improvement limit,
-    a 403 Forbidden error is returned.
+    a 403 Forbidden error is returned. Calls beyond the rate limits (per
+    user and overall) or beyond the caller's concurrent call cap get 429
+    Too Many Requests with Retry-After. When Claude is too slow to serve a
+    call in time, 503 Service Unavailable with Retry-After is returned.
+    Calls rejected with 403 or 503 are not counted against the rate limits.
     """
     try:
         # Get user_id if user is authenticated
         user_id = current_user.id if current_user else None
         
-        # Check if user has reached their improvement limit
-        if user_id is not None:
-            has_reached_limit = await usage_limits_service.check_improvement_limit(user_id)
-            if has_reached_limit:
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail="You have reached your free improvement limit. Please upgrade to a paid plan to continue."
+        # Rate limits and admission control apply before the improvement
+        # limit, so rejected calls do not use up improvements; queued calls
+        # give their pooled connection back while they wait
+        async with rate_limiter.limit(improve_policy(), http_request, response, user_id=user_id), \
+                improve_admission.admit(anonymous=user_id is None, before_wait=db.commit):
+            # Reserve an improvement slot; fails if the user has reached their limit
+            if user_id is not None:
+                reserved = await usage_limits_service.reserve_improvement(db, current_user)
+                if not reserved:
+                    raise HTTPException(
+                        status_code=status.HTTP_403_FORBIDDEN,
+                        detail="You have reached your free improvement limit. Please upgrade to a paid plan to continue."
+                    )
+            
+            improved = False
+            try:
+                improved_prompt = await prompt_improvement_service.improve_prompt(
+                    db,
+                    request.prompt,
+                    title=request.title,
+                    description=request.description,
+                    url=request.url,
+                    user_id=user_id
                 )
-        
-        improved_prompt = await prompt_improvement_service.improve_prompt(
-            request.prompt,
-            title=request.title,
-            description=request.description,
-            url=request.url,
-            user_id=user_id
-        )
-        return {"improved_prompt": improved_prompt}
+                improved = True
+            finally:
+                # Give the reserved slot back if the improvement did not happen,
+                # also when the client disconnected and the call was cancelled
+                if user_id is not None and not improved:
+                    await usage_limits_service.release_improvement(db, current_user)
+            
+            return {"improved_prompt": improved_prompt}
     except HTTPException:
         # Re-raise HTTP exceptions
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error improving prompt: {str(e)}")
 
-@router.get("/history", response_model=PromptHistoryList)
+@router.get("/history", response_model=Union[PromptHistoryList, PromptHistorySummaryList])
 async def get_prompt_history(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0, description="Number of records to skip"),
     limit: int = Query(100, ge=1, le=1000, description="Maximum number of records to return"),
-    current_user: User = Depends(get_current_user)
+    cursor: Optional[str] = Query(None, description="Cursor returned with the previous page; overrides skip"),
+    include_total: Optional[bool] = Query(None, description="Count all entries (defaults to true without a cursor)"),
+    fields: Literal["full", "summary"] = Query("full", description="summary returns prompt previews instead of full prompts"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get prompt improvement history for the current user
     
     This endpoint returns the history of improved prompts for the authenticated user.
+    Pass the returned next_cursor back as cursor to fetch the following page
+    without re-counting the history.
+    
+    Supports If-None-Match: the ETag is derived from the user's history
+    version, so an unchanged history is answered with 304 before querying.
+    With FAST_JSON_RESPONSES the page is encoded with orjson.
+    
+    With fields=summary only the first characters of the original and
+    improved prompts are returned; fetch the full entry with
+    GET /prompts/history/{id}.
     """
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    if include_total is None:
+        include_total = cursor is None
+    
+    not_modified = check_etag(
+        request, response, "history", current_user.id, current_user.history_version,
+        skip, limit, cursor, include_total, fields
+    )
+    if not_modified:
+        return not_modified
+    
     try:
-        history, total = await prompt_improvement_service.get_history(
+        history, total, next_cursor = await prompt_improvement_service.get_history(
+            db,
             skip=skip, 
             limit=limit,
-            user_id=current_user.id
+            user_id=current_user.id,
+            cursor=cursor,
+            include_total=include_total,
+            summary=fields == "summary"
         )
-        return {"items": history, "total": total}
+        if fast_json_enabled():
+            # Rows were validated on insert; project them without a pydantic pass
+            items = history if fields == "summary" else [
+                {field: getattr(entry, field) for field in HISTORY_FIELDS} for entry in history
+            ]
+            return fast_json_response({"items": items, "total": total, "next_cursor": next_cursor}, response)
+        return {"items": history, "total": total, "next_cursor": next_cursor}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting history: {str(e)}")
 
+@router.get("/history/search", response_model=PromptHistorySearchResults)
+async def search_prompt_history(
+    q: str = Query(..., min_length=1, max_length=256, description="Search text; supports \"phrases\", or, and -excluded words"),
+    skip: int = Query(0, ge=0, le=1000, description="Number of results to skip"),
+    limit: int = Query(20, ge=1, le=100, description="Maximum number of results to return"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Search prompt improvement history for the current user
+    
+    Results are ranked by relevance (original prompt matches above improved
+    prompt matches) and include highlighted snippets of both prompts.
+    """
+    try:
+        items, has_more = await search_service.search_history(
+            db=db,
+            user_id=current_user.id,
+            query=q,
+            skip=skip,
+            limit=limit
+        )
+        return {"items": items, "has_more": has_more}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching history: {str(e)}")
+
+@router.get("/history/export")
+async def export_prompt_history(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Export prompt improvement history for the current user
+    
+    Streams all history entries as NDJSON (one JSON object per line), oldest first.
+    """
+    return StreamingResponse(
+        bulk_transfer_service.export_history(db.bind, current_user.id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="history.ndjson"'}
+    )
+
 @router.get("/history/{id}", response_model=PromptHistory)
 async def get_prompt_history_item(
     id: int,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get prompt history item by ID
@@ -80,21 +203,20 @@ async def get_prompt_history_item(
     This endpoint returns a specific prompt history entry by its ID.
     """
     try:
-        # Create a new database session
-        db = SessionLocal()
-        
-        try:
-            # Get history item by ID
-            history_item = db.query(PromptHistoryModel).filter(
+        # Get history item by ID
+        result = await db.execute(
+            select(PromptHistoryModel).filter(
                 PromptHistoryModel.id == id,
                 PromptHistoryModel.user_id == current_user.id
-            ).first()
+            )
+        )
+        history_item = result.scalars().first()
+        
+        if not history_item:
+            raise HTTPException(status_code=404, detail="History item not found")
             
-            if not history_item:
-                raise HTTPException(status_code=404, detail="History item not found")
-                
-            return history_item
-        finally:
-            db.close()
+        return history_item
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting history item: {str(e)}")
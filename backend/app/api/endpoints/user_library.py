@@ -1,54 +1,381 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
-from sqlalchemy.orm import Session
+import logging
+from typing import List, Literal, Optional, Union
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.schemas.user_library import UserLibrary, UserLibraryCreate, UserLibraryUpdate, UserLibraryList
-from app.services.user_library import user_library_service
+from app.schemas.user_library import (
+    UserLibrary, UserLibraryCreate, UserLibraryUpdate, UserLibraryList, UserLibrarySummaryList,
+    UserLibrarySearchResults, UserLibraryImportResult, UserLibrarySync, UserLibraryBatchCreate,
+    UserLibraryBatchUpdate, UserLibraryBatchDelete, UserLibraryBatchResult, UserLibraryRenderRequest,
+    UserLibraryRenderResults, UserLibraryTagList, UserLibraryStorage, BATCH_MAX_ITEMS, RENDER_MAX_OUTPUTS,
+    MAX_TAGS_PER_ITEM
+)
+from app.services.user_library import user_library_service, decode_sync_token, DuplicateContentError
+from app.services.prompt_texts import prompt_text_service
+from app.services.library_tags import library_tag_service, normalize_tags
+from app.services.bulk_transfer import bulk_transfer_service
+from app.services.search import search_service
+from app.core.caching import check_etag
 from app.core.database import get_db
+from app.core.pagination import decode_cursor
+from app.core.responses import fast_json_enabled, fast_json_response
 from app.api.endpoints.users import get_current_user
 from app.models.models import User
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
-@router.get("", response_model=UserLibraryList)
+def _duplicate_conflict(error: DuplicateContentError) -> HTTPException:
+    return HTTPException(
+        status_code=409,
+        detail={"message": "The library already contains this prompt", "item_ids": error.item_ids}
+    )
+
+@router.get("", response_model=Union[UserLibraryList, UserLibrarySummaryList])
 async def get_user_library(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0, description="Number of records to skip"),
     limit: int = Query(100, ge=1, le=1000, description="Maximum number of records to return"),
+    cursor: Optional[str] = Query(None, description="Cursor returned with the previous page; overrides skip"),
+    fields: Literal["full", "summary"] = Query("full", description="summary returns content previews instead of full content"),
+    tags: Optional[List[str]] = Query(None, description="Only items with these tags (repeat the parameter)"),
+    tag_match: Literal["all", "any"] = Query("all", description="Whether items need all of the tags or any of them"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get user's prompt library
     
     This endpoint returns the user's prompt library with pagination.
+    Pass the returned next_cursor back as cursor to fetch the following page;
+    the total comes from the user's prompt counter and costs no query.
+    
+    Supports If-None-Match: the ETag is derived from the user's library
+    version, so an unchanged library is answered with 304 before querying.
+    With FAST_JSON_RESPONSES the page is encoded with orjson.
+    
+    With fields=summary only the columns shown in list views and the first
+    characters of the content are returned; fetch the full item with
+    GET /library/{item_id}.
+    
+    With tags, only items carrying all (tag_match=all) or any
+    (tag_match=any) of the tags are listed, and total counts the matching
+    items.
     """
-    print(f"get_user_library: Received request with skip={skip}, limit={limit}")
-    print(f"get_user_library: Current user: id={current_user.id}, email={current_user.email}")
+    logger.debug(
+        f"get_user_library: user={current_user.id} skip={skip} limit={limit} cursor={cursor} fields={fields}"
+    )
+    
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    tag_names = normalize_tags(tags)
+    if len(tag_names) > MAX_TAGS_PER_ITEM:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_TAGS_PER_ITEM} tags can be filtered by")
+    not_modified = check_etag(
+        request, response, "library", current_user.id, current_user.library_version, skip, limit, cursor, fields,
+        ",".join(tag_names), tag_match
+    )
+    if not_modified:
+        return not_modified
     
     try:
-        print(f"get_user_library: Calling user_library_service.get_library_items")
-        items, total = user_library_service.get_library_items(
+        items, next_cursor = await user_library_service.get_library_items(
             db=db,
             user_id=current_user.id,
             skip=skip,
-            limit=limit
+            limit=limit,
+            cursor=cursor,
+            summary=fields == "summary",
+            tags=tag_names,
+            match_all=tag_match == "all"
         )
-        print(f"get_user_library: Retrieved {len(items)} items out of {total} total")
+        if tag_names:
+            total = await library_tag_service.count_tagged(db, current_user.id, tag_names, tag_match == "all")
+        else:
+            total = current_user.prompts_count
+        logger.debug(f"get_user_library: returning {len(items)} items out of {total}")
         
-        response = {"items": items, "total": total}
-        print(f"get_user_library: Returning response with {len(items)} items")
-        return response
-    except Exception as e:
-        print(f"get_user_library: Error: {str(e)}")
-        print(f"get_user_library: Error type: {type(e).__name__}")
-        import traceback
-        print(f"get_user_library: Traceback: {traceback.format_exc()}")
+        content = {"items": items, "total": total, "next_cursor": next_cursor}
+        if fast_json_enabled():
+            # Items are already in the UserLibrary(Summary) shape; skip re-validation
+            return fast_json_response(content, response)
+        return content
+    except Exception as e:
+        logger.exception(f"Error getting user library: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error getting user library: {str(e)}")
 
+@router.get("/search", response_model=UserLibrarySearchResults)
+async def search_user_library(
+    q: str = Query(..., min_length=1, max_length=256, description="Search text; supports \"phrases\", or, and -excluded words"),
+    skip: int = Query(0, ge=0, le=1000, description="Number of results to skip"),
+    limit: int = Query(20, ge=1, le=100, description="Maximum number of results to return"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Search the user's prompt library
+    
+    Results are ranked by relevance (title, then description, then content
+    matches) and include highlighted snippets of the matching content.
+    """
+    try:
+        items, has_more = await search_service.search_library(
+            db=db,
+            user_id=current_user.id,
+            query=q,
+            skip=skip,
+            limit=limit
+        )
+        return {"items": items, "has_more": has_more}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching library: {str(e)}")
+
+@router.get("/sync", response_model=UserLibrarySync)
+async def sync_user_library(
+    sync_token: Optional[str] = Query(None, description="Token returned by the previous sync; omit for a full sync"),
+    limit: int = Query(500, ge=1, le=1000, description="Maximum number of changes to return"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Incrementally sync the user's prompt library
+    
+    Returns the items created or updated and the IDs of items deleted since
+    sync_token, in change order. Store the returned sync_token and send it
+    next time; while has_more is true, sync again right away. When nothing
+    changed no query runs and the response is empty.
+    """
+    since = None
+    if sync_token:
+        try:
+            since = decode_sync_token(sync_token)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid sync token")
+    
+    try:
+        return await user_library_service.get_changes(
+            db=db,
+            user=current_user,
+            since=since,
+            limit=limit
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error syncing library: {str(e)}")
+
+@router.get("/export")
+async def export_user_library(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Export the user's prompt library
+    
+    Streams all library items with their tags as NDJSON (one JSON object
+    per line), oldest first. The file can be uploaded again with POST
+    /library/import.
+    """
+    return StreamingResponse(
+        bulk_transfer_service.export_library(db.bind, current_user.id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="library.ndjson"'}
+    )
+
+@router.post("/import", response_model=UserLibraryImportResult)
+async def import_user_library(
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Import library items from NDJSON
+    
+    The request body holds one library item per line in the same format as
+    POST /library (an export file is accepted as is). Items are inserted in
+    batches; invalid lines are reported and skipped, and items beyond the
+    free prompt limit are skipped.
+    """
+    try:
+        return await bulk_transfer_service.import_library(
+            db=db,
+            user_id=current_user.id,
+            chunks=request.stream()
+        )
+    except HTTPException:
+        # Raised while reading a compressed body (invalid or too large)
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error importing library: {str(e)}")
+
+@router.get("/batch", response_model=UserLibraryBatchResult)
+async def get_library_items_batch(
+    ids: List[int] = Query(..., min_length=1, max_length=BATCH_MAX_ITEMS, description="Item IDs (repeat the parameter)"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Get several library items by ID
+    
+    Returns one result per ID, in request order, with status 200 and the
+    item, or status 404.
+    """
+    try:
+        results = await user_library_service.get_library_items_by_ids(
+            db=db,
+            user_id=current_user.id,
+            item_ids=ids
+        )
+        return {"results": results}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting library items: {str(e)}")
+
+@router.post("/batch/create", response_model=UserLibraryBatchResult)
+async def create_library_items_batch(
+    batch: UserLibraryBatchCreate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Create several library items in one transaction
+    
+    The free prompt limit is checked once for the whole batch: items beyond
+    it get status 403, the others status 201 and the created item.
+    """
+    try:
+        results = await user_library_service.batch_create(
+            db=db,
+            user_id=current_user.id,
+            items=batch.items
+        )
+        return {"results": results}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error creating library items: {str(e)}")
+
+@router.post("/batch/update", response_model=UserLibraryBatchResult)
+async def update_library_items_batch(
+    batch: UserLibraryBatchUpdate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Update several library items in one transaction
+    
+    Each item carries its ID and the fields to change, as in
+    PUT /library/{item_id}. Items not found get status 404, the others
+    status 200 and the updated item.
+    """
+    try:
+        results = await user_library_service.batch_update(
+            db=db,
+            user_id=current_user.id,
+            items=batch.items
+        )
+        return {"results": results}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating library items: {str(e)}")
+
+@router.post("/batch/delete", response_model=UserLibraryBatchResult)
+async def delete_library_items_batch(
+    batch: UserLibraryBatchDelete,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Delete several library items in one transaction
+    
+    Items not found get status 404, the others status 200.
+    """
+    try:
+        results = await user_library_service.batch_delete(
+            db=db,
+            user_id=current_user.id,
+            item_ids=batch.ids
+        )
+        return {"results": results}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error deleting library items: {str(e)}")
+
+@router.post("/render", response_model=UserLibraryRenderResults)
+async def render_library_items(
+    render_request: UserLibraryRenderRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Fill the {{variables}} of library items or ad-hoc templates
+    
+    Each item names a library item (id) or carries template content, and
+    one or more value sets; it is rendered once per value set. Variables
+    without a value stay as placeholders and are listed in missing.
+    """
+    outputs = sum(len(item.values) for item in render_request.items)
+    if outputs > RENDER_MAX_OUTPUTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many renderings requested ({outputs}, at most {RENDER_MAX_OUTPUTS})"
+        )
+    
+    try:
+        results = await user_library_service.render_items(
+            db=db,
+            user_id=current_user.id,
+            items=render_request.items
+        )
+        return {"results": results}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error rendering library items: {str(e)}")
+
+@router.get("/tags", response_model=UserLibraryTagList)
+async def get_library_tags(
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Get the tags of the user's library with their item counts, most used first
+    
+    Counts are maintained on every write, so this reads only the user's
+    tags. Supports If-None-Match like GET /library.
+    """
+    not_modified = check_etag(request, response, "library-tags", current_user.id, current_user.library_version)
+    if not_modified:
+        return not_modified
+    
+    try:
+        return {"items": await library_tag_service.get_facets(db, current_user.id)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting library tags: {str(e)}")
+
+@router.get("/storage", response_model=UserLibraryStorage)
+async def get_library_storage(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Get how much text storage the user's library and history use
+    
+    Library contents and improved prompts are stored once per distinct
+    text; saved_bytes is what storing repeated texts once saves.
+    """
+    try:
+        return await prompt_text_service.get_storage_stats(db, current_user.id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting library storage: {str(e)}")
+
 @router.get("/{item_id}", response_model=UserLibrary)
 async def get_library_item(
     item_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get a specific library item
@@ -56,7 +383,7 @@ async def get_library_item(
     This endpoint returns a specific prompt library item by its ID.
     """
     try:
-        item = user_library_service.get_library_item(
+        item = await user_library_service.get_library_item(
             db=db,
             item_id=item_id,
             user_id=current_user.id
@@ -74,20 +401,29 @@ async def get_library_item(
 @router.post("", response_model=UserLibrary)
 async def create_library_item(
     item: UserLibraryCreate,
+    on_duplicate: Literal["create", "reject"] = Query(
+        "create", description="reject answers 409 with the IDs of existing items that have the same content"
+    ),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Create a new library item
     
-    This endpoint creates a new prompt library item.
+    This endpoint creates a new prompt library item. With
+    on_duplicate=reject, saving content that is already in the library
+    fails with 409 and the existing item IDs, so the client can offer to
+    open the existing item instead.
     """
     try:
-        return user_library_service.create_library_item(
+        return await user_library_service.create_library_item(
             db=db,
             item=item,
-            user_id=current_user.id
+            user_id=current_user.id,
+            reject_duplicates=on_duplicate == "reject"
         )
+    except DuplicateContentError as e:
+        raise _duplicate_conflict(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating library item: {str(e)}")
 
@@ -96,7 +432,7 @@ async def update_library_item(
     item_id: int,
     item: UserLibraryUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Update a library item
@@ -104,7 +440,7 @@ async def update_library_item(
     This endpoint updates a specific prompt library item by its ID.
     """
     try:
-        updated_item = user_library_service.update_library_item(
+        updated_item = await user_library_service.update_library_item(
             db=db,
             item_id=item_id,
             item=item,
@@ -124,7 +460,7 @@ async def update_library_item(
 async def delete_library_item(
     item_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Delete a library item
@@ -132,7 +468,7 @@ async def delete_library_item(
     This endpoint deletes a specific prompt library item by its ID.
     """
     try:
-        deleted = user_library_service.delete_library_item(
+        deleted = await user_library_service.delete_library_item(
             db=db,
             item_id=item_id,
             user_id=current_user.id
@@ -150,19 +486,25 @@ async def delete_library_item(
 @router.post("/from-history/{history_id}", response_model=UserLibrary)
 async def create_from_history(
     history_id: int,
+    on_duplicate: Literal["create", "reject"] = Query(
+        "create", description="reject answers 409 with the IDs of existing items that have the same content"
+    ),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Create a library item from history
     
     This endpoint creates a new prompt library item from a history item.
+    The item shares the stored text of the history entry. on_duplicate
+    works as for POST /library.
     """
     try:
-        item = user_library_service.create_from_history(
+        item = await user_library_service.create_from_history(
             db=db,
             history_id=history_id,
-            user_id=current_user.id
+            user_id=current_user.id,
+            reject_duplicates=on_duplicate == "reject"
         )
         
         if not item:
@@ -171,5 +513,7 @@ async def create_from_history(
         return item
     except HTTPException:
         raise
+    except DuplicateContentError as e:
+        raise _duplicate_conflict(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating library item from history: {str(e)}")
@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Path
+from fastapi import APIRouter, Depends, HTTPException, status, Path, Request, Response
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import jwt, JWTError
 from typing import Literal
 
+from app.core.caching import check_etag
 from app.core.database import get_db
 from app.core.config import settings
 from app.models.models import User
@@ -16,8 +18,8 @@ router = APIRouter()
 auth_service = AuthService()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
 
-def get_current_user(
-    db: Session = Depends(get_db),
+async def get_current_user(
+    db: AsyncSession = Depends(get_db),
     token: str = Depends(oauth2_scheme)
 ) -> User:
     """
@@ -56,7 +58,7 @@ def get_current_user(
     
     try:
         print(f"get_current_user: Getting user with ID: {user_id}")
-        user = auth_service.get_user(db, int(user_id))
+        user = await auth_service.get_user(db, int(user_id))
         
         if user is None:
             print(f"get_current_user: User with ID {user_id} not found")
@@ -111,22 +113,34 @@ def get_admin_user(
 
 
 @router.get("/me", response_model=UserSchema)
-async def read_users_me(current_user: User = Depends(get_current_user)):
+async def read_users_me(
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user)
+):
     """
     Get current user
+    
+    Supports If-None-Match; the ETag covers every field of the response.
     """
+    not_modified = check_etag(
+        request, response, "me", *(getattr(current_user, field) for field in UserSchema.model_fields)
+    )
+    if not_modified:
+        return not_modified
+    
     return current_user
 
 @router.put("/me", response_model=UserSchema)
 async def update_user_me(
     user_in: UserUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Update current user
     """
-    user = auth_service.update_user(db, user_id=current_user.id, obj_in=user_in)
+    user = await auth_service.update_user(db, user_id=current_user.id, obj_in=user_in)
     return user
 
 @router.put("/{user_id}/payment-status", response_model=UserSchema)
@@ -134,7 +148,7 @@ async def update_user_payment_status(
     user_id: int = Path(..., title="The ID of the user to update"),
     payment_status: Literal["paid", "unpaid"] = "paid",
     admin_user: User = Depends(get_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Update a user's payment status (admin only)
@@ -152,7 +166,7 @@ async def update_user_payment_status(
         HTTPException: If the user is not found
     """
     # Get the user to update
-    user = auth_service.get_user(db, user_id)
+    user = await auth_service.get_user(db, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -161,14 +175,14 @@ async def update_user_payment_status(
     
     # Update the user's payment status
     user_update = UserUpdate(payment_status=payment_status)
-    updated_user = auth_service.update_user(db, user_id=user_id, obj_in=user_update)
+    updated_user = await auth_service.update_user(db, user_id=user_id, obj_in=user_update)
     
     return updated_user
 
 @router.get("/admin/users", response_model=list[UserSchema])
 async def list_users(
     admin_user: User = Depends(get_admin_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     skip: int = 0,
     limit: int = 100
 ):
@@ -184,11 +198,14 @@ async def list_users(
     Returns:
         list[User]: List of users
     """
-    users = db.query(User).offset(skip).limit(limit).all()
+    result = await db.execute(select(User).offset(skip).limit(limit))
+    users = result.scalars().all()
     return users
 
 @router.get("/limits", response_model=UserLimits)
 async def get_user_limits(
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -198,8 +215,18 @@ async def get_user_limits(
     including prompt and improvement counts, limits, and whether
     they have reached their limits.
     
+    Supports If-None-Match; the ETag is derived from the user's counters.
+    
     Returns:
         UserLimits: Object containing usage and limit information
     """
-    limits = await usage_limits_service.get_user_limits(current_user.id)
+    not_modified = check_etag(
+        request, response, "limits", current_user.id, current_user.payment_status,
+        current_user.prompts_count, current_user.improvements_count,
+        usage_limits_service.MAX_FREE_PROMPTS, usage_limits_service.MAX_FREE_IMPROVEMENTS
+    )
+    if not_modified:
+        return not_modified
+    
+    limits = await usage_limits_service.get_user_limits(current_user)
     return limits
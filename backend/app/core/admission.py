@@ -0,0 +1,159 @@
+"""
+Admission control
+
+Bounds the number of concurrent calls to a slow upstream (Claude, for
+prompt improvement) and queues the excess in the process. Instead of
+letting the queue grow until memory and connections run out, each new
+call is admitted only if it can be expected to finish within its
+deadline: the expected wait is estimated from the queue depth, the
+concurrency limit and a moving average of recent call durations. Calls
+that cannot make it are rejected at once with 503 Service Unavailable
+and Retry-After.
+
+Anonymous calls get a shorter deadline than authenticated ones, so they
+are shed first when the upstream slows down. A call that finds a free
+slot is never rejected. The state is per instance.
+"""
+
+import math
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from fastapi import HTTPException, status
+
+from app.core.config import settings
+from app.core.metrics import registry
+
+# Weight of the latest call in the moving average of call durations
+LATENCY_SMOOTHING = 0.2
+
+class AdmissionController:
+    """
+    Concurrency limit with a deadline-aware queue in front of one upstream
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        max_queue: int,
+        deadline: float,
+        anonymous_deadline_factor: float,
+        initial_latency: float
+    ):
+        """
+        Args:
+            name: Prefix of the metric names
+            max_concurrency: Calls running at once; later calls queue
+            max_queue: Calls waiting at once; later calls are rejected
+            deadline: Seconds within which an authenticated call should finish
+            anonymous_deadline_factor: Fraction of the deadline given to anonymous calls
+            initial_latency: Assumed call duration in seconds until calls have been measured
+        """
+        self.max_concurrency = max(max_concurrency, 1)
+        self.max_queue = max(max_queue, 0)
+        self.deadline = deadline
+        self.anonymous_deadline = deadline * anonymous_deadline_factor
+        self.latency = initial_latency
+        self.in_flight = 0
+        self.queued = 0
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+
+        registry.gauge(f"{name}_queue_depth", "Calls waiting for a free slot", lambda: self.queued)
+        registry.gauge(f"{name}_in_flight", "Calls running", lambda: self.in_flight)
+        registry.gauge(f"{name}_latency_estimate_seconds", "Moving average of call durations", lambda: self.latency)
+        self.shed_anonymous = registry.counter(
+            f"{name}_shed_anonymous", "Anonymous calls rejected because they could not finish in time"
+        )
+        self.shed_authenticated = registry.counter(
+            f"{name}_shed_authenticated", "Authenticated calls rejected because they could not finish in time"
+        )
+        self.queue_timeouts = registry.counter(
+            f"{name}_queue_timeouts", "Admitted calls that gave up waiting for a slot"
+        )
+        self.queue_wait = registry.histogram(f"{name}_queue_wait_seconds", "Time admitted calls waited for a slot")
+
+    def estimate_wait(self) -> float:
+        """
+        Expected seconds a call arriving now waits for a slot
+        """
+        if self.in_flight < self.max_concurrency and self.queued == 0:
+            return 0.0
+        # Slots free up at max_concurrency calls per latency on average
+        return (self.queued + 1) * self.latency / self.max_concurrency
+
+    def _reject(self, anonymous: bool, retry_after: float) -> HTTPException:
+        (self.shed_anonymous if anonymous else self.shed_authenticated).inc()
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="The service is busy. Please try again shortly.",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+    @asynccontextmanager
+    async def admit(
+        self,
+        anonymous: bool,
+        before_wait: Optional[Callable[[], Awaitable[None]]] = None
+    ) -> AsyncIterator[None]:
+        """
+        Run a call in a slot, queueing for one if the call can still finish in time
+
+        Args:
+            anonymous: Whether the caller is anonymous (shorter deadline)
+            before_wait: Called before the call starts waiting in the queue,
+                e.g. to return a pooled database connection
+
+        Raises:
+            HTTPException: 503 with Retry-After when the queue is full, the
+                expected wait exceeds the deadline, or the wait runs over it
+        """
+        deadline = self.anonymous_deadline if anonymous else self.deadline
+        wait = self.estimate_wait()
+        if wait > 0:
+            budget = deadline - self.latency
+            if self.queued >= self.max_queue or wait > budget:
+                raise self._reject(anonymous, wait - max(budget, 0.0))
+
+            if before_wait is not None:
+                await before_wait()
+            self.queued += 1
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout=budget)
+            except asyncio.TimeoutError:
+                self.queue_timeouts.inc()
+                raise self._reject(anonymous, self.latency)
+            finally:
+                self.queued -= 1
+            self.queue_wait.observe(time.monotonic() - started)
+        else:
+            await self._slots.acquire()
+
+        self.in_flight += 1
+        started = time.monotonic()
+        measured = True
+        try:
+            yield
+        except HTTPException:
+            # Rejections (e.g. usage limits) never reach the upstream
+            measured = False
+            raise
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+            if measured:
+                duration = time.monotonic() - started
+                self.latency += LATENCY_SMOOTHING * (duration - self.latency)
+
+# Admission control of prompt improvement
+improve_admission = AdmissionController(
+    "improve_admission",
+    max_concurrency=settings.IMPROVE_MAX_CONCURRENCY,
+    max_queue=settings.IMPROVE_MAX_QUEUE,
+    deadline=settings.IMPROVE_DEADLINE,
+    anonymous_deadline_factor=settings.IMPROVE_ANONYMOUS_DEADLINE_FACTOR,
+    initial_latency=settings.IMPROVE_EXPECTED_LATENCY,
+)
@@ -0,0 +1,83 @@
+"""
+HTTP conditional responses
+
+Strong ETags are derived from cheap per-user version stamps (library and
+history versions, usage counters) that are already loaded with the
+current user, so a matching If-None-Match is answered with
+304 Not Modified before any list query runs or any body is rendered.
+"""
+
+import hashlib
+from typing import Any, Optional
+
+from fastapi import Request, Response
+
+from app.core.compression import ETAG_ENCODINGS
+
+# Bump when the representation of a conditional endpoint changes, so that
+# cached responses from older deployments stop matching
+REPRESENTATION_VERSION = "1"
+
+# Clients may keep the response but must revalidate it on every use; the
+# extension re-fetches on each side panel open and gets a 304 if unchanged.
+# Responses are per user, so shared caches must not store them.
+CACHE_CONTROL = "private, no-cache"
+
+def make_etag(*stamp: Any) -> str:
+    """
+    Build a strong ETag from version stamp parts
+
+    Args:
+        stamp: Values that together identify the representation (user ID,
+            version counters, query parameters, ...)
+
+    Returns:
+        str: Quoted ETag
+    """
+    raw = "|".join(str(part) for part in (REPRESENTATION_VERSION, *stamp))
+    return '"' + hashlib.blake2b(raw.encode(), digest_size=12).hexdigest() + '"'
+
+def _strip_encoding(tag: str) -> str:
+    # CompressionMiddleware suffixes the encoding to compressed representations
+    for encoding in ETAG_ENCODINGS:
+        suffix = f'-{encoding}"'
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)] + '"'
+    return tag
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    Check the request's If-None-Match header against an ETag (weak comparison, per RFC 9110)
+    
+    Tags of compressed representations match the uncompressed tag.
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(_strip_encoding(tag.strip().removeprefix("W/")) == etag for tag in header.split(","))
+
+def check_etag(request: Request, response: Response, *stamp: Any) -> Optional[Response]:
+    """
+    Tag a response and short-circuit it when the client's copy is current
+
+    Sets ETag, Cache-Control and Vary on the endpoint's response. Call it
+    before doing any work for the body.
+
+    Args:
+        request: Incoming request
+        response: Response the endpoint will return (FastAPI's injected Response)
+        stamp: Version stamp parts, see make_etag
+
+    Returns:
+        A 304 response to return immediately, or None to build the full response
+    """
+    etag = make_etag(*stamp)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL, "Vary": "Authorization"}
+
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return None
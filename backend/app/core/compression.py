@@ -0,0 +1,256 @@
+"""
+HTTP compression
+
+ASGI middleware that
+
+- compresses responses with brotli (when the optional brotli package is
+  installed) or gzip, negotiated from Accept-Encoding, for JSON, NDJSON
+  and text bodies of at least COMPRESSION_MIN_SIZE bytes; streaming
+  responses are compressed chunk by chunk;
+- decompresses request bodies sent with Content-Encoding gzip, deflate or
+  br, so large /prompts/improve and /library uploads can be sent
+  compressed. The decompressed size is capped at MAX_REQUEST_BODY_BYTES
+  and bodies are inflated in steps that never exceed the cap, so a small
+  compressed body cannot expand in memory first. br request bodies need
+  brotli 1.2 or later (bounded output); with older versions they get 415.
+
+Compressed responses are a different representation, so their strong
+ETag gets an encoding suffix ("<tag>-gzip"); app.core.caching ignores
+the suffix when matching If-None-Match.
+"""
+
+import zlib
+from typing import Callable, Optional, Tuple
+
+from fastapi import HTTPException
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+# Encodings suffixed to strong ETags of compressed responses
+ETAG_ENCODINGS = ("gzip", "br")
+
+def load_brotli():
+    """
+    The brotli module, or None when the optional dependency is not installed
+    """
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+def bounded_brotli(brotli) -> bool:
+    """
+    Whether the brotli module can limit the output of one decompression step
+    """
+    return brotli is not None and hasattr(brotli.Decompressor, "can_accept_more_data")
+
+class _GzipEncoder:
+    name = "gzip"
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        chunk = self._compressor.compress(data)
+        return chunk + (self._compressor.flush() if final else self._compressor.flush(zlib.Z_SYNC_FLUSH))
+
+class _BrotliEncoder:
+    name = "br"
+
+    def __init__(self, brotli, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        chunk = self._compressor.process(data)
+        return chunk + (self._compressor.finish() if final else self._compressor.flush())
+
+class _BodyDecoder:
+    """
+    Incremental request body decoder with an output size cap
+    """
+    def __init__(self, encoding: str, brotli, limit: int):
+        self.limit = limit
+        self.size = 0
+        if encoding == "br":
+            self._brotli = brotli.Decompressor()
+            self._zlib = None
+        else:
+            # gzip framing, or zlib framing for deflate
+            self._zlib = zlib.decompressobj(31 if encoding == "gzip" else 15)
+            self._brotli = None
+
+    def decode(self, data: bytes, final: bool) -> bytes:
+        try:
+            if self._zlib is not None:
+                # Never inflate more than the remaining budget in one step
+                output = self._zlib.decompress(data, self.limit - self.size + 1)
+                if self._zlib.unconsumed_tail:
+                    raise HTTPException(status_code=413, detail="Decompressed request body too large")
+                if final:
+                    output += self._zlib.flush()
+            else:
+                output = self._inflate_brotli(data)
+        except zlib.error:
+            raise HTTPException(status_code=400, detail="Invalid compressed request body")
+        except HTTPException:
+            raise
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid compressed request body")
+
+        self.size += len(output)
+        if self.size > self.limit:
+            raise HTTPException(status_code=413, detail="Decompressed request body too large")
+        return output
+
+    def _inflate_brotli(self, data: bytes) -> bytes:
+        # Like the zlib path, never inflate more than the remaining budget in
+        # one step; the decoder keeps the rest until asked with empty input
+        output = b""
+        while True:
+            budget = self.limit - self.size - len(output) + 1
+            output += self._brotli.process(data, output_buffer_limit=budget)
+            data = b""
+            if self.size + len(output) > self.limit:
+                raise HTTPException(status_code=413, detail="Decompressed request body too large")
+            if self._brotli.can_accept_more_data():
+                return output
+
+class CompressionMiddleware:
+    """
+    Response compression and request decompression
+    """
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        max_request_body: int = 64 * 1024 * 1024
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.max_request_body = max_request_body
+        self.brotli = load_brotli()
+        self.brotli_requests = bounded_brotli(self.brotli)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+
+        content_encoding = headers.get("content-encoding", "identity").strip().lower()
+        if content_encoding != "identity":
+            if content_encoding not in ("gzip", "deflate") and not (content_encoding == "br" and self.brotli_requests):
+                response = PlainTextResponse(f"Unsupported Content-Encoding: {content_encoding}", status_code=415)
+                await response(scope, receive, send)
+                return
+            scope, receive = self._decompress_request(scope, receive, content_encoding)
+
+        encoder_factory = self._negotiate(headers.get("accept-encoding", ""))
+        if encoder_factory is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressingResponder(send, encoder_factory, self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+    def _decompress_request(self, scope: Scope, receive: Receive, encoding: str) -> Tuple[Scope, Receive]:
+        decoder = _BodyDecoder(encoding, self.brotli, self.max_request_body)
+
+        async def decompressing_receive() -> Message:
+            message = await receive()
+            if message["type"] == "http.request":
+                final = not message.get("more_body", False)
+                message = dict(message, body=decoder.decode(message.get("body", b""), final))
+            return message
+
+        # The decoded body has a different length and no encoding
+        scope = dict(scope)
+        scope["headers"] = [
+            (name, value) for name, value in scope["headers"]
+            if name not in (b"content-encoding", b"content-length")
+        ]
+        return scope, decompressing_receive
+
+    def _negotiate(self, accept_encoding: str) -> Optional[Callable[[], object]]:
+        accepted = set()
+        for part in accept_encoding.lower().split(","):
+            coding, _, params = part.strip().partition(";")
+            if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+                continue
+            accepted.add(coding.strip())
+
+        if self.brotli is not None and "br" in accepted:
+            return lambda: _BrotliEncoder(self.brotli, self.brotli_quality)
+        if "gzip" in accepted:
+            return lambda: _GzipEncoder(self.gzip_level)
+        return None
+
+class _CompressingResponder:
+    """
+    Wraps the ASGI send callable of one response
+    """
+    def __init__(self, send: Send, encoder_factory: Callable[[], object], minimum_size: int):
+        self._send = send
+        self._encoder_factory = encoder_factory
+        self._minimum_size = minimum_size
+        self._start: Optional[Message] = None
+        self._encoder = None
+        self._passthrough = False
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            # Hold the headers back until the first body chunk decides the encoding
+            self._start = message
+            return
+
+        if message["type"] != "http.response.body" or self._passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self._start is not None:
+            start, self._start = self._start, None
+            headers = MutableHeaders(raw=list(start["headers"]))
+            compressible = (
+                start["status"] not in (204, 304)
+                and "content-encoding" not in headers
+                and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+                and (more_body or len(body) >= self._minimum_size)
+            )
+            if not compressible:
+                self._passthrough = True
+                await self._send(start)
+                await self._send(message)
+                return
+
+            self._encoder = self._encoder_factory()
+            chunk = self._encoder.compress(body, final=not more_body)
+
+            headers["Content-Encoding"] = self._encoder.name
+            headers.add_vary_header("Accept-Encoding")
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/") and etag.endswith('"'):
+                headers["ETag"] = f'{etag[:-1]}-{self._encoder.name}"'
+            if more_body:
+                if "content-length" in headers:
+                    del headers["content-length"]
+            else:
+                headers["Content-Length"] = str(len(chunk))
+
+            await self._send(dict(start, headers=headers.raw))
+            await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+            return
+
+        chunk = self._encoder.compress(body, final=not more_body)
+        await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
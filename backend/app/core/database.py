@@ -1,20 +1,282 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+import time
+import asyncio
+import logging
+from uuid import uuid4
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Request
+from jose import jwt, JWTError
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession, AsyncEngine
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import NullPool, QueuePool
 from app.core.config import settings
+from app.core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Pool metrics
+POOL_CHECKOUT_WAIT = registry.histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled database connection"
+)
+POOL_CHECKOUT_TIMEOUTS = registry.counter(
+    "db_pool_checkout_timeouts",
+    "Number of requests that timed out waiting for a pooled connection"
+)
+REPLICA_READS = registry.counter(
+    "db_replica_reads",
+    "Read-only requests served by a read replica"
+)
+PRIMARY_READS = registry.counter(
+    "db_primary_reads",
+    "Read-only requests kept on the primary (recent write or no fresh replica)"
+)
+
+# HTTP methods whose request scope never writes
+READ_ONLY_METHODS = ("GET", "HEAD")
+
+# Replication lag in seconds. A server that is not in recovery (e.g. a proxy
+# stand-in in front of the primary) reports no lag, and a replica that has
+# replayed everything it received is not lagging even if the primary is idle.
+REPLICA_LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+def pool_limits() -> Tuple[int, int]:
+    """
+    Compute (pool_size, max_overflow) for this instance
+
+    When DB_MAX_CONNECTIONS and MAX_INSTANCES are both set, the configured
+    sizes are capped so that every Cloud Run instance at full overflow still
+    fits within the Postgres connection budget.
+    """
+    pool_size = settings.DB_POOL_SIZE
+    max_overflow = settings.DB_MAX_OVERFLOW
+
+    if settings.DB_MAX_CONNECTIONS > 0 and settings.MAX_INSTANCES > 0:
+        per_instance = max(1, settings.DB_MAX_CONNECTIONS // settings.MAX_INSTANCES)
+        pool_size = min(pool_size, per_instance)
+        max_overflow = max(0, min(max_overflow, per_instance - pool_size))
+
+    return pool_size, max_overflow
+
+def create_db_engine(url: str) -> AsyncEngine:
+    """
+    Create an async engine with the configured pooling strategy
+
+    Args:
+        url: Async database URL
+
+    Returns:
+        AsyncEngine: Configured engine
+    """
+    if settings.DB_PGBOUNCER_MODE:
+        # PgBouncer in transaction mode owns the pooling; prepared statements
+        # cannot be cached on server connections that are shared between clients
+        return create_async_engine(
+            url,
+            poolclass=NullPool,
+            connect_args={
+                "statement_cache_size": 0,
+                "prepared_statement_cache_size": 0,
+                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+            },
+        )
+
+    pool_size, max_overflow = pool_limits()
+    logger.info(f"Database pool: size={pool_size}, max_overflow={max_overflow}")
+
+    return create_async_engine(
+        url,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+
+def register_pool_metrics(engine: AsyncEngine, prefix: str = "db_pool") -> None:
+    """
+    Publish pool utilization gauges for an engine
+
+    Args:
+        engine: Engine whose pool should be observed
+        prefix: Metric name prefix
+    """
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return
 
-# Create SQLAlchemy engine
-engine = create_engine(settings.DATABASE_URL)
+    capacity = pool.size() + pool_limits()[1]
+    registry.gauge(f"{prefix}_size", "Configured number of persistent connections", pool.size)
+    registry.gauge(f"{prefix}_capacity", "Maximum connections including overflow", lambda: capacity)
+    registry.gauge(f"{prefix}_checked_out", "Connections currently checked out", pool.checkedout)
+    registry.gauge(f"{prefix}_idle", "Idle connections in the pool", pool.checkedin)
+    registry.gauge(f"{prefix}_overflow", "Overflow connections currently open", lambda: max(0, pool.overflow()))
+    registry.gauge(
+        f"{prefix}_utilization",
+        "Checked out connections as a fraction of capacity",
+        lambda: pool.checkedout() / capacity if capacity else 0.0
+    )
 
-# Create SessionLocal class
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Create SQLAlchemy engine (asyncpg)
+engine = create_db_engine(settings.ASYNC_DATABASE_URL)
+register_pool_metrics(engine)
+
+class Replica:
+    """
+    A read replica engine with a cached replication lag
+    """
+    def __init__(self, url: str):
+        self.engine = create_db_engine(url)
+        # Unknown until the first check; an unchecked replica is not used
+        self.lag = float("inf")
+        self.checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def current_lag(self) -> float:
+        """
+        Replication lag in seconds, re-measured at most every DB_REPLICA_LAG_CHECK_INTERVAL
+        
+        While another request is measuring, the previous value is returned.
+        An unreachable replica reports infinite lag.
+        """
+        if self._lock.locked() or time.monotonic() - self.checked_at < settings.DB_REPLICA_LAG_CHECK_INTERVAL:
+            return self.lag
+
+        async with self._lock:
+            try:
+                async with self.engine.connect() as connection:
+                    lag = await connection.scalar(REPLICA_LAG_SQL)
+                self.lag = float(lag or 0)
+            except Exception as e:
+                logger.warning(f"Replica lag check failed: {str(e)}")
+                self.lag = float("inf")
+            self.checked_at = time.monotonic()
+        return self.lag
+
+class ReplicaRouter:
+    """
+    Routes read-only request scopes to read replicas
+    
+    Replicas are used round-robin while their lag is within DB_REPLICA_MAX_LAG.
+    A user's reads stay on the primary for DB_READ_YOUR_WRITES_WINDOW seconds
+    after one of their own write requests on this instance, so they always see
+    what they just wrote.
+    """
+    # Prune the recent-writes map once it grows beyond this many users
+    MAX_TRACKED_WRITERS = 10000
+
+    def __init__(self, urls: List[str]):
+        self.replicas = [Replica(url) for url in urls]
+        self._next = 0
+        self._recent_writes: Dict[str, float] = {}
+
+    def record_write(self, user_key: Optional[str]) -> None:
+        """
+        Start (or extend) the read-your-writes window of a user
+        """
+        if not user_key:
+            return
+
+        now = time.monotonic()
+        self._recent_writes[user_key] = now
+        if len(self._recent_writes) > self.MAX_TRACKED_WRITERS:
+            cutoff = now - settings.DB_READ_YOUR_WRITES_WINDOW
+            self._recent_writes = {
+                key: written_at for key, written_at in self._recent_writes.items() if written_at >= cutoff
+            }
+
+    def wrote_recently(self, user_key: Optional[str]) -> bool:
+        """
+        Check whether a user is inside their read-your-writes window
+        """
+        written_at = self._recent_writes.get(user_key) if user_key else None
+        return written_at is not None and time.monotonic() - written_at < settings.DB_READ_YOUR_WRITES_WINDOW
+
+    async def pick(self) -> Optional[AsyncEngine]:
+        """
+        Next replica engine whose lag is within bounds, or None to use the primary
+        """
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[self._next % len(self.replicas)]
+            self._next += 1
+            if await replica.current_lag() <= settings.DB_REPLICA_MAX_LAG:
+                return replica.engine
+        return None
+
+    async def dispose(self) -> None:
+        """
+        Release the pooled connections of all replicas
+        """
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+replica_router = ReplicaRouter(settings.ASYNC_DATABASE_REPLICA_URLS)
+for index, replica in enumerate(replica_router.replicas):
+    register_pool_metrics(replica.engine, prefix=f"db_replica{index}_pool")
+
+def request_user_key(request: Request) -> Optional[str]:
+    """
+    Subject of the request's bearer token, used only to route reads
+    
+    The signature is not checked here; authentication still happens in
+    get_current_user, and a forged token can at most pin reads to the primary.
+    """
+    authorization = request.headers.get("Authorization", "")
+    if not authorization.lower().startswith("bearer "):
+        return None
+    try:
+        return jwt.get_unverified_claims(authorization[7:]).get("sub")
+    except JWTError:
+        return None
+
+# Create AsyncSessionLocal class
+# expire_on_commit is disabled so that loaded objects stay usable after commit
+# without triggering implicit (blocking) lazy loads
+AsyncSessionLocal = async_sessionmaker(
+    bind=engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
 
 # Create Base class
 Base = declarative_base()
 
 # Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Read-only requests (GET/HEAD) are routed to a replica when one is fresh
+# enough and the user has not written recently; everything else uses the primary
+async def get_db(request: Request):
+    read_only = request.method in READ_ONLY_METHODS
+    user_key = request_user_key(request)
+    
+    bind = None
+    if read_only and replica_router.replicas:
+        if not replica_router.wrote_recently(user_key):
+            bind = await replica_router.pick()
+        (REPLICA_READS if bind is not None else PRIMARY_READS).inc()
+    elif not read_only:
+        replica_router.record_write(user_key)
+    
+    async with AsyncSessionLocal(**({"bind": bind} if bind is not None else {})) as db:
+        # Check out the connection up front so pool wait time is measured
+        started = time.perf_counter()
+        try:
+            await db.connection()
+        except PoolTimeoutError:
+            POOL_CHECKOUT_TIMEOUTS.inc()
+            raise
+        POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started)
+        try:
+            yield db
+        finally:
+            if not read_only:
+                # The window counts from the end of the write, not its start
+                replica_router.record_write(user_key)
@@ -0,0 +1,49 @@
+"""
+Shared HTTP clients
+
+Outbound calls to Anthropic and Google reuse long-lived clients so that
+connections and TLS sessions survive across requests (and can be primed
+by the warm-up hook). The client libraries are imported on first use.
+"""
+
+import threading
+
+_async_client = None
+_requests_session = None
+_lock = threading.Lock()
+
+def get_async_http_client():
+    """
+    Shared httpx.AsyncClient used by the Anthropic SDK
+    """
+    global _async_client
+    if _async_client is None:
+        import httpx
+        _async_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(600.0, connect=10.0),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        )
+    return _async_client
+
+def get_requests_session():
+    """
+    Shared requests.Session used for Google token verification
+    """
+    global _requests_session
+    with _lock:
+        if _requests_session is None:
+            import requests
+            _requests_session = requests.Session()
+    return _requests_session
+
+async def close_http_clients() -> None:
+    """
+    Close the shared clients on shutdown
+    """
+    global _async_client, _requests_session
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+    if _requests_session is not None:
+        _requests_session.close()
+        _requests_session = None
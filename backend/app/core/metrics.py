@@ -0,0 +1,161 @@
+"""
+Metrics
+
+Minimal in-process metrics registry (counters, gauges and histograms)
+rendered in the Prometheus text exposition format on /metrics.
+"""
+
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Default histogram buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Metric:
+    """
+    Base class for all metrics
+    """
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+
+    def samples(self) -> List[Tuple[str, float]]:
+        """
+        Return (sample_name, value) pairs for exposition
+        """
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        for sample_name, value in self.samples():
+            lines.append(f"{sample_name} {value}")
+        return "\n".join(lines)
+
+class Counter(Metric):
+    """
+    Monotonically increasing counter
+    """
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def samples(self) -> List[Tuple[str, float]]:
+        return [(f"{self.name}_total", self._value)]
+
+class Gauge(Metric):
+    """
+    Gauge that is either set explicitly or computed by a callback at scrape time
+    """
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation)
+        self._value = 0.0
+        self._callback = callback
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self._value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value -= amount
+
+    def set_function(self, callback: Callable[[], float]) -> None:
+        self._callback = callback
+
+    @property
+    def value(self) -> float:
+        if self._callback is not None:
+            return float(self._callback())
+        return self._value
+
+    def samples(self) -> List[Tuple[str, float]]:
+        return [(self.name, self.value)]
+
+class Histogram(Metric):
+    """
+    Cumulative histogram with fixed buckets
+    """
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * len(self.buckets)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self._sum += value
+            self._count += 1
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self._counts[index] += 1
+                    break
+
+    def samples(self) -> List[Tuple[str, float]]:
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self._counts):
+            cumulative += count
+            samples.append((f'{self.name}_bucket{{le="{bound}"}}', cumulative))
+        samples.append((f'{self.name}_bucket{{le="+Inf"}}', self._count))
+        samples.append((f"{self.name}_sum", self._sum))
+        samples.append((f"{self.name}_count", self._count))
+        return samples
+
+class Registry:
+    """
+    Collection of named metrics
+    """
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self._register(Counter(name, documentation))
+
+    def gauge(self, name: str, documentation: str, callback: Optional[Callable[[], float]] = None) -> Gauge:
+        return self._register(Gauge(name, documentation, callback))
+
+    def histogram(self, name: str, documentation: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, buckets))
+
+    def render(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format
+        """
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+# Create a singleton registry
+registry = Registry()
@@ -0,0 +1,94 @@
+"""
+Keyset pagination helpers
+
+Listings are ordered by (created_at DESC, id DESC) and paginated with an
+opaque cursor holding the (created_at, id) of the last row returned, so
+deep pages cost the same as the first one.
+"""
+
+import base64
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.sql import Select
+
+def encode_cursor(created_at: datetime, item_id: int) -> str:
+    """
+    Encode a (created_at, id) position into an opaque cursor
+
+    Args:
+        created_at: Creation timestamp of the last row returned
+        item_id: ID of the last row returned
+
+    Returns:
+        str: URL-safe cursor
+    """
+    raw = f"{created_at.isoformat()}|{item_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Decode a cursor produced by encode_cursor
+
+    Args:
+        cursor: Opaque cursor
+
+    Returns:
+        Tuple of (created_at, id)
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, item_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(item_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def apply_keyset(query: Select, created_at_column, id_column, cursor: Optional[str], limit: int) -> Select:
+    """
+    Order a query newest-first and restrict it to rows after the cursor
+
+    One extra row is requested so that paginate() can tell whether
+    another page exists.
+
+    Args:
+        query: Base select statement
+        created_at_column: Creation timestamp column
+        id_column: Primary key column
+        cursor: Cursor returned with the previous page, if any
+        limit: Page size
+
+    Returns:
+        Select: Paginated select statement
+    """
+    if cursor:
+        created_at, item_id = decode_cursor(cursor)
+        # The plain created_at bound is implied by the row comparison, but
+        # only it lets PostgreSQL prune partitions of time-partitioned tables
+        query = query.filter(
+            created_at_column <= created_at,
+            tuple_(created_at_column, id_column) < tuple_(created_at, item_id)
+        )
+
+    return query.order_by(created_at_column.desc(), id_column.desc()).limit(limit + 1)
+
+def paginate(rows: List[Any], limit: int) -> Tuple[List[Any], Optional[str]]:
+    """
+    Split the over-fetched rows of apply_keyset into a page and the next cursor
+
+    Args:
+        rows: Rows returned by a query built with apply_keyset
+        limit: Page size
+
+    Returns:
+        Tuple of (page_rows, next_cursor); next_cursor is None on the last page
+    """
+    if len(rows) <= limit:
+        return list(rows), None
+
+    page = list(rows[:limit])
+    last = page[-1]
+    return page, encode_cursor(last.created_at, last.id)
@@ -0,0 +1,36 @@
+"""
+Summary projections for list endpoints
+
+List views only show titles, icons, colors and dates, so with
+fields=summary the list queries select just those columns plus a short
+prefix of each long text column instead of the full prompt texts.
+PostgreSQL only de-TOASTs the slice that substr needs. The full texts
+are fetched on demand through the item endpoints.
+"""
+
+from typing import Optional, Tuple
+
+from sqlalchemy import func
+
+# Characters of each long text column included in a summary
+PREVIEW_LENGTH = 200
+
+def preview_column(column, name: str):
+    """
+    Select the first PREVIEW_LENGTH + 1 characters of a text column
+
+    The extra character tells make_preview whether the text was cut.
+    """
+    return func.substr(column, 1, PREVIEW_LENGTH + 1).label(name)
+
+def make_preview(text: Optional[str]) -> Tuple[str, bool]:
+    """
+    Trim a value selected with preview_column
+
+    Returns:
+        Tuple of (preview, truncated)
+    """
+    text = text or ""
+    if len(text) > PREVIEW_LENGTH:
+        return text[:PREVIEW_LENGTH], True
+    return text, False
@@ -0,0 +1,473 @@
+"""
+Rate limiting
+
+Token buckets and in-flight caps for expensive endpoints (every prompt
+improvement is a Claude call). A limited call takes one token from the
+caller's bucket (the user's, or the client IP's for anonymous callers)
+and one from the endpoint's global bucket, and holds one of the caller's
+in-flight slots until it finishes. Rejected calls get 429 Too Many
+Requests with Retry-After and are not charged, and neither are calls the
+endpoint itself rejects with 403 or 503 (REFUNDED_STATUSES). Limited
+responses carry RateLimit-Limit, RateLimit-Remaining and RateLimit-Reset
+for the most constrained bucket.
+
+Bucket and slot state lives in a RateLimitBackend: the in-memory backend
+limits each instance on its own, the database backend shares the state
+of all instances through two UNLOGGED tables. Both implement the same
+interface, so the in-memory backend stands in for the shared one in
+tests and local runs. Backend failures are logged and let the call
+through rather than failing it.
+"""
+
+import math
+import time
+import logging
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional, Tuple
+from uuid import UUID, uuid4
+
+from fastapi import HTTPException, Request, Response, status
+from sqlalchemy import delete, extract, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.core.config import settings
+from app.core.database import engine
+from app.core.metrics import registry
+from app.models.models import RateLimitBucket, RateLimitLease
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMITED = registry.counter(
+    "rate_limit_rejections",
+    "Requests rejected because a token bucket was empty"
+)
+IN_FLIGHT_LIMITED = registry.counter(
+    "rate_limit_in_flight_rejections",
+    "Requests rejected because the caller had too many requests in flight"
+)
+BACKEND_ERRORS = registry.counter(
+    "rate_limit_backend_errors",
+    "Rate limit checks skipped because the backend failed"
+)
+
+# Retry-After of calls rejected for having too many requests in flight
+IN_FLIGHT_RETRY_AFTER = 1
+
+# Statuses of calls rejected after admission (usage limit reached, load
+# shed) that are not charged either
+REFUNDED_STATUSES = (status.HTTP_403_FORBIDDEN, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+class Bucket(NamedTuple):
+    """
+    Token bucket holding up to capacity tokens, refilled at rate tokens per second
+    """
+    capacity: float
+    rate: float
+
+    @classmethod
+    def per_minute(cls, per_minute: float, burst: int) -> Optional["Bucket"]:
+        """
+        Bucket allowing per_minute calls on average and bursts of burst calls;
+        None (no limit) when per_minute is 0
+        """
+        if per_minute <= 0:
+            return None
+        return cls(float(max(burst, 1)), per_minute / 60.0)
+
+    def seconds_until(self, tokens: float, wanted: float) -> float:
+        """
+        Seconds until a bucket holding tokens holds wanted tokens
+        """
+        return max(wanted - tokens, 0.0) / self.rate
+
+class BucketState(NamedTuple):
+    """
+    Outcome of taking tokens from a bucket
+    """
+    allowed: bool
+    remaining: float  # Tokens left after the call (before it, when rejected)
+
+class RateLimitPolicy(NamedTuple):
+    """
+    Limits of one endpoint; buckets set to None do not apply
+    """
+    scope: str
+    user: Optional[Bucket]
+    anonymous: Optional[Bucket]  # Per client IP
+    total: Optional[Bucket]  # Shared by all callers
+    max_in_flight: int  # Per caller, 0 for no cap
+
+class RateLimitBackend(ABC):
+    """
+    Storage of bucket levels and in-flight slots
+    """
+
+    @abstractmethod
+    async def take(self, key: str, bucket: Bucket, cost: float = 1.0) -> BucketState:
+        """
+        Take cost tokens from a bucket if it holds enough (a new bucket starts full)
+        """
+
+    @abstractmethod
+    async def refund(self, key: str, bucket: Bucket, cost: float = 1.0) -> None:
+        """
+        Give back cost tokens taken from a bucket by a call that was rejected later
+        """
+
+    @abstractmethod
+    async def acquire(self, key: str, limit: int, ttl: float) -> Optional[str]:
+        """
+        Take one of limit slots; the slot is freed by release, or after ttl seconds
+
+        Returns:
+            Lease identifier to pass to release, or None when all slots are taken
+        """
+
+    @abstractmethod
+    async def release(self, key: str, lease: str) -> None:
+        """
+        Free a slot taken by acquire
+        """
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """
+    Per-instance backend; state is lost on restart and not shared between instances
+
+    In-flight slots expire after their ttl like those of the database
+    backend, so a slot whose release never ran does not stay taken.
+    """
+    # Forget full buckets once more than this many keys are tracked
+    MAX_TRACKED_KEYS = 100000
+
+    def __init__(self):
+        # key -> (tokens, updated_at, full_at), in time.monotonic() seconds
+        self._buckets: Dict[str, Tuple[float, float, float]] = {}
+        # key -> {lease: expires_at}
+        self._leases: Dict[str, Dict[str, float]] = {}
+
+    def _refilled(self, key: str, bucket: Bucket, now: float) -> float:
+        state = self._buckets.get(key)
+        if state is None:
+            return bucket.capacity
+        return min(bucket.capacity, state[0] + (now - state[1]) * bucket.rate)
+
+    def _store(self, key: str, bucket: Bucket, tokens: float, now: float) -> None:
+        self._buckets[key] = (tokens, now, now + bucket.seconds_until(tokens, bucket.capacity))
+
+    async def take(self, key: str, bucket: Bucket, cost: float = 1.0) -> BucketState:
+        now = time.monotonic()
+        tokens = self._refilled(key, bucket, now)
+
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self._store(key, bucket, tokens, now)
+
+        if len(self._buckets) > self.MAX_TRACKED_KEYS:
+            # A full bucket behaves like a missing one
+            self._buckets = {
+                bucket_key: value for bucket_key, value in self._buckets.items() if value[2] > now
+            }
+        return BucketState(allowed, tokens)
+
+    async def refund(self, key: str, bucket: Bucket, cost: float = 1.0) -> None:
+        now = time.monotonic()
+        self._store(key, bucket, min(bucket.capacity, self._refilled(key, bucket, now) + cost), now)
+
+    async def acquire(self, key: str, limit: int, ttl: float) -> Optional[str]:
+        now = time.monotonic()
+        leases = {
+            lease: expires_at for lease, expires_at in self._leases.get(key, {}).items() if expires_at > now
+        }
+        if len(leases) >= limit:
+            self._leases[key] = leases
+            return None
+        lease = uuid4().hex
+        leases[lease] = now + ttl
+        self._leases[key] = leases
+        return lease
+
+    async def release(self, key: str, lease: str) -> None:
+        leases = self._leases.get(key, {})
+        leases.pop(lease, None)
+        if not leases:
+            self._leases.pop(key, None)
+
+class DatabaseRateLimitBackend(RateLimitBackend):
+    """
+    Backend shared by all instances, on the primary database
+
+    A bucket is one row of rate_limit_buckets refilled and debited by a
+    single upsert; rejected calls read the level back. In-flight slots are
+    rows of rate_limit_leases with an expiry, so slots of a crashed
+    instance free themselves.
+    """
+    # Seconds between deletions of full buckets and expired leases (per instance)
+    PRUNE_INTERVAL = 300.0
+
+    def __init__(self):
+        self._pruned_at = time.monotonic()
+
+    @staticmethod
+    def _refilled(bucket: Bucket):
+        table = RateLimitBucket.__table__
+        return func.least(
+            bucket.capacity,
+            table.c.tokens + extract("epoch", func.now() - table.c.updated_at) * bucket.rate
+        )
+
+    @staticmethod
+    def _full_at(bucket: Bucket, tokens):
+        return func.now() + func.make_interval(0, 0, 0, 0, 0, 0, (bucket.capacity - tokens) / bucket.rate)
+
+    async def take(self, key: str, bucket: Bucket, cost: float = 1.0) -> BucketState:
+        table = RateLimitBucket.__table__
+        refilled = self._refilled(bucket)
+
+        statement = pg_insert(table).values(
+            key=key,
+            tokens=bucket.capacity - cost,
+            updated_at=func.now(),
+            full_at=self._full_at(bucket, bucket.capacity - cost)
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.key],
+            set_={
+                "tokens": refilled - cost,
+                "updated_at": func.now(),
+                "full_at": self._full_at(bucket, refilled - cost),
+            },
+            where=refilled >= cost
+        ).returning(table.c.tokens)
+
+        async with engine.begin() as connection:
+            # The upsert only returns a row when the bucket was debited
+            tokens = await connection.scalar(statement)
+            allowed = tokens is not None
+            if not allowed:
+                tokens = await connection.scalar(select(refilled).where(table.c.key == key))
+        await self._prune()
+        return BucketState(allowed, tokens or 0.0)
+
+    async def refund(self, key: str, bucket: Bucket, cost: float = 1.0) -> None:
+        table = RateLimitBucket.__table__
+        tokens = func.least(bucket.capacity, self._refilled(bucket) + cost)
+        async with engine.begin() as connection:
+            await connection.execute(
+                table.update()
+                .where(table.c.key == key)
+                .values(tokens=tokens, updated_at=func.now(), full_at=self._full_at(bucket, tokens))
+            )
+
+    async def acquire(self, key: str, limit: int, ttl: float) -> Optional[str]:
+        table = RateLimitLease.__table__
+        lease = uuid4()
+        async with engine.begin() as connection:
+            # Serialize the count and insert of one key's slots
+            await connection.execute(select(func.pg_advisory_xact_lock(func.hashtext(key))))
+            taken = await connection.scalar(
+                select(func.count())
+                .where(table.c.key == key, table.c.expires_at > func.now())
+            )
+            if taken >= limit:
+                return None
+            await connection.execute(
+                table.insert().values(
+                    id=lease,
+                    key=key,
+                    expires_at=func.now() + func.make_interval(0, 0, 0, 0, 0, 0, ttl)
+                )
+            )
+        return str(lease)
+
+    async def release(self, key: str, lease: str) -> None:
+        async with engine.begin() as connection:
+            await connection.execute(delete(RateLimitLease).where(RateLimitLease.id == UUID(lease)))
+
+    async def _prune(self) -> None:
+        now = time.monotonic()
+        if now - self._pruned_at < self.PRUNE_INTERVAL:
+            return
+        self._pruned_at = now
+        async with engine.begin() as connection:
+            await connection.execute(delete(RateLimitBucket).where(RateLimitBucket.full_at < func.now()))
+            await connection.execute(delete(RateLimitLease).where(RateLimitLease.expires_at < func.now()))
+
+def create_backend(name: str) -> RateLimitBackend:
+    """
+    Backend selected by RATE_LIMIT_BACKEND ("memory" or "database")
+    """
+    if name == "database":
+        return DatabaseRateLimitBackend()
+    if name != "memory":
+        logger.warning(f"Unknown RATE_LIMIT_BACKEND {name!r}, using the in-memory backend")
+    return MemoryRateLimitBackend()
+
+def client_ip(request: Request) -> str:
+    """
+    Address of the client, taken from X-Forwarded-For behind trusted proxies
+
+    With RATE_LIMIT_TRUSTED_PROXY_HOPS set to n, the n-th address from the
+    end of X-Forwarded-For is used: each trusted proxy appends the address
+    it received the request from, and anything before that came from the
+    client and cannot be trusted.
+    """
+    hops = settings.RATE_LIMIT_TRUSTED_PROXY_HOPS
+    if hops > 0:
+        forwarded = [
+            address.strip() for address in request.headers.get("x-forwarded-for", "").split(",") if address.strip()
+        ]
+        if forwarded:
+            return forwarded[-min(hops, len(forwarded))]
+    return request.client.host if request.client else "unknown"
+
+def improve_policy() -> RateLimitPolicy:
+    """
+    Limits of prompt improvement
+    """
+    return RateLimitPolicy(
+        scope="improve",
+        user=Bucket.per_minute(settings.IMPROVE_RATE_USER_PER_MINUTE, settings.IMPROVE_RATE_USER_BURST),
+        anonymous=Bucket.per_minute(settings.IMPROVE_RATE_ANONYMOUS_PER_MINUTE, settings.IMPROVE_RATE_ANONYMOUS_BURST),
+        total=Bucket.per_minute(settings.IMPROVE_RATE_GLOBAL_PER_MINUTE, settings.IMPROVE_RATE_GLOBAL_BURST),
+        max_in_flight=settings.IMPROVE_MAX_IN_FLIGHT,
+    )
+
+class RateLimiter:
+    """
+    Applies rate limit policies to requests
+    """
+
+    def __init__(self, backend: RateLimitBackend):
+        self.backend = backend
+
+    @staticmethod
+    def _headers(limits: List[Tuple[Bucket, BucketState]]) -> Dict[str, str]:
+        # Report the bucket closest to rejecting calls
+        bucket, state = min(limits, key=lambda limit: limit[1].remaining)
+        return {
+            "RateLimit-Limit": str(int(bucket.capacity)),
+            "RateLimit-Remaining": str(int(state.remaining)),
+            "RateLimit-Reset": str(math.ceil(bucket.seconds_until(state.remaining, bucket.capacity))),
+        }
+
+    async def _take(self, key: str, bucket: Bucket) -> Optional[BucketState]:
+        try:
+            return await self.backend.take(key, bucket)
+        except Exception as e:
+            BACKEND_ERRORS.inc()
+            logger.warning(f"Rate limit check of {key} failed, allowing the request: {str(e)}")
+            return None
+
+    async def _refund(self, taken: List[Tuple[str, Bucket, BucketState]]) -> List[Tuple[Bucket, BucketState]]:
+        """
+        Give back the tokens a rejected call took
+
+        Returns:
+            The buckets with their levels after the refund
+        """
+        refunded = []
+        for key, bucket, state in taken:
+            try:
+                await self.backend.refund(key, bucket)
+            except Exception as e:
+                BACKEND_ERRORS.inc()
+                logger.warning(f"Rate limit refund of {key} failed: {str(e)}")
+            refunded.append((bucket, state._replace(remaining=min(bucket.capacity, state.remaining + 1.0))))
+        return refunded
+
+    @asynccontextmanager
+    async def limit(
+        self,
+        policy: RateLimitPolicy,
+        request: Request,
+        response: Response,
+        user_id: Optional[int] = None
+    ) -> AsyncIterator[None]:
+        """
+        Admit a call under a policy and hold an in-flight slot while it runs
+
+        Rejected calls are not charged: tokens already taken from the
+        buckets checked before the rejecting one are given back, as are
+        the tokens of calls that raise an HTTPException with one of
+        REFUNDED_STATUSES while holding the slot.
+
+        Args:
+            policy: Limits of the endpoint
+            request: Incoming request (for the client IP of anonymous callers)
+            response: Response the endpoint will return; gets the RateLimit headers
+            user_id: Authenticated user, or None for anonymous callers
+
+        Raises:
+            HTTPException: 429 with Retry-After when a bucket is empty or
+                the caller has max_in_flight calls running
+        """
+        if not settings.RATE_LIMIT_ENABLED:
+            yield
+            return
+
+        caller = f"user:{user_id}" if user_id is not None else f"ip:{client_ip(request)}"
+        checks = [
+            (f"{policy.scope}:{caller}", policy.user if user_id is not None else policy.anonymous),
+            # Charged after the caller's bucket, so callers over their own
+            # limit do not drain everyone else's
+            (f"{policy.scope}:global", policy.total),
+        ]
+
+        taken: List[Tuple[str, Bucket, BucketState]] = []
+        for key, bucket in checks:
+            if bucket is None:
+                continue
+            state = await self._take(key, bucket)
+            if state is None:
+                continue
+            if not state.allowed:
+                RATE_LIMITED.inc()
+                headers = self._headers(await self._refund(taken) + [(bucket, state)])
+                headers["Retry-After"] = str(max(1, math.ceil(bucket.seconds_until(state.remaining, 1.0))))
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too many requests. Please slow down and try again later.",
+                    headers=headers
+                )
+            taken.append((key, bucket, state))
+        headers = self._headers([(bucket, state) for _, bucket, state in taken]) if taken else {}
+
+        slot_key = f"{policy.scope}:in_flight:{caller}"
+        lease = None
+        if policy.max_in_flight > 0:
+            try:
+                lease = await self.backend.acquire(slot_key, policy.max_in_flight, settings.RATE_LIMIT_LEASE_SECONDS)
+                if lease is None:
+                    IN_FLIGHT_LIMITED.inc()
+                    refunded = await self._refund(taken)
+                    headers = self._headers(refunded) if refunded else {}
+                    raise HTTPException(
+                        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                        detail="Too many requests in progress. Wait for them to finish and try again.",
+                        headers={**headers, "Retry-After": str(IN_FLIGHT_RETRY_AFTER)}
+                    )
+            except HTTPException:
+                raise
+            except Exception as e:
+                BACKEND_ERRORS.inc()
+                logger.warning(f"In-flight check of {slot_key} failed, allowing the request: {str(e)}")
+
+        response.headers.update(headers)
+        try:
+            yield
+        except HTTPException as e:
+            if e.status_code in REFUNDED_STATUSES:
+                await self._refund(taken)
+            raise
+        finally:
+            if lease is not None:
+                try:
+                    await self.backend.release(slot_key, lease)
+                except Exception as e:
+                    BACKEND_ERRORS.inc()
+                    logger.warning(f"Releasing in-flight slot of {slot_key} failed: {str(e)}")
+
+# Create a singleton instance
+rate_limiter = RateLimiter(create_backend(settings.RATE_LIMIT_BACKEND))
@@ -0,0 +1,68 @@
+"""
+Fast JSON responses
+
+Large list responses (up to 1000 full prompts per page) spend most of
+their time in response_model validation and the stdlib JSON encoder.
+With FAST_JSON_RESPONSES enabled and orjson installed, endpoints can
+return rows that are already in the shape of their schema as a
+FastJSONResponse, which skips the second validation pass and encodes
+with orjson. Rows are only pre-validated if every write path validates
+through the schemas, which is the case for the library and history.
+"""
+
+from functools import lru_cache
+from typing import Any, Optional
+
+from fastapi import Response
+
+from app.core.config import settings
+
+@lru_cache(maxsize=None)
+def get_orjson():
+    """
+    The orjson module when the fast path is enabled and orjson is installed, otherwise None
+    """
+    if not settings.FAST_JSON_RESPONSES:
+        return None
+    try:
+        import orjson
+    except ImportError:
+        return None
+    return orjson
+
+def fast_json_enabled() -> bool:
+    """
+    Whether endpoints should take the fast response path
+    """
+    return get_orjson() is not None
+
+class FastJSONResponse(Response):
+    """
+    JSON response encoded with orjson
+
+    Naive datetimes are rendered without offset and aware UTC datetimes
+    with a Z suffix, like pydantic's JSON mode.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        orjson = get_orjson()
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+
+def fast_json_response(content: Any, response: Optional[Response] = None) -> FastJSONResponse:
+    """
+    Build a FastJSONResponse, keeping the headers set on the endpoint's injected Response
+
+    Args:
+        content: JSON-compatible content in the shape of the endpoint's response_model
+        response: FastAPI's injected Response (ETag, Cache-Control, ...), if any
+
+    Returns:
+        FastJSONResponse: Response to return from the endpoint
+    """
+    fast_response = FastJSONResponse(content)
+    if response is not None:
+        for name, value in response.headers.items():
+            if name not in ("content-length", "content-type"):
+                fast_response.headers.append(name, value)
+    return fast_response
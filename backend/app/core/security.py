@@ -1,15 +1,25 @@
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Any, Optional, Union
 
 from jose import jwt
-from passlib.context import CryptContext
-from google.oauth2 import id_token
-from google.auth.transport import requests
 
 from app.core.config import settings
+from app.core.http_clients import get_requests_session
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Google endpoints used for token verification
+GOOGLE_CERTS_URL = "https://www.googleapis.com/oauth2/v1/certs"
+GOOGLE_USERINFO_URL = "https://www.googleapis.com/oauth2/v1/userinfo"
+
+# passlib and google-auth are imported on first use to keep cold starts fast
+
+@lru_cache(maxsize=1)
+def get_pwd_context():
+    """
+    Password hashing context, created on first use
+    """
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def create_access_token(
     subject: Union[str, Any], expires_delta: Optional[timedelta] = None
@@ -34,13 +44,13 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     Verify password
     """
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     """
     Hash password
     """
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 def verify_google_token(token: str) -> dict:
     """
@@ -48,6 +58,9 @@ def verify_google_token(token: str) -> dict:
     
     This function handles both ID tokens and access tokens from chrome.identity
     """
+    from google.oauth2 import id_token
+    from google.auth.transport import requests
+    
     try:
         print(f"Verifying Google token: {token[:10]}...")
         print(f"GOOGLE_CLIENT_ID: {settings.GOOGLE_CLIENT_ID}")
@@ -56,7 +69,7 @@ def verify_google_token(token: str) -> dict:
         try:
             print("Trying to verify as ID token...")
             idinfo = id_token.verify_oauth2_token(
-                token, requests.Request(), settings.GOOGLE_CLIENT_ID
+                token, requests.Request(session=get_requests_session()), settings.GOOGLE_CLIENT_ID
             )
             print(f"Successfully verified as ID token. User info: {idinfo}")
             return idinfo
@@ -68,13 +81,13 @@ def verify_google_token(token: str) -> dict:
         
         # Try as access token
         print("Trying to verify as access token...")
-        userinfo_url = "https://www.googleapis.com/oauth2/v1/userinfo"
+        userinfo_url = GOOGLE_USERINFO_URL
         headers = {"Authorization": f"Bearer {token}"}
         print(f"Request headers: {headers}")
         
         import requests as http_requests
         try:
-            response = http_requests.get(userinfo_url, headers=headers)
+            response = get_requests_session().get(userinfo_url, headers=headers)
             
             print(f"Access token response status: {response.status_code}")
             print(f"Access token response headers: {response.headers}")
@@ -0,0 +1,12 @@
+"""
+Tag name helpers
+
+Shared by the tags of shared catalog prompts and of library items, which
+compare and store tag names in the same canonical form.
+"""
+
+def normalize_tag(name: str) -> str:
+    """
+    Canonical form of a tag name
+    """
+    return " ".join(name.split()).lower()
@@ -1,17 +1,46 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
 from app.api.router import api_router
+from app.core.compression import CompressionMiddleware
 from app.core.config import settings
-from app.models import models
-from app.core.database import engine
+from app.core.database import engine, replica_router
+from app.core.http_clients import close_http_clients
+from app.core.metrics import registry
+from app.services.stripe_events import stripe_event_service
+from app.services.warmup import warmup_service
 
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema changes are applied by migrations (create_tables.py / alembic),
+    # never at application startup
+    
+    # Warm up in the background; /readyz waits for it to finish
+    warmup_task = None
+    if settings.WARMUP_ON_STARTUP:
+        warmup_task = asyncio.create_task(warmup_service.run())
+    
+    # Apply stored Stripe events that are due for a retry (new events are
+    # applied right after their webhook is acknowledged)
+    stripe_task = None
+    if settings.STRIPE_EVENT_WORKER_ENABLED:
+        stripe_task = asyncio.create_task(stripe_event_service.run())
+    yield
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    if stripe_task is not None:
+        stripe_task.cancel()
+    # Release pooled connections and HTTP clients on shutdown
+    await close_http_clients()
+    await replica_router.dispose()
+    await engine.dispose()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan
 )
 
 # Set up CORS
@@ -21,11 +50,50 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let the extension read validators for conditional requests and rate limits
+    expose_headers=["ETag", "RateLimit-Limit", "RateLimit-Remaining", "RateLimit-Reset", "Retry-After"],
 )
 
+# Compress large responses and accept compressed request bodies; added
+# after CORS so it wraps it and CORS headers are set on compressed responses too
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MIN_SIZE,
+        gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+        brotli_quality=settings.COMPRESSION_BROTLI_QUALITY,
+        max_request_body=settings.MAX_REQUEST_BODY_BYTES,
+    )
+
 # Include API router
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
+@app.get("/healthz", include_in_schema=False)
+def read_liveness():
+    """
+    Liveness probe: the process is up
+    """
+    return {"status": "ok"}
+
+@app.get("/readyz", include_in_schema=False)
+async def read_readiness():
+    """
+    Readiness probe: runs (or waits for) the warm-up and reports per-dependency latency
+    
+    Returns 503 until the database pool, ORM and hot queries are warm, so the
+    load balancer only routes to warm instances.
+    """
+    await warmup_service.run()
+    status_code = 200 if warmup_service.ready else 503
+    return JSONResponse(warmup_service.report(), status_code=status_code)
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def read_metrics():
+    """
+    Expose process metrics in the Prometheus text format
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/", response_class=HTMLResponse)
 def read_root():
     return """
@@ -1,10 +1,39 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Text, DateTime, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy import (
+    BigInteger, Boolean, Column, Computed, Date, FetchedValue, Float, ForeignKey, Index, Integer, LargeBinary, String, Text,
+    DateTime, JSON, UniqueConstraint
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR, UUID
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql import func
 from typing import Optional
 
 from app.core.database import Base
 
+# Text search configuration of the generated search vectors. "simple" does no
+# stemming or stop-word removal, so prompts in any language are searchable.
+SEARCH_CONFIG = "simple"
+
+class PromptText(Base):
+    """
+    Content-addressed prompt text, stored once per distinct text
+
+    Library items and history entries reference their long texts by the
+    SHA-256 of the UTF-8 content. Texts that are no longer referenced are
+    removed by the history retention job.
+    """
+    __tablename__ = "prompt_texts"
+
+    hash = Column(LargeBinary(32), primary_key=True)
+    content = Column(Text, nullable=False)
+    size = Column(Integer, nullable=False)  # UTF-8 length in bytes
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # Computed once per distinct text; the search vectors of library items and
+    # history entries are assembled from it by triggers
+    search_vector = deferred(Column(TSVECTOR, Computed(
+        f"to_tsvector('{SEARCH_CONFIG}', content)",
+        persisted=True
+    )))
+
 class User(Base):
     """
     User model representing application users with authentication and profile information.
@@ -20,6 +49,16 @@ class User(Base):
     photo_url = Column(String, nullable=True)
     is_active = Column(Boolean, default=True)
     payment_status = Column(String, default="unpaid", nullable=False)  # Possible values: "paid", "unpaid"
+    # Stripe customer of the user, set when their checkout completes; used to
+    # resolve subscription events without calling the Stripe API
+    stripe_customer_id = Column(String, unique=True, index=True, nullable=True)
+    # Usage counters maintained in the same transaction as library/history writes
+    prompts_count = Column(Integer, default=0, server_default="0", nullable=False)
+    improvements_count = Column(Integer, default=0, server_default="0", nullable=False)
+    # Change sequence of the user's library; bumped (row-locked) by every library write
+    library_version = Column(BigInteger, default=0, server_default="0", nullable=False)
+    # Bumped whenever the user's history changes (new entry, archival); used for ETags
+    history_version = Column(BigInteger, default=0, server_default="0", nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -40,6 +79,14 @@ class Prompt(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    # Keyset pagination index for per-user listings, the shared feed index
+    # and the change-time index used by incremental catalog refreshes
+    __table_args__ = (
+        Index("ix_prompts_owner_created_id", owner_id, created_at.desc(), id.desc()),
+        Index("ix_prompts_shared_created_id", created_at.desc(), id.desc(), postgresql_where=is_shared),
+        Index("ix_prompts_changed_at", func.coalesce(updated_at, created_at)),
+    )
+
     # Relationships
     owner = relationship("User", back_populates="prompts")
     tags = relationship("PromptTag", back_populates="prompt")
@@ -59,24 +106,76 @@ class PromptTag(Base):
     prompt_id = Column(Integer, ForeignKey("prompts.id"), primary_key=True)
     tag_id = Column(Integer, ForeignKey("tags.id"), primary_key=True)
 
+    # Lookup of the prompts with a tag
+    __table_args__ = (
+        Index("ix_prompt_tags_tag_prompt", tag_id, prompt_id),
+    )
+
     # Relationships
     prompt = relationship("Prompt", back_populates="tags")
     tag = relationship("Tag", back_populates="prompts")
 
 class PromptHistory(Base):
+    """
+    Prompt improvement history, partitioned by month on created_at (PostgreSQL).
+    The partitions are created and expired by the history retention service.
+    """
     __tablename__ = "prompt_history"
 
-    id = Column(Integer, primary_key=True, index=True)
+    # Drawn from prompt_history_id_seq; autoincrement must be explicit in a
+    # composite primary key for inserts to return it
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     title = Column(String(255), nullable=True)  # Название промпта
     description = Column(Text, nullable=True)  # Описание промпта
     original_prompt = Column(Text, nullable=False)
-    improved_prompt = Column(Text, nullable=False)
+    improved_hash = Column(LargeBinary(32), ForeignKey("prompt_texts.hash"), nullable=False)
     url = Column(String, nullable=True)  # URL страницы, где был улучшен промпт
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Partition key; part of the primary key because partitioned tables require it
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), primary_key=True, nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # Опционально, если хотим связать с пользователем
+    # Full-text search vector (original prompt weighted A, improved prompt B)
+    # set by the prompt_history_search_vector trigger; deferred so listings
+    # never load it
+    search_vector = deferred(Column(TSVECTOR, server_default=FetchedValue(), server_onupdate=FetchedValue()))
+
+    # Keyset pagination index for per-user history listings, the search index,
+    # the index used to expire anonymous entries and the index behind the
+    # prompt_texts foreign key
+    __table_args__ = (
+        Index("ix_prompt_history_user_created_id", user_id, created_at.desc(), id.desc()),
+        Index("ix_prompt_history_search_vector", search_vector, postgresql_using="gin"),
+        Index("ix_prompt_history_anonymous_created", created_at, postgresql_where=user_id.is_(None)),
+        Index("ix_prompt_history_improved_hash", improved_hash),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
     # Relationships
     user = relationship("User", backref="prompt_history")
+    # Loaded with the entry in the same query
+    improved_text = relationship("PromptText", lazy="joined", innerjoin=True)
+
+    @property
+    def improved_prompt(self) -> str:
+        return self.improved_text.content
+
+class PromptHistoryArchive(Base):
+    """
+    Compressed history of expired partitions: one row per user and month holding
+    the gzip-compressed NDJSON of that user's entries
+    """
+    __tablename__ = "prompt_history_archive"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    period_start = Column(Date, nullable=False)
+    period_end = Column(Date, nullable=False)
+    entry_count = Column(Integer, nullable=False)
+    payload = Column(LargeBinary, nullable=False)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "period_start", name="uq_prompt_history_archive_user_period"),
+    )
 
 class UserLibrary(Base):
     """
@@ -87,15 +186,132 @@ class UserLibrary(Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
     description = Column(Text, nullable=True)
-    content = Column(Text, nullable=False)  # Содержание промпта
+    content_hash = Column(LargeBinary(32), ForeignKey("prompt_texts.hash"), nullable=False)  # Содержание промпта
     variables = Column(JSON, nullable=True)  # Переменные промпта в формате JSON
     icon_id = Column(String, nullable=True)  # ID иконки из availableIcons
     color_id = Column(String, nullable=True)  # ID цвета из availableColors
     user_id = Column(Integer, ForeignKey("users.id"))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # User's library_version at the item's last change, and the soft-delete
+    # timestamp; deleted items stay as tombstones for incremental sync
+    change_seq = Column(BigInteger, default=0, server_default="0", nullable=False)
+    deleted_at = Column(DateTime(timezone=True), nullable=True)
+    # Full-text search vector (title weighted A, description B, content C) set
+    # by the user_library_search_vector trigger; deferred so listings never load it
+    search_vector = deferred(Column(TSVECTOR, server_default=FetchedValue(), server_onupdate=FetchedValue()))
+
+    # Keyset pagination index for per-user library listings, the search index,
+    # the change index for incremental sync and the content index used for
+    # duplicate detection and the prompt_texts foreign key
+    __table_args__ = (
+        Index("ix_user_library_user_created_id", user_id, created_at.desc(), id.desc()),
+        Index("ix_user_library_search_vector", search_vector, postgresql_using="gin"),
+        Index("ix_user_library_user_change_seq", user_id, change_seq),
+        Index("ix_user_library_content_hash", content_hash),
+    )
 
     # Relationships
     user = relationship("User", back_populates="library_items")
+    # Loaded with the item in the same query
+    content_text = relationship("PromptText", lazy="joined", innerjoin=True)
+
+    @property
+    def content(self) -> str:
+        return self.content_text.content
+
+class UserLibraryTag(Base):
+    """
+    A user's library tag with the number of live items carrying it
+    
+    item_count is maintained incrementally by the library tag service, so
+    tag facets are read from this table without scanning items.
+    """
+    __tablename__ = "user_library_tags"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    name = Column(String(50), nullable=False)
+    item_count = Column(Integer, nullable=False, server_default="0")
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "name", name="uq_user_library_tags_user_name"),
+    )
+
+class UserLibraryItemTag(Base):
+    """
+    Tag assignment of a library item; the (tag_id, item_id) index is the
+    inverted index used for tag filtering
+    """
+    __tablename__ = "user_library_item_tags"
+
+    item_id = Column(Integer, ForeignKey("user_library.id"), primary_key=True)
+    tag_id = Column(Integer, ForeignKey("user_library_tags.id"), primary_key=True)
+
+    __table_args__ = (
+        Index("ix_user_library_item_tags_tag_item", tag_id, item_id),
+    )
+
+class StripeEvent(Base):
+    """
+    Verified Stripe webhook event, stored when it is received and applied
+    by the Stripe event worker
+
+    The Stripe event ID is the key, so redelivered events are stored once.
+    Events of one customer are applied in the order Stripe created them.
+    """
+    __tablename__ = "stripe_events"
+
+    id = Column(String, primary_key=True)  # Stripe event ID (evt_...)
+    type = Column(String, nullable=False)
+    customer_id = Column(String, nullable=True)  # Stripe customer of the event's object, if any
+    created = Column(DateTime(timezone=True), nullable=False)  # Creation time at Stripe
+    payload = Column(JSON, nullable=False)  # The event as delivered
+    status = Column(String, nullable=False, server_default="pending")  # "pending", "processed", "skipped" (superseded) or "failed"
+    attempts = Column(Integer, nullable=False, server_default="0")
+    next_attempt_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    last_error = Column(Text, nullable=True)
+    received_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+
+    # Queue of pending events and per-customer ordering
+    __table_args__ = (
+        Index("ix_stripe_events_pending", next_attempt_at, postgresql_where=status == "pending"),
+        Index("ix_stripe_events_customer_created", customer_id, created, received_at),
+    )
+
+class RateLimitBucket(Base):
+    """
+    Token bucket level of the shared rate limit backend
+
+    UNLOGGED: the rows are disposable (a missing bucket is a full one) and
+    written on every limited request. Rows of full buckets are pruned.
+    """
+    __tablename__ = "rate_limit_buckets"
+
+    key = Column(String, primary_key=True)
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+    # When the bucket is full again; the row can be deleted after that
+    full_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index("ix_rate_limit_buckets_full_at", full_at),
+        {"prefixes": ["UNLOGGED"]},
+    )
+
+class RateLimitLease(Base):
+    """
+    In-flight slot of the shared rate limit backend, freed when the request
+    ends or, if its instance died, when it expires
+    """
+    __tablename__ = "rate_limit_leases"
+
+    id = Column(UUID(as_uuid=True), primary_key=True)
+    key = Column(String, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
 
-# UserLibraryTag class removed as it's no longer needed
+    __table_args__ = (
+        Index("ix_rate_limit_leases_key_expires", key, expires_at),
+        {"prefixes": ["UNLOGGED"]},
+    )
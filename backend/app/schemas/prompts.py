@@ -49,4 +49,47 @@ class PromptHistoryList(BaseModel):
     Schema for a list of prompt history entries
     """
     items: List[PromptHistory]
-    total: int
+    total: Optional[int] = Field(None, description="Total number of entries (omitted unless requested)")
+    next_cursor: Optional[str] = Field(None, description="Cursor for the next page, null on the last page")
+
+class PromptHistorySummary(BaseModel):
+    """
+    Schema for a prompt history entry in summary lists (fields=summary)
+    """
+    id: int
+    title: Optional[str] = None
+    description: Optional[str] = None
+    url: Optional[str] = None
+    user_id: Optional[int] = None
+    created_at: datetime
+    original_preview: str = Field(..., description="Beginning of the original prompt")
+    original_truncated: bool = Field(..., description="Whether original_preview is shorter than the original prompt")
+    improved_preview: str = Field(..., description="Beginning of the improved prompt")
+    improved_truncated: bool = Field(..., description="Whether improved_preview is shorter than the improved prompt")
+
+class PromptHistorySummaryList(BaseModel):
+    """
+    Schema for a list of prompt history entry summaries
+    """
+    items: List[PromptHistorySummary]
+    total: Optional[int] = Field(None, description="Total number of entries (omitted unless requested)")
+    next_cursor: Optional[str] = Field(None, description="Cursor for the next page, null on the last page")
+
+class PromptHistorySearchHit(BaseModel):
+    """
+    Schema for a history search result
+    """
+    id: int
+    title: Optional[str] = None
+    url: Optional[str] = None
+    created_at: datetime
+    rank: float = Field(..., description="Relevance score, higher is better")
+    original_snippet: str = Field(..., description="HTML-escaped matching fragments of the original prompt with matched terms wrapped in <mark></mark>")
+    improved_snippet: str = Field(..., description="HTML-escaped matching fragments of the improved prompt with matched terms wrapped in <mark></mark>")
+
+class PromptHistorySearchResults(BaseModel):
+    """
+    Schema for a page of history search results
+    """
+    items: List[PromptHistorySearchHit]
+    has_more: bool = Field(..., description="Whether another page of results exists")
@@ -87,6 +87,20 @@ class Prompt(PromptInDBBase):
 class PromptInDB(PromptInDBBase):
     pass
 
+class PromptWithTags(PromptInDBBase):
+    tags: List[str] = []
+
+class PromptList(BaseModel):
+    items: List[PromptWithTags]
+    next_cursor: Optional[str] = Field(None, description="Cursor for the next page, null on the last page")
+
+class SharedTag(BaseModel):
+    name: str
+    count: int = Field(..., description="Number of shared prompts with the tag")
+
+class SharedTagList(BaseModel):
+    items: List[SharedTag]
+
 # Tag schemas
 class TagBase(BaseModel):
     name: str
@@ -1,7 +1,13 @@
-from typing import List, Optional, Dict, Any
+from typing import Annotated, List, Optional, Dict, Any
 from datetime import datetime
 from pydantic import BaseModel, Field
 
+# Limits of library item tags
+MAX_TAGS_PER_ITEM = 20
+MAX_TAG_LENGTH = 50
+
+TagName = Annotated[str, Field(max_length=MAX_TAG_LENGTH)]
+
 # Prompt variable schema
 class PromptVariableBase(BaseModel):
     """
@@ -35,6 +41,7 @@ class UserLibraryCreate(UserLibraryBase):
     # Дополнительные поля для совместимости с фронтендом (camelCase)
     iconId: Optional[str] = Field(None, description="ID of the icon from availableIcons (camelCase)")
     colorId: Optional[str] = Field(None, description="ID of the color from availableColors (camelCase)")
+    tags: Optional[List[TagName]] = Field(None, max_length=MAX_TAGS_PER_ITEM, description="Tags of the prompt")
 
 class UserLibraryUpdate(BaseModel):
     """
@@ -50,6 +57,7 @@ class UserLibraryUpdate(BaseModel):
     # Дополнительные поля для совместимости с фронтендом (camelCase)
     iconId: Optional[str] = Field(None, description="ID of the icon from availableIcons (camelCase)")
     colorId: Optional[str] = Field(None, description="ID of the color from availableColors (camelCase)")
+    tags: Optional[List[TagName]] = Field(None, max_length=MAX_TAGS_PER_ITEM, description="Tags of the prompt; replace the current tags when given")
 
 class UserLibraryInDBBase(UserLibraryBase):
     """
@@ -67,7 +75,7 @@ class UserLibrary(UserLibraryInDBBase):
     """
     Schema for user library item
     """
-    pass
+    tags: List[str] = Field(default_factory=list, description="Tags of the prompt, sorted")
 
 class UserLibraryList(BaseModel):
     """
@@ -75,3 +83,184 @@ class UserLibraryList(BaseModel):
     """
     items: List[UserLibrary]
     total: int
+    next_cursor: Optional[str] = Field(None, description="Cursor for the next page, null on the last page")
+
+# Largest number of items accepted by one batch request
+BATCH_MAX_ITEMS = 100
+
+class UserLibraryBatchCreate(BaseModel):
+    """
+    Schema for creating several library items at once
+    """
+    items: List[UserLibraryCreate] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
+
+class UserLibraryBatchUpdateItem(UserLibraryUpdate):
+    """
+    Schema for one item of a batch update
+    """
+    id: int = Field(..., description="ID of the item to update")
+
+class UserLibraryBatchUpdate(BaseModel):
+    """
+    Schema for updating several library items at once
+    """
+    items: List[UserLibraryBatchUpdateItem] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
+
+class UserLibraryBatchDelete(BaseModel):
+    """
+    Schema for deleting several library items at once
+    """
+    ids: List[int] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
+
+class UserLibraryBatchItemResult(BaseModel):
+    """
+    Schema for the result of one item of a batch request
+    """
+    id: Optional[int] = Field(None, description="Item ID (null for items that were not created)")
+    status: int = Field(..., description="Outcome as an HTTP status: 200, 201, 403 (prompt limit reached) or 404")
+    error: Optional[str] = Field(None, description="Reason the item failed")
+    item: Optional[UserLibrary] = Field(None, description="The item, for successful gets, creates and updates")
+
+class UserLibraryBatchResult(BaseModel):
+    """
+    Schema for the results of a batch request
+    """
+    results: List[UserLibraryBatchItemResult] = Field(..., description="One result per requested item, in request order")
+
+# Largest number of rendered texts returned by one render request
+RENDER_MAX_OUTPUTS = 1000
+
+class UserLibraryRenderItem(BaseModel):
+    """
+    Schema for one template to render
+    """
+    id: Optional[int] = Field(None, description="ID of a library item to render")
+    content: Optional[str] = Field(None, description="Template content to render instead of the item's content")
+    values: List[Dict[str, Optional[str]]] = Field(
+        default_factory=lambda: [{}], min_length=1,
+        description="Value sets by variable name; the template is rendered once per set"
+    )
+    use_saved_values: bool = Field(True, description="Fill variables missing from a value set with the item's saved values")
+
+class UserLibraryRenderRequest(BaseModel):
+    """
+    Schema for rendering several templates at once
+    """
+    items: List[UserLibraryRenderItem] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
+
+class UserLibraryRendered(BaseModel):
+    """
+    Schema for one rendered text
+    """
+    text: str
+    missing: List[str] = Field(..., description="Variables without a value, left as placeholders")
+
+class UserLibraryRenderResult(BaseModel):
+    """
+    Schema for the renderings of one template
+    """
+    id: Optional[int] = None
+    status: int = Field(..., description="Outcome as an HTTP status: 200, 400 or 404")
+    error: Optional[str] = None
+    variables: List[str] = Field(default_factory=list, description="Distinct variables of the template")
+    rendered: List[UserLibraryRendered] = Field(default_factory=list, description="One rendering per value set")
+
+class UserLibraryRenderResults(BaseModel):
+    """
+    Schema for the results of a render request
+    """
+    results: List[UserLibraryRenderResult] = Field(..., description="One result per requested item, in request order")
+
+class UserLibrarySummary(BaseModel):
+    """
+    Schema for a user library item in summary lists (fields=summary)
+    """
+    id: int
+    title: str
+    description: Optional[str] = None
+    icon_id: Optional[str] = None
+    color_id: Optional[str] = None
+    user_id: int
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    content_preview: str = Field(..., description="Beginning of the content")
+    content_truncated: bool = Field(..., description="Whether content_preview is shorter than the content")
+    tags: List[str] = Field(default_factory=list, description="Tags of the prompt, sorted")
+
+class UserLibrarySummaryList(BaseModel):
+    """
+    Schema for a list of user library item summaries
+    """
+    items: List[UserLibrarySummary]
+    total: int
+    next_cursor: Optional[str] = Field(None, description="Cursor for the next page, null on the last page")
+
+class UserLibraryTagCount(BaseModel):
+    """
+    Schema for a library tag facet
+    """
+    name: str
+    count: int = Field(..., description="Number of library items with the tag")
+
+class UserLibraryTagList(BaseModel):
+    """
+    Schema for the tags of a user's library
+    """
+    items: List[UserLibraryTagCount] = Field(..., description="Tags in use, most used first")
+
+class UserLibraryStorage(BaseModel):
+    """
+    Schema for the text storage used by a user's library and history
+    """
+    references: int = Field(..., description="Library items and history entries referencing a stored text")
+    texts: int = Field(..., description="Distinct texts referenced")
+    referenced_bytes: int = Field(..., description="Size of the referenced texts without deduplication")
+    stored_bytes: int = Field(..., description="Size of the distinct texts")
+    saved_bytes: int = Field(..., description="Bytes saved by storing each distinct text once")
+
+class UserLibrarySearchHit(BaseModel):
+    """
+    Schema for a library search result
+    """
+    id: int
+    title: str
+    description: Optional[str] = None
+    icon_id: Optional[str] = None
+    color_id: Optional[str] = None
+    created_at: datetime
+    rank: float = Field(..., description="Relevance score, higher is better")
+    title_highlight: str = Field(..., description="HTML-escaped title with matched terms wrapped in <mark></mark>")
+    snippet: str = Field(..., description="HTML-escaped matching fragments of the content with matched terms wrapped in <mark></mark>")
+
+class UserLibrarySearchResults(BaseModel):
+    """
+    Schema for a page of library search results
+    """
+    items: List[UserLibrarySearchHit]
+    has_more: bool = Field(..., description="Whether another page of results exists")
+
+class UserLibraryImportError(BaseModel):
+    """
+    Schema for an import error on one NDJSON line
+    """
+    line: int = Field(..., description="1-based line number in the uploaded file")
+    error: str = Field(..., description="Reason the line was rejected")
+
+class UserLibraryImportResult(BaseModel):
+    """
+    Schema for the summary of a bulk library import
+    """
+    imported: int = Field(..., description="Number of items imported")
+    failed: int = Field(..., description="Number of lines rejected as invalid")
+    skipped: int = Field(..., description="Number of valid items not imported because the prompt limit was reached")
+    errors: List[UserLibraryImportError] = Field(default_factory=list, description="First per-line errors")
+
+class UserLibrarySync(BaseModel):
+    """
+    Schema for a page of incremental library changes
+    """
+    items: List[UserLibrary] = Field(..., description="Items created or updated since the sync token")
+    deleted: List[int] = Field(..., description="IDs of items deleted since the sync token")
+    sync_token: str = Field(..., description="Token to send with the next sync request")
+    has_more: bool = Field(..., description="Whether more changes are pending; sync again immediately")
+    full_resync: bool = Field(..., description="Whether items is the complete library and replaces the local copy")
@@ -1,6 +1,8 @@
+import asyncio
 from datetime import datetime, timedelta
 from typing import Optional
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.security import verify_password, get_password_hash, create_access_token, verify_google_token
 from app.core.config import settings
@@ -8,20 +10,21 @@ from app.models.models import User
 from app.schemas.schemas import UserCreate, UserUpdate
 
 class AuthService:
-    def authenticate_user(self, db: Session, email: str, password: str) -> Optional[User]:
+    async def authenticate_user(self, db: AsyncSession, email: str, password: str) -> Optional[User]:
         """
         Authenticate user with email and password
         """
-        user = self.get_user_by_email(db, email)
+        user = await self.get_user_by_email(db, email)
         if not user:
             return None
         if not user.hashed_password:
             return None
-        if not verify_password(password, user.hashed_password):
+        # bcrypt is CPU-bound, run it off the event loop
+        if not await asyncio.to_thread(verify_password, password, user.hashed_password):
             return None
         return user
     
-    def authenticate_google(self, db: Session, token: str) -> Optional[User]:
+    async def authenticate_google(self, db: AsyncSession, token: str) -> Optional[User]:
         """
         Authenticate user with Google token
         """
@@ -29,9 +32,9 @@ class AuthService:
             print(f"AuthService.authenticate_google: Authenticating with Google token: {token[:10]}...")
             print(f"AuthService.authenticate_google: Token length: {len(token)}")
             
-            # Verify Google token
+            # Verify Google token (blocking HTTP call, run off the event loop)
             print(f"AuthService.authenticate_google: Calling verify_google_token...")
-            idinfo = verify_google_token(token)
+            idinfo = await asyncio.to_thread(verify_google_token, token)
             print(f"AuthService.authenticate_google: Token verified. User info: {idinfo}")
             
             if "email" not in idinfo:
@@ -40,7 +43,7 @@ class AuthService:
             
             # Check if user exists
             print(f"AuthService.authenticate_google: Checking if user exists with email: {idinfo['email']}")
-            user = self.get_user_by_email(db, idinfo["email"])
+            user = await self.get_user_by_email(db, idinfo["email"])
             
             if user:
                 print(f"AuthService.authenticate_google: User found: {user.id}, {user.email}")
@@ -55,7 +58,7 @@ class AuthService:
                 
                 if update_data:
                     print(f"AuthService.authenticate_google: Updating user with data: {update_data}")
-                    user = self.update_user(db, user_id=user.id, obj_in=UserUpdate(**update_data))
+                    user = await self.update_user(db, user_id=user.id, obj_in=UserUpdate(**update_data))
                     print(f"AuthService.authenticate_google: User updated: {user.id}, {user.email}")
                 else:
                     print(f"AuthService.authenticate_google: No updates needed for user: {user.id}, {user.email}")
@@ -69,7 +72,7 @@ class AuthService:
                     photo_url=idinfo.get("picture")
                 )
                 print(f"AuthService.authenticate_google: Creating user with data: {user_in}")
-                user = self.create_user(db, obj_in=user_in)
+                user = await self.create_user(db, obj_in=user_in)
                 print(f"AuthService.authenticate_google: New user created: {user.id}, {user.email}")
             
             print(f"AuthService.authenticate_google: Authentication successful, returning user: {user.id}, {user.email}")
@@ -86,32 +89,34 @@ class AuthService:
             print(f"AuthService.authenticate_google: Traceback: {traceback.format_exc()}")
             return None
     
-    def create_user(self, db: Session, obj_in: UserCreate) -> User:
+    async def create_user(self, db: AsyncSession, obj_in: UserCreate) -> User:
         """
         Create new user
         """
+        # bcrypt is CPU-bound, run it off the event loop
+        hashed_password = await asyncio.to_thread(get_password_hash, obj_in.password) if obj_in.password else None
         db_obj = User(
             email=obj_in.email,
-            hashed_password=get_password_hash(obj_in.password) if obj_in.password else None,
+            hashed_password=hashed_password,
             display_name=obj_in.display_name,
             google_id=obj_in.google_id,
             photo_url=obj_in.photo_url,
             is_active=True
         )
         db.add(db_obj)
-        db.commit()
-        db.refresh(db_obj)
+        await db.commit()
+        await db.refresh(db_obj)
         return db_obj
     
-    def update_user(self, db: Session, user_id: int, obj_in: UserUpdate) -> User:
+    async def update_user(self, db: AsyncSession, user_id: int, obj_in: UserUpdate) -> User:
         """
         Update user
         """
-        user = self.get_user(db, user_id)
+        user = await self.get_user(db, user_id)
         update_data = obj_in.dict(exclude_unset=True)
         
         if "password" in update_data:
-            hashed_password = get_password_hash(update_data["password"])
+            hashed_password = await asyncio.to_thread(get_password_hash, update_data["password"])
             del update_data["password"]
             update_data["hashed_password"] = hashed_password
         
@@ -119,27 +124,29 @@ class AuthService:
             setattr(user, field, value)
         
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
         return user
     
-    def get_user(self, db: Session, user_id: int) -> Optional[User]:
+    async def get_user(self, db: AsyncSession, user_id: int) -> Optional[User]:
         """
         Get user by ID
         """
-        return db.query(User).filter(User.id == user_id).first()
+        return await db.get(User, user_id)
     
-    def get_user_by_email(self, db: Session, email: str) -> Optional[User]:
+    async def get_user_by_email(self, db: AsyncSession, email: str) -> Optional[User]:
         """
         Get user by email
         """
-        return db.query(User).filter(User.email == email).first()
+        result = await db.execute(select(User).filter(User.email == email))
+        return result.scalars().first()
     
-    def get_user_by_google_id(self, db: Session, google_id: str) -> Optional[User]:
+    async def get_user_by_google_id(self, db: AsyncSession, google_id: str) -> Optional[User]:
         """
         Get user by Google ID
         """
-        return db.query(User).filter(User.google_id == google_id).first()
+        result = await db.execute(select(User).filter(User.google_id == google_id))
+        return result.scalars().first()
     
     def create_access_token_for_user(self, user_id: int) -> str:
         """
@@ -0,0 +1,262 @@
+"""
+Bulk Transfer Service
+
+Streaming NDJSON export of the user library and improvement history, and
+batched NDJSON import into the library.
+
+Exports read through a server-side cursor in batches, so memory use does
+not depend on the number of rows. Imports parse the request body line by
+line; each batch reserves prompt slots and is inserted with one batched
+INSERT in its own transaction, so the usage limits hold for imports too.
+Library items are exported with their tags, and imported tags are
+assigned in the same transaction as their items, so an export can be
+imported again without losing tags or skewing tag counts.
+"""
+
+import json
+import logging
+from datetime import date, datetime
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.core.database import AsyncSessionLocal
+from app.models.models import PromptHistory, PromptText, UserLibrary, UserLibraryItemTag, UserLibraryTag
+from app.schemas.user_library import UserLibraryCreate
+from app.services.library_tags import library_tag_service
+from app.services.prompt_texts import prompt_text_service
+from app.services.usage_limits import usage_limits_service
+from app.services.user_library import UserLibraryService
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched per round trip when exporting
+EXPORT_BATCH_SIZE = 1000
+# Rows inserted per transaction when importing
+IMPORT_BATCH_SIZE = 1000
+# Longest accepted NDJSON line
+MAX_LINE_BYTES = 1024 * 1024
+# Per-line errors included in the import summary
+MAX_REPORTED_ERRORS = 100
+
+LIBRARY_EXPORT_COLUMNS = (
+    UserLibrary.id,
+    UserLibrary.title,
+    UserLibrary.description,
+    PromptText.content,
+    UserLibrary.variables,
+    UserLibrary.icon_id,
+    UserLibrary.color_id,
+    UserLibrary.created_at,
+    UserLibrary.updated_at,
+    # Sorted tag names of the item; an empty array for untagged items
+    func.array(
+        select(UserLibraryTag.name)
+        .join(UserLibraryItemTag, UserLibraryItemTag.tag_id == UserLibraryTag.id)
+        .where(UserLibraryItemTag.item_id == UserLibrary.id)
+        .order_by(UserLibraryTag.name)
+        .scalar_subquery()
+    ).label("tags"),
+)
+
+HISTORY_EXPORT_COLUMNS = (
+    PromptHistory.id,
+    PromptHistory.title,
+    PromptHistory.description,
+    PromptHistory.original_prompt,
+    PromptText.content.label("improved_prompt"),
+    PromptHistory.url,
+    PromptHistory.created_at,
+)
+
+def _json_default(value: Any) -> str:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+async def iter_ndjson_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, bytes]]:
+    """
+    Split a stream of body chunks into non-empty NDJSON lines
+
+    Args:
+        chunks: Request body chunks
+
+    Yields:
+        Tuples of (line_number, line)
+
+    Raises:
+        ValueError: If a line is longer than MAX_LINE_BYTES
+    """
+    buffer = b""
+    line_number = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                yield line_number, line
+        if len(buffer) > MAX_LINE_BYTES:
+            raise ValueError(f"Line {line_number + 1} is longer than {MAX_LINE_BYTES} bytes")
+
+    if buffer.strip():
+        yield line_number + 1, buffer
+
+class BulkTransferService:
+    """
+    Service for bulk export and import of library items and history entries
+    """
+
+    @staticmethod
+    async def _stream_ndjson(bind: AsyncEngine, statement) -> AsyncIterator[bytes]:
+        # Streaming responses outlive the request-scoped session, so the
+        # export uses its own session on the same engine (primary or replica)
+        async with AsyncSessionLocal(bind=bind) as db:
+            result = await db.stream(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+            async for rows in result.mappings().partitions():
+                yield "".join(
+                    json.dumps(dict(row), default=_json_default, ensure_ascii=False) + "\n"
+                    for row in rows
+                ).encode("utf-8")
+
+    @staticmethod
+    def export_library(bind: AsyncEngine, user_id: int) -> AsyncIterator[bytes]:
+        """
+        Stream the user's library as NDJSON, oldest first
+
+        Args:
+            bind: Engine to read from (typically the request session's bind)
+            user_id: User ID
+
+        Returns:
+            Async iterator of NDJSON chunks
+        """
+        statement = (
+            select(*LIBRARY_EXPORT_COLUMNS)
+            .join(PromptText, PromptText.hash == UserLibrary.content_hash)
+            .where(UserLibrary.user_id == user_id, UserLibrary.deleted_at.is_(None))
+            .order_by(UserLibrary.id)
+        )
+        return BulkTransferService._stream_ndjson(bind, statement)
+
+    @staticmethod
+    def export_history(bind: AsyncEngine, user_id: int) -> AsyncIterator[bytes]:
+        """
+        Stream the user's improvement history as NDJSON, oldest first
+
+        Args:
+            bind: Engine to read from (typically the request session's bind)
+            user_id: User ID
+
+        Returns:
+            Async iterator of NDJSON chunks
+        """
+        statement = (
+            select(*HISTORY_EXPORT_COLUMNS)
+            .join(PromptText, PromptText.hash == PromptHistory.improved_hash)
+            .where(PromptHistory.user_id == user_id)
+            .order_by(PromptHistory.created_at, PromptHistory.id)
+        )
+        return BulkTransferService._stream_ndjson(bind, statement)
+
+    @staticmethod
+    async def _insert_batch(db: AsyncSession, user_id: int, batch: List[UserLibraryCreate]) -> int:
+        """
+        Insert as much of a batch as the user's prompt limit allows, with
+        the items' tags, in one transaction
+
+        Returns:
+            Number of rows inserted
+        """
+        try:
+            granted = await usage_limits_service.reserve_prompts(db, user_id, len(batch))
+            if granted:
+                items = batch[:granted]
+                hashes = await prompt_text_service.store_many(db, [item.content for item in items])
+                last_seq = await UserLibraryService.next_change_seq(db, user_id, granted)
+                rows = []
+                for offset, (item, text_hash) in enumerate(zip(items, hashes)):
+                    row = UserLibraryService.new_item_values(item, user_id, text_hash)
+                    row["change_seq"] = last_seq - granted + 1 + offset
+                    rows.append(row)
+                result = await db.scalars(
+                    insert(UserLibrary).returning(UserLibrary.id, sort_by_parameter_order=True),
+                    rows
+                )
+                for item_id, item in zip(result.all(), items):
+                    if item.tags:
+                        await library_tag_service.set_item_tags(db, user_id, item_id, item.tags)
+            await db.commit()
+            return granted
+        except Exception:
+            await db.rollback()
+            raise
+
+    @staticmethod
+    async def import_library(db: AsyncSession, user_id: int, chunks: AsyncIterator[bytes]) -> Dict[str, Any]:
+        """
+        Import NDJSON library items from a streamed request body
+
+        Each line is one item in the UserLibraryCreate format. Invalid lines
+        are reported and skipped; once the user's prompt limit is reached the
+        remaining lines are skipped.
+
+        Args:
+            db: Request-scoped database session
+            user_id: User ID
+            chunks: Request body chunks
+
+        Returns:
+            Summary with the number of items imported, failed and skipped
+            and the first per-line errors
+
+        Raises:
+            ValueError: If a line exceeds MAX_LINE_BYTES (earlier batches stay imported)
+        """
+        summary: Dict[str, Any] = {"imported": 0, "failed": 0, "skipped": 0, "errors": []}
+        batch: List[UserLibraryCreate] = []
+        limit_reached = False
+
+        async def flush() -> None:
+            nonlocal limit_reached
+            granted = await BulkTransferService._insert_batch(db, user_id, batch)
+            summary["imported"] += granted
+            summary["skipped"] += len(batch) - granted
+            limit_reached = granted < len(batch)
+            batch.clear()
+
+        async for line_number, line in iter_ndjson_lines(chunks):
+            if limit_reached:
+                summary["skipped"] += 1
+                continue
+
+            try:
+                item = UserLibraryCreate.model_validate_json(line)
+            except ValidationError as e:
+                summary["failed"] += 1
+                if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+                    error = e.errors(include_url=False)[0]
+                    location = ".".join(str(part) for part in error["loc"])
+                    summary["errors"].append({
+                        "line": line_number,
+                        "error": f"{location}: {error['msg']}" if location else error["msg"]
+                    })
+                continue
+
+            batch.append(item)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                await flush()
+
+        if batch and not limit_reached:
+            await flush()
+
+        logger.info(
+            f"Imported {summary['imported']} library items for user_id={user_id} "
+            f"({summary['failed']} failed, {summary['skipped']} skipped)"
+        )
+        return summary
+
+# Create a singleton instance
+bulk_transfer_service = BulkTransferService()
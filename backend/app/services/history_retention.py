@@ -0,0 +1,345 @@
+"""
+History Retention Service
+
+Maintains the monthly partitions of prompt_history (PostgreSQL):
+
+- creates the partitions for the coming months ahead of time, so inserts
+  never land in the default partition;
+- deletes anonymous entries (user_id IS NULL) older than
+  HISTORY_ANONYMOUS_RETENTION_DAYS, since nobody can read them back;
+- archives partitions older than HISTORY_RETENTION_MONTHS into
+  prompt_history_archive, one gzip-compressed NDJSON payload per user and
+  month, and drops them;
+- deletes the prompt texts that are no longer referenced.
+
+Dropping whole partitions instead of deleting rows keeps index size and
+vacuum work proportional to the retained window. Run it periodically
+with history_retention.py.
+"""
+
+import re
+import gzip
+import json
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.core.config import settings
+from app.models.models import PromptHistoryArchive
+from app.services.prompt_texts import prompt_text_service
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "prompt_history"
+DEFAULT_PARTITION = "prompt_history_default"
+
+# Columns copied when moving rows between partitions (the search_vector
+# trigger does not fire on the standalone table the rows are moved into)
+COLUMNS = "id, title, description, original_prompt, improved_hash, url, created_at, user_id, search_vector"
+
+# Columns of the archived entries; the improved prompt is read from prompt_texts
+ARCHIVE_COLUMNS = (
+    "h.id, h.title, h.description, h.original_prompt, t.content AS improved_prompt, h.url, h.created_at, h.user_id"
+)
+
+# Archive rows inserted per statement
+ARCHIVE_BATCH_SIZE = 500
+
+PARTITION_BOUND = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+def _parse_bound(value: str) -> date:
+    """
+    UTC date of a partition bound as rendered by pg_get_expr, e.g. '2026-01-01 00:00:00+00'
+    """
+    if re.search(r"[+-]\d\d$", value):
+        value += ":00"
+    return datetime.fromisoformat(value).astimezone(timezone.utc).date()
+
+def _bound_sql(start: date, end: date) -> str:
+    # Bounds are given in UTC regardless of the session time zone
+    return f"FOR VALUES FROM ('{start.isoformat()} 00:00:00+00') TO ('{end.isoformat()} 00:00:00+00')"
+
+def add_months(month: date, count: int) -> date:
+    """
+    First day of the month `count` months after (or before) `month`
+    """
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month: date) -> str:
+    """
+    Name of the partition holding the given month
+    """
+    return f"{PARENT_TABLE}_y{month.year}m{month.month:02d}"
+
+class HistoryRetentionService:
+    """
+    Service for managing prompt_history partitions and retention
+    """
+
+    @staticmethod
+    async def list_partitions(connection: AsyncConnection) -> List[Tuple[str, date, date]]:
+        """
+        List the range partitions of prompt_history
+
+        Args:
+            connection: Database connection
+
+        Returns:
+            List of (partition_name, start, end) ordered by start; the default
+            partition is not included
+        """
+        result = await connection.execute(text(
+            "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) "
+            "FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = :parent"
+        ), {"parent": PARENT_TABLE})
+
+        partitions = []
+        for name, bound in result.all():
+            match = PARTITION_BOUND.search(bound or "")
+            if match:
+                start, end = (_parse_bound(value) for value in match.groups())
+                partitions.append((name, start, end))
+        return sorted(partitions, key=lambda partition: partition[1])
+
+    @staticmethod
+    async def ensure_partitions(engine: AsyncEngine, months_ahead: int, dry_run: bool = False) -> List[str]:
+        """
+        Create the partitions for the current month and `months_ahead` following months
+
+        Rows that already landed in the default partition for one of these
+        months are moved into the new partition.
+
+        Args:
+            engine: Database engine
+            months_ahead: Number of future months to create partitions for
+            dry_run: Only report the partitions that would be created
+
+        Returns:
+            Names of the partitions created
+        """
+        this_month = datetime.now(timezone.utc).date().replace(day=1)
+        created = []
+
+        async with engine.begin() as connection:
+            existing = {name for name, _, _ in await HistoryRetentionService.list_partitions(connection)}
+
+        for offset in range(months_ahead + 1):
+            start = add_months(this_month, offset)
+            end = add_months(start, 1)
+            name = partition_name(start)
+            if name in existing:
+                continue
+
+            created.append(name)
+            if dry_run:
+                continue
+
+            bounds = {
+                "start": datetime(start.year, start.month, 1, tzinfo=timezone.utc),
+                "end": datetime(end.year, end.month, 1, tzinfo=timezone.utc),
+            }
+            bound_sql = _bound_sql(start, end)
+            async with engine.begin() as connection:
+                stray_rows = await connection.scalar(text(
+                    f"SELECT COUNT(*) FROM {DEFAULT_PARTITION} WHERE created_at >= :start AND created_at < :end"
+                ), bounds)
+
+                if not stray_rows:
+                    await connection.execute(text(f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} {bound_sql}"))
+                else:
+                    # A partition cannot be created while the default partition
+                    # holds rows of its range: move them into a new table first
+                    await connection.execute(text(
+                        f"CREATE TABLE {name} (LIKE {PARENT_TABLE} "
+                        "INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING CONSTRAINTS)"
+                    ))
+                    await connection.execute(text(
+                        f"INSERT INTO {name} ({COLUMNS}) SELECT {COLUMNS} FROM {DEFAULT_PARTITION} "
+                        "WHERE created_at >= :start AND created_at < :end"
+                    ), bounds)
+                    await connection.execute(text(
+                        f"DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= :start AND created_at < :end"
+                    ), bounds)
+                    await connection.execute(text(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} {bound_sql}"))
+            logger.info(f"Created history partition {name} ({stray_rows} rows moved from the default partition)")
+
+        return created
+
+    @staticmethod
+    async def purge_anonymous(engine: AsyncEngine, days: int, batch_size: int = 5000, dry_run: bool = False) -> int:
+        """
+        Delete anonymous history entries older than `days` days
+
+        Deletes in batches, each in its own transaction, to keep locks and
+        WAL bursts short.
+
+        Args:
+            engine: Database engine
+            days: Age in days after which anonymous entries are deleted
+            batch_size: Number of rows deleted per transaction
+            dry_run: Only count the rows that would be deleted
+
+        Returns:
+            Number of rows deleted (or that would be deleted)
+        """
+        cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+
+        if dry_run:
+            async with engine.connect() as connection:
+                return await connection.scalar(text(
+                    f"SELECT COUNT(*) FROM {PARENT_TABLE} WHERE user_id IS NULL AND created_at < :cutoff"
+                ), {"cutoff": cutoff})
+
+        deleted = 0
+        while True:
+            async with engine.begin() as connection:
+                result = await connection.execute(text(
+                    f"DELETE FROM {PARENT_TABLE} WHERE (id, created_at) IN ("
+                    f"SELECT id, created_at FROM {PARENT_TABLE} "
+                    "WHERE user_id IS NULL AND created_at < :cutoff LIMIT :batch_size)"
+                ), {"cutoff": cutoff, "batch_size": batch_size})
+            deleted += result.rowcount
+            if result.rowcount < batch_size:
+                break
+
+        logger.info(f"Deleted {deleted} anonymous history entries older than {days} days")
+        return deleted
+
+    @staticmethod
+    async def archive_expired(engine: AsyncEngine, months: int, dry_run: bool = False) -> Dict[str, int]:
+        """
+        Archive and drop the partitions that ended more than `months` months ago
+
+        Each partition is handled in one transaction: its user entries are
+        compressed into prompt_history_archive (anonymous entries are not
+        kept), then the partition is detached and dropped. The exclusive lock
+        for the detach is only taken at the end of the transaction.
+
+        Args:
+            engine: Database engine
+            months: Number of whole months of history to keep in prompt_history
+            dry_run: Only report the partitions that would be archived
+
+        Returns:
+            Mapping of archived partition name to number of entries archived
+        """
+        cutoff = add_months(datetime.now(timezone.utc).date().replace(day=1), -months)
+        archived = {}
+
+        async with engine.connect() as connection:
+            partitions = await HistoryRetentionService.list_partitions(connection)
+
+        for name, start, end in partitions:
+            if end > cutoff:
+                continue
+            if dry_run:
+                archived[name] = 0
+                continue
+
+            async with engine.begin() as connection:
+                archived[name] = await HistoryRetentionService._archive_partition(connection, name, start, end)
+                # Invalidate the history ETags of the affected users
+                await connection.execute(text(
+                    "UPDATE users SET history_version = history_version + 1 "
+                    f"WHERE id IN (SELECT DISTINCT user_id FROM {name} WHERE user_id IS NOT NULL)"
+                ))
+                await connection.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+                await connection.execute(text(f"DROP TABLE {name}"))
+            logger.info(f"Archived and dropped history partition {name} ({archived[name]} entries)")
+
+        return archived
+
+    @staticmethod
+    async def _archive_partition(connection: AsyncConnection, name: str, start: date, end: date) -> int:
+        """
+        Copy the user entries of one partition into prompt_history_archive
+
+        Returns:
+            Number of entries archived
+        """
+        rows = await connection.stream(text(
+            f"SELECT {ARCHIVE_COLUMNS} FROM {name} h JOIN prompt_texts t ON t.hash = h.improved_hash "
+            "WHERE h.user_id IS NOT NULL ORDER BY h.user_id, h.created_at, h.id"
+        ))
+
+        total = 0
+        pending: List[Dict[str, Any]] = []
+        current_user: Optional[int] = None
+        entries: List[str] = []
+
+        async def flush_user() -> None:
+            if current_user is None or not entries:
+                return
+            pending.append({
+                "user_id": current_user,
+                "period_start": start,
+                "period_end": end,
+                "entry_count": len(entries),
+                "payload": gzip.compress(("\n".join(entries) + "\n").encode("utf-8")),
+            })
+            if len(pending) >= ARCHIVE_BATCH_SIZE:
+                await connection.execute(insert(PromptHistoryArchive), pending)
+                pending.clear()
+
+        async for row in rows.mappings():
+            if row["user_id"] != current_user:
+                await flush_user()
+                current_user = row["user_id"]
+                entries = []
+            entry = dict(row)
+            entry["created_at"] = entry["created_at"].isoformat()
+            entries.append(json.dumps(entry, ensure_ascii=False))
+            total += 1
+
+        await flush_user()
+        if pending:
+            await connection.execute(insert(PromptHistoryArchive), pending)
+
+        return total
+
+    @staticmethod
+    async def run(
+        engine: AsyncEngine,
+        anonymous_days: Optional[int] = None,
+        retention_months: Optional[int] = None,
+        months_ahead: Optional[int] = None,
+        dry_run: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Run all retention steps; unset arguments fall back to the settings
+
+        Returns:
+            Summary of the partitions created, rows purged, partitions archived
+            and prompt texts deleted
+        """
+        anonymous_days = settings.HISTORY_ANONYMOUS_RETENTION_DAYS if anonymous_days is None else anonymous_days
+        retention_months = settings.HISTORY_RETENTION_MONTHS if retention_months is None else retention_months
+        months_ahead = settings.HISTORY_PARTITIONS_AHEAD if months_ahead is None else months_ahead
+
+        summary = {
+            "created_partitions": await HistoryRetentionService.ensure_partitions(engine, months_ahead, dry_run),
+            "anonymous_deleted": 0,
+            "archived_partitions": {},
+            "texts_deleted": 0,
+        }
+        if anonymous_days > 0:
+            summary["anonymous_deleted"] = await HistoryRetentionService.purge_anonymous(
+                engine, anonymous_days, dry_run=dry_run
+            )
+        if retention_months > 0:
+            summary["archived_partitions"] = await HistoryRetentionService.archive_expired(
+                engine, retention_months, dry_run
+            )
+        # Texts of purged entries, dropped partitions and edited library items
+        summary["texts_deleted"] = await prompt_text_service.purge_unreferenced(engine, dry_run=dry_run)
+        return summary
+
+# Create a singleton instance
+history_retention_service = HistoryRetentionService()
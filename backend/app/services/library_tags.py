@@ -0,0 +1,261 @@
+"""
+Library Tag Service
+
+Tags of library items. Assignments live in user_library_item_tags, whose
+(tag_id, item_id) index serves tag filters; the number of live items per
+tag is kept in user_library_tags.item_count and adjusted in the same
+transaction as every assignment change, so facets cost one indexed read
+of the user's tags.
+
+All changes run inside library writes, after the user row has been locked
+by UserLibraryService.next_change_seq, so concurrent writes of the same
+user cannot race on tag creation or counts.
+"""
+
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.tags import normalize_tag
+from app.models.models import UserLibrary, UserLibraryItemTag, UserLibraryTag
+
+logger = logging.getLogger(__name__)
+
+def normalize_tags(names: Optional[Iterable[str]]) -> List[str]:
+    """
+    Canonical, de-duplicated tag names in input order (empty names are dropped)
+    """
+    return list(dict.fromkeys(normalize_tag(name) for name in names or [] if name and name.strip()))
+
+class LibraryTagService:
+    """
+    Service for library item tags, tag counts and tag filters
+    """
+
+    @staticmethod
+    async def _adjust_counts(db: AsyncSession, deltas: Dict[int, int]) -> None:
+        """
+        Add per-tag deltas to item_count with one batched statement
+        """
+        deltas = {tag_id: delta for tag_id, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        table = UserLibraryTag.__table__
+        await db.execute(
+            update(table)
+            .where(table.c.id == bindparam("tag_id"))
+            .values(item_count=table.c.item_count + bindparam("delta")),
+            [{"tag_id": tag_id, "delta": delta} for tag_id, delta in deltas.items()]
+        )
+
+    @staticmethod
+    async def _get_or_create(db: AsyncSession, user_id: int, names: List[str]) -> Dict[str, int]:
+        """
+        IDs of the user's tags with the given names, creating the missing ones
+        """
+        if not names:
+            return {}
+        result = await db.execute(
+            select(UserLibraryTag.name, UserLibraryTag.id)
+            .where(UserLibraryTag.user_id == user_id, UserLibraryTag.name.in_(names))
+        )
+        tag_ids = dict(result.all())
+
+        missing = [name for name in names if name not in tag_ids]
+        if missing:
+            result = await db.execute(
+                insert(UserLibraryTag).returning(UserLibraryTag.name, UserLibraryTag.id),
+                [{"user_id": user_id, "name": name} for name in missing]
+            )
+            tag_ids.update(result.all())
+        return tag_ids
+
+    @staticmethod
+    async def set_item_tags(db: AsyncSession, user_id: int, item_id: int, names: Iterable[str]) -> List[str]:
+        """
+        Replace the tags of a library item inside the caller's transaction
+
+        Args:
+            db: Database session
+            user_id: Owner of the item
+            item_id: Item ID (the item must be flushed)
+            names: Tag names; normalized with normalize_tags
+
+        Returns:
+            The item's tag names, sorted
+        """
+        desired = normalize_tags(names)
+
+        result = await db.execute(
+            select(UserLibraryTag.name, UserLibraryTag.id)
+            .join(UserLibraryItemTag, UserLibraryItemTag.tag_id == UserLibraryTag.id)
+            .where(UserLibraryItemTag.item_id == item_id)
+        )
+        current = dict(result.all())
+
+        removed = [tag_id for name, tag_id in current.items() if name not in desired]
+        added = await LibraryTagService._get_or_create(
+            db, user_id, [name for name in desired if name not in current]
+        )
+
+        if removed:
+            await db.execute(
+                delete(UserLibraryItemTag)
+                .where(UserLibraryItemTag.item_id == item_id, UserLibraryItemTag.tag_id.in_(removed))
+            )
+        if added:
+            await db.execute(
+                insert(UserLibraryItemTag),
+                [{"item_id": item_id, "tag_id": tag_id} for tag_id in added.values()]
+            )
+
+        deltas = {tag_id: -1 for tag_id in removed}
+        deltas.update({tag_id: 1 for tag_id in added.values()})
+        await LibraryTagService._adjust_counts(db, deltas)
+        return sorted(desired)
+
+    @staticmethod
+    async def remove_items(db: AsyncSession, item_ids: List[int]) -> None:
+        """
+        Drop the tag assignments of deleted items and uncount them
+
+        Args:
+            db: Database session
+            item_ids: IDs of the items being deleted
+        """
+        if not item_ids:
+            return
+        result = await db.execute(
+            select(UserLibraryItemTag.tag_id, func.count())
+            .where(UserLibraryItemTag.item_id.in_(item_ids))
+            .group_by(UserLibraryItemTag.tag_id)
+        )
+        deltas = {tag_id: -count for tag_id, count in result.all()}
+        if not deltas:
+            return
+        await db.execute(delete(UserLibraryItemTag).where(UserLibraryItemTag.item_id.in_(item_ids)))
+        await LibraryTagService._adjust_counts(db, deltas)
+
+    @staticmethod
+    async def get_tags_for_items(db: AsyncSession, item_ids: List[int]) -> Dict[int, List[str]]:
+        """
+        Tag names of several items with one query
+
+        Returns:
+            Mapping of item ID to its sorted tag names (items without tags are absent)
+        """
+        if not item_ids:
+            return {}
+        result = await db.execute(
+            select(UserLibraryItemTag.item_id, UserLibraryTag.name)
+            .join(UserLibraryTag, UserLibraryTag.id == UserLibraryItemTag.tag_id)
+            .where(UserLibraryItemTag.item_id.in_(item_ids))
+            .order_by(UserLibraryTag.name)
+        )
+        tags: Dict[int, List[str]] = {}
+        for item_id, name in result.all():
+            tags.setdefault(item_id, []).append(name)
+        return tags
+
+    @staticmethod
+    async def attach_tags(db: AsyncSession, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Set the "tags" key of item dicts, with one query
+        """
+        tags = await LibraryTagService.get_tags_for_items(db, [item["id"] for item in items])
+        for item in items:
+            item["tags"] = tags.get(item["id"], [])
+        return items
+
+    @staticmethod
+    async def get_facets(db: AsyncSession, user_id: int) -> List[Dict[str, Any]]:
+        """
+        The user's tags with their item counts, most used first
+
+        Reads only user_library_tags; no items are scanned.
+        """
+        result = await db.execute(
+            select(UserLibraryTag.name, UserLibraryTag.item_count)
+            .where(UserLibraryTag.user_id == user_id, UserLibraryTag.item_count > 0)
+            .order_by(UserLibraryTag.item_count.desc(), UserLibraryTag.name)
+        )
+        return [{"name": name, "count": count} for name, count in result.all()]
+
+    @staticmethod
+    async def filter_conditions(db: AsyncSession, user_id: int, names: List[str], match_all: bool) -> Optional[list]:
+        """
+        WHERE conditions restricting library items to tags
+
+        Args:
+            db: Database session
+            user_id: User ID
+            names: Tag names to filter by
+            match_all: Require all tags (AND) instead of any of them (OR)
+
+        Returns:
+            List of conditions on UserLibrary, or None when no item can match
+        """
+        names = normalize_tags(names)
+        if not names:
+            return []
+        result = await db.execute(
+            select(UserLibraryTag.id)
+            .where(UserLibraryTag.user_id == user_id, UserLibraryTag.name.in_(names))
+        )
+        tag_ids = result.scalars().all()
+
+        if not tag_ids or (match_all and len(tag_ids) < len(names)):
+            return None
+
+        def tagged_with(*ids):
+            return UserLibrary.id.in_(
+                select(UserLibraryItemTag.item_id).where(UserLibraryItemTag.tag_id.in_(ids))
+            )
+
+        if match_all:
+            return [tagged_with(tag_id) for tag_id in tag_ids]
+        return [tagged_with(*tag_ids)]
+
+    @staticmethod
+    async def count_tagged(db: AsyncSession, user_id: int, names: List[str], match_all: bool) -> int:
+        """
+        Number of live items matching a tag filter
+
+        A single tag is answered from its item_count; several tags are
+        counted on the (tag_id, item_id) index without touching the items
+        (assignments of deleted items are removed with them).
+
+        Args:
+            db: Database session
+            user_id: User ID
+            names: Tag names to filter by
+            match_all: Require all tags (AND) instead of any of them (OR)
+
+        Returns:
+            Number of matching items
+        """
+        names = normalize_tags(names)
+        result = await db.execute(
+            select(UserLibraryTag.id, UserLibraryTag.item_count)
+            .where(UserLibraryTag.user_id == user_id, UserLibraryTag.name.in_(names))
+        )
+        counts = dict(result.all())
+
+        if not counts or (match_all and len(counts) < len(names)):
+            return 0
+        if len(counts) == 1:
+            return max(next(iter(counts.values())), 0)
+
+        matching = (
+            select(UserLibraryItemTag.item_id)
+            .where(UserLibraryItemTag.tag_id.in_(counts))
+            .group_by(UserLibraryItemTag.item_id)
+        )
+        if match_all:
+            matching = matching.having(func.count() == len(counts))
+        return await db.scalar(select(func.count()).select_from(matching.subquery()))
+
+# Create a singleton instance
+library_tag_service = LibraryTagService()
@@ -0,0 +1,481 @@
+"""
+Prompt Catalog Service
+
+Users' own prompts (the prompts, tags and prompt_tags tables) and the
+shared catalog built from the prompts marked is_shared.
+
+The shared feed is read far more often than it changes, so every instance
+serves it from an immutable in-process snapshot: the shared prompts in
+feed order (created_at DESC, id DESC) plus one pre-sorted list per tag.
+Keyset pages and tag-filtered pages are bisections of those lists, so
+feed requests never touch the database.
+
+The snapshot is refreshed in the background once it is older than
+CATALOG_REFRESH_INTERVAL seconds. A refresh only fetches the prompts
+changed since the last one (via the change-time index) and compares the
+number of shared prompts with the database to notice deletions, falling
+back to a full reload then and every CATALOG_FULL_REFRESH_INTERVAL
+seconds. Writes through this service refresh the local snapshot right
+away; other instances pick them up on their next refresh.
+
+Each snapshot carries a fingerprint of its contents (prompt IDs, change
+times and tags), which the feed ETags are built from: instances holding
+the same shared prompts answer with the same ETag.
+"""
+
+import time
+import hashlib
+import asyncio
+import logging
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, engine, replica_router
+from app.core.metrics import registry
+from app.core.pagination import apply_keyset, decode_cursor, encode_cursor, paginate
+from app.core.tags import normalize_tag
+from app.models.models import Prompt, PromptTag, Tag
+
+logger = logging.getLogger(__name__)
+
+CATALOG_REFRESHES = registry.counter(
+    "catalog_refreshes",
+    "Incremental refreshes of the shared catalog snapshot"
+)
+CATALOG_FULL_RELOADS = registry.counter(
+    "catalog_full_reloads",
+    "Full reloads of the shared catalog snapshot"
+)
+
+PROMPT_COLUMNS = (
+    Prompt.id,
+    Prompt.title,
+    Prompt.description,
+    Prompt.content,
+    Prompt.is_shared,
+    Prompt.meta_data,
+    Prompt.owner_id,
+    Prompt.created_at,
+    Prompt.updated_at,
+)
+
+# Last change time of a prompt; matches the expression index ix_prompts_changed_at
+CHANGED_AT = func.coalesce(Prompt.updated_at, Prompt.created_at)
+
+def _feed_key(created_at: datetime, prompt_id: int) -> Tuple[float, int]:
+    # Ascending order of this key is the feed order (created_at DESC, id DESC)
+    return (-created_at.timestamp(), -prompt_id)
+
+def _fingerprint(prompts: Dict[int, Dict[str, Any]]) -> str:
+    """
+    Hash of the (id, change time, tags) of the prompts, independent of the instance
+    """
+    digest = hashlib.blake2b(digest_size=12)
+    for prompt_id in sorted(prompts):
+        prompt = prompts[prompt_id]
+        # Every write moves updated_at, so the change time covers the content
+        changed_at = prompt["updated_at"] or prompt["created_at"]
+        digest.update(f"{prompt_id}|{changed_at.timestamp()}|{','.join(prompt['tags'])}\n".encode())
+    return digest.hexdigest()
+
+class SharedFeedSnapshot:
+    """
+    Immutable view of the shared prompts, indexed for keyset pagination
+    """
+    __slots__ = ("prompts", "fingerprint", "keys", "ordered", "tags")
+
+    def __init__(self, prompts: Dict[int, Dict[str, Any]]):
+        self.prompts = prompts
+        self.fingerprint = _fingerprint(prompts)
+        self.ordered = sorted(prompts.values(), key=lambda prompt: _feed_key(prompt["created_at"], prompt["id"]))
+        self.keys = [_feed_key(prompt["created_at"], prompt["id"]) for prompt in self.ordered]
+
+        by_tag: Dict[str, List[Dict[str, Any]]] = {}
+        for prompt in self.ordered:
+            for tag in prompt["tags"]:
+                by_tag.setdefault(tag, []).append(prompt)
+        self.tags = {
+            tag: ([_feed_key(prompt["created_at"], prompt["id"]) for prompt in prompts], prompts)
+            for tag, prompts in by_tag.items()
+        }
+
+    def page(self, limit: int, cursor: Optional[str] = None, tag: Optional[str] = None
+             ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        One page of the feed, optionally restricted to a tag
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        if tag is None:
+            keys, prompts = self.keys, self.ordered
+        else:
+            keys, prompts = self.tags.get(normalize_tag(tag), ([], []))
+
+        start = 0
+        if cursor:
+            start = bisect_right(keys, _feed_key(*decode_cursor(cursor)))
+
+        page = prompts[start:start + limit]
+        next_cursor = None
+        if start + limit < len(prompts):
+            next_cursor = encode_cursor(page[-1]["created_at"], page[-1]["id"])
+        return page, next_cursor
+
+    def tag_counts(self) -> List[Dict[str, Any]]:
+        """
+        Tags of the shared prompts with their number of prompts, most used first
+        """
+        counts = [{"name": tag, "count": len(prompts)} for tag, (_, prompts) in self.tags.items()]
+        return sorted(counts, key=lambda tag: (-tag["count"], tag["name"]))
+
+class PromptCatalogService:
+    """
+    Service for user prompts and the shared prompt catalog
+    """
+
+    def __init__(self):
+        self.snapshot: Optional[SharedFeedSnapshot] = None
+        self._watermark: Optional[datetime] = None
+        self._refreshed_at = 0.0
+        self._reloaded_at = 0.0
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    # Shared feed
+
+    async def get_snapshot(self) -> SharedFeedSnapshot:
+        """
+        Current snapshot of the shared feed
+
+        Loads it on first use; afterwards a stale snapshot is served while a
+        background refresh runs.
+        """
+        if self.snapshot is None:
+            await self.refresh()
+        elif time.monotonic() - self._refreshed_at > settings.CATALOG_REFRESH_INTERVAL:
+            self._schedule_refresh()
+        return self.snapshot
+
+    def _schedule_refresh(self, use_primary: bool = False) -> None:
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_in_background(use_primary))
+
+    async def _refresh_in_background(self, use_primary: bool) -> None:
+        try:
+            await self.refresh(use_primary=use_primary)
+        except Exception as e:
+            # Keep serving the current snapshot; the next request retries
+            logger.warning(f"Shared catalog refresh failed: {str(e)}")
+
+    async def refresh(self, full: bool = False, use_primary: bool = False) -> SharedFeedSnapshot:
+        """
+        Bring the snapshot up to date
+
+        Args:
+            full: Reload all shared prompts instead of only the changed ones
+            use_primary: Read from the primary even if a replica is available
+
+        Returns:
+            The new snapshot
+        """
+        async with self._lock:
+            full = (
+                full
+                or self.snapshot is None
+                or time.monotonic() - self._reloaded_at > settings.CATALOG_FULL_REFRESH_INTERVAL
+            )
+            bind = engine if use_primary else (await replica_router.pick() or engine)
+            async with AsyncSessionLocal(bind=bind) as db:
+                if not full and await self._apply_changes(db):
+                    CATALOG_REFRESHES.inc()
+                else:
+                    await self._reload(db)
+                    CATALOG_FULL_RELOADS.inc()
+            self._refreshed_at = time.monotonic()
+            return self.snapshot
+
+    async def _reload(self, db: AsyncSession) -> None:
+        result = await db.execute(select(*PROMPT_COLUMNS).where(Prompt.is_shared))
+        prompts = {row.id: dict(row._mapping) for row in result}
+        await self._attach_tags(db, prompts)
+
+        # The watermark covers all prompts, so later refreshes also see
+        # prompts that are shared or unshared after this reload
+        self._watermark = await db.scalar(select(func.max(CHANGED_AT)))
+        if self.snapshot is None or self.snapshot.prompts != prompts:
+            self.snapshot = SharedFeedSnapshot(prompts)
+        self._reloaded_at = time.monotonic()
+        logger.info(f"Loaded shared catalog snapshot: {len(prompts)} prompts, fingerprint {self.snapshot.fingerprint}")
+
+    async def _apply_changes(self, db: AsyncSession) -> bool:
+        """
+        Apply the prompts changed since the watermark to the snapshot
+
+        Returns:
+            False when a full reload is needed (prompts were deleted)
+        """
+        query = select(*PROMPT_COLUMNS)
+        if self._watermark is not None:
+            # Re-read a window before the watermark: rows stamped earlier may
+            # have committed after the previous refresh
+            overlap = timedelta(seconds=settings.CATALOG_REFRESH_OVERLAP)
+            query = query.where(CHANGED_AT > self._watermark - overlap)
+        result = await db.execute(query)
+        changed = {row.id: dict(row._mapping) for row in result}
+
+        shared = {prompt_id: prompt for prompt_id, prompt in changed.items() if prompt["is_shared"]}
+        await self._attach_tags(db, shared)
+
+        prompts = dict(self.snapshot.prompts)
+        for prompt_id, prompt in changed.items():
+            if prompt_id in shared:
+                prompts[prompt_id] = prompt
+            else:
+                prompts.pop(prompt_id, None)
+
+        shared_count = await db.scalar(
+            select(func.count()).select_from(Prompt).where(Prompt.is_shared)
+        )
+        if shared_count != len(prompts):
+            return False
+
+        for prompt in changed.values():
+            changed_at = prompt["updated_at"] or prompt["created_at"]
+            if self._watermark is None or changed_at > self._watermark:
+                self._watermark = changed_at
+
+        if prompts != self.snapshot.prompts:
+            self.snapshot = SharedFeedSnapshot(prompts)
+        return True
+
+    @staticmethod
+    async def _attach_tags(db: AsyncSession, prompts: Dict[int, Dict[str, Any]]) -> None:
+        """
+        Set the sorted tag names of each prompt, with one query
+        """
+        for prompt in prompts.values():
+            prompt["tags"] = []
+        if not prompts:
+            return
+
+        result = await db.execute(
+            select(PromptTag.prompt_id, Tag.name)
+            .join(Tag, Tag.id == PromptTag.tag_id)
+            .where(PromptTag.prompt_id.in_(prompts.keys()))
+            .order_by(Tag.name)
+        )
+        for prompt_id, name in result:
+            prompts[prompt_id]["tags"].append(name)
+
+    # User prompts
+
+    @staticmethod
+    async def _get_or_create_tags(db: AsyncSession, names: Iterable[str]) -> List[Tag]:
+        """
+        Tags with the given names, creating the missing ones
+        """
+        names = sorted({normalize_tag(name) for name in names if name and name.strip()})
+        if not names:
+            return []
+
+        existing = {tag.name for tag in (await db.scalars(select(Tag).where(Tag.name.in_(names)))).all()}
+        for name in names:
+            if name in existing:
+                continue
+            try:
+                # A concurrent request may create the same tag
+                async with db.begin_nested():
+                    db.add(Tag(name=name))
+            except IntegrityError:
+                pass
+
+        return list((await db.scalars(select(Tag).where(Tag.name.in_(names)))).all())
+
+    @staticmethod
+    async def _set_tags(db: AsyncSession, prompt_id: int, names: Iterable[str]) -> List[str]:
+        tags = await PromptCatalogService._get_or_create_tags(db, names)
+        await db.execute(delete(PromptTag).where(PromptTag.prompt_id == prompt_id))
+        for tag in tags:
+            db.add(PromptTag(prompt_id=prompt_id, tag_id=tag.id))
+        return sorted(tag.name for tag in tags)
+
+    @staticmethod
+    def _prompt_to_dict(prompt: Prompt, tags: List[str]) -> Dict[str, Any]:
+        return {
+            "id": prompt.id,
+            "title": prompt.title,
+            "description": prompt.description,
+            "content": prompt.content,
+            "is_shared": bool(prompt.is_shared),
+            "meta_data": prompt.meta_data,
+            "owner_id": prompt.owner_id,
+            "tags": tags,
+            "created_at": prompt.created_at,
+            "updated_at": prompt.updated_at
+        }
+
+    def _after_write(self, was_shared: bool, is_shared: bool) -> None:
+        # Make the change visible in this instance's feed right away
+        if (was_shared or is_shared) and self.snapshot is not None:
+            self._schedule_refresh(use_primary=True)
+
+    async def list_user_prompts(self, db: AsyncSession, owner_id: int, limit: int = 100,
+                                cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Get the user's own prompts, newest first
+
+        Args:
+            db: Database session
+            owner_id: User ID
+            limit: Maximum number of prompts to return
+            cursor: Keyset cursor returned with the previous page
+
+        Returns:
+            Tuple of (prompts, next_cursor)
+        """
+        query = select(*PROMPT_COLUMNS).where(Prompt.owner_id == owner_id)
+        query = apply_keyset(query, Prompt.created_at, Prompt.id, cursor, limit)
+        rows, next_cursor = paginate((await db.execute(query)).all(), limit)
+
+        prompts = {row.id: dict(row._mapping) for row in rows}
+        await self._attach_tags(db, prompts)
+        return list(prompts.values()), next_cursor
+
+    async def get_prompt(self, db: AsyncSession, prompt_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Get a prompt owned by the user or shared by anyone
+
+        Other users' shared prompts are served from the snapshot; owners
+        always read their own prompts from the database.
+        """
+        snapshot = await self.get_snapshot()
+        shared = snapshot.prompts.get(prompt_id)
+        if shared is not None and shared["owner_id"] != user_id:
+            return shared
+
+        row = (await db.execute(
+            select(*PROMPT_COLUMNS).where(Prompt.id == prompt_id, Prompt.owner_id == user_id)
+        )).first()
+        if row is None and shared is not None:
+            return shared
+        if row is None:
+            return None
+
+        prompts = {row.id: dict(row._mapping)}
+        await self._attach_tags(db, prompts)
+        return prompts[row.id]
+
+    async def create_prompt(self, db: AsyncSession, data: Any, owner_id: int) -> Dict[str, Any]:
+        """
+        Create a prompt with its tags
+
+        Args:
+            db: Database session
+            data: PromptCreate
+            owner_id: User ID
+
+        Returns:
+            Created prompt
+        """
+        try:
+            prompt = Prompt(
+                title=data.title,
+                description=data.description,
+                content=data.content,
+                is_shared=data.is_shared,
+                meta_data=data.meta_data,
+                owner_id=owner_id
+            )
+            db.add(prompt)
+            await db.flush()
+            tags = await self._set_tags(db, prompt.id, data.tags or [])
+            await db.commit()
+            await db.refresh(prompt)
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Error creating prompt: {str(e)}")
+            raise
+
+        self._after_write(False, prompt.is_shared)
+        return self._prompt_to_dict(prompt, tags)
+
+    async def update_prompt(self, db: AsyncSession, prompt_id: int, data: Any, owner_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Update one of the user's prompts
+
+        Args:
+            db: Database session
+            prompt_id: Prompt ID
+            data: PromptUpdate; tags, when given, replace the current tags
+            owner_id: User ID
+
+        Returns:
+            Updated prompt or None if not found
+        """
+        try:
+            prompt = (await db.scalars(
+                select(Prompt).where(Prompt.id == prompt_id, Prompt.owner_id == owner_id)
+            )).first()
+            if prompt is None:
+                return None
+
+            was_shared = bool(prompt.is_shared)
+            update_data = data.model_dump(exclude_unset=True, exclude={"tags"})
+            for key, value in update_data.items():
+                setattr(prompt, key, value)
+            # Always move the change time, also for tag-only updates, so that
+            # catalog refreshes pick the prompt up
+            prompt.updated_at = func.now()
+
+            if data.tags is not None:
+                tags = await self._set_tags(db, prompt.id, data.tags)
+            await db.commit()
+            await db.refresh(prompt)
+
+            if data.tags is None:
+                prompts = {prompt.id: {}}
+                await self._attach_tags(db, prompts)
+                tags = prompts[prompt.id]["tags"]
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Error updating prompt: {str(e)}")
+            raise
+
+        self._after_write(was_shared, prompt.is_shared)
+        return self._prompt_to_dict(prompt, tags)
+
+    async def delete_prompt(self, db: AsyncSession, prompt_id: int, owner_id: int) -> bool:
+        """
+        Delete one of the user's prompts and its tag links
+
+        Returns:
+            True if deleted, False if not found
+        """
+        try:
+            prompt = (await db.scalars(
+                select(Prompt).where(Prompt.id == prompt_id, Prompt.owner_id == owner_id)
+            )).first()
+            if prompt is None:
+                return False
+
+            was_shared = bool(prompt.is_shared)
+            await db.execute(delete(PromptTag).where(PromptTag.prompt_id == prompt_id))
+            await db.delete(prompt)
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Error deleting prompt: {str(e)}")
+            raise
+
+        self._after_write(was_shared, False)
+        return True
+
+# Create a singleton instance
+prompt_catalog_service = PromptCatalogService()
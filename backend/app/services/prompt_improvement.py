@@ -3,10 +3,14 @@ import json
 import logging
 import asyncio
 from typing import Optional
-from anthropic import Anthropic
 from app.core.config import settings
-from app.models.models import PromptHistory
-from app.core.database import SessionLocal
+from app.core.http_clients import get_async_http_client
+from app.models.models import PromptHistory, PromptText, User
+from app.core.pagination import apply_keyset, paginate
+from app.core.projection import make_preview, preview_column
+from app.services.prompt_texts import prompt_text_service
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
 logger = logging.getLogger(__name__)
 
@@ -70,16 +74,30 @@ Remember, the goal is to create a substantially better version of the original p
 
 class PromptImprovementService:
     def __init__(self):
-        self.client = Anthropic(api_key=settings.CLAUDE_API_KEY)
+        self._client = None
         self.model = settings.CLAUDE_MODEL
     
-    async def improve_prompt(self, original_prompt: str, title: Optional[str] = None, 
+    @property
+    def client(self):
+        """
+        Anthropic client, imported and constructed on first use to keep cold starts fast
+        """
+        if self._client is None:
+            from anthropic import AsyncAnthropic
+            self._client = AsyncAnthropic(
+                api_key=settings.CLAUDE_API_KEY,
+                http_client=get_async_http_client()
+            )
+        return self._client
+    
+    async def improve_prompt(self, db: AsyncSession, original_prompt: str, title: Optional[str] = None, 
                            description: Optional[str] = None, url: Optional[str] = None, 
                            user_id: Optional[int] = None) -> str:
         """
         Improve a prompt using Claude API and save to history
         
         Args:
+            db: Request-scoped database session
             original_prompt: The original prompt to improve
             title: Optional title of the prompt
             description: Optional description of the prompt
@@ -90,11 +108,15 @@ class PromptImprovementService:
             The improved prompt
         """
         try:
+            # End the current read transaction so the pooled connection is
+            # returned while waiting on Claude; the session reconnects on save
+            await db.commit()
+            
             # Prepare the meta-prompt with the original prompt
             meta_prompt = META_PROMPT_TEMPLATE.replace("{{prompt}}", original_prompt)
             
             # Call Claude API
-            response = self.client.messages.create(
+            response = await self.client.messages.create(
                 model=self.model,
                 max_tokens=4000,
                 temperature=0.7,
@@ -117,7 +139,7 @@ class PromptImprovementService:
                 description = self._extract_description(response_text)
             
             # Save to history
-            self._save_to_history(original_prompt, improved_prompt, title, description, url, user_id)
+            await self._save_to_history(db, original_prompt, improved_prompt, title, description, url, user_id)
             
             return improved_prompt
         
@@ -184,13 +206,17 @@ class PromptImprovementService:
             logger.warning("Could not extract description from response")
             return None
     
-    def _save_to_history(self, original_prompt: str, improved_prompt: str, 
+    async def _save_to_history(self, db: AsyncSession, original_prompt: str, improved_prompt: str, 
                         title: Optional[str] = None, description: Optional[str] = None,
                         url: Optional[str] = None, user_id: Optional[int] = None) -> None:
         """
         Save the original and improved prompts to history
         
+        The improved prompt goes to the shared text store, so saving it to
+        the library later references the same copy.
+        
         Args:
+            db: Request-scoped database session
             original_prompt: The original prompt
             improved_prompt: The improved prompt
             title: Optional title of the prompt
@@ -199,69 +225,98 @@ class PromptImprovementService:
             user_id: Optional user ID
         """
         try:
-            # Create a new database session
-            db = SessionLocal()
+            # Create a new history entry
+            history_entry = PromptHistory(
+                title=title,
+                description=description,
+                original_prompt=original_prompt,
+                improved_hash=await prompt_text_service.store(db, improved_prompt),
+                url=url,
+                user_id=user_id
+            )
             
-            try:
-                # Create a new history entry
-                history_entry = PromptHistory(
-                    title=title,
-                    description=description,
-                    original_prompt=original_prompt,
-                    improved_prompt=improved_prompt,
-                    url=url,
-                    user_id=user_id
+            # Add to database and commit (the primary key is populated on flush);
+            # the user's history version changes in the same transaction
+            db.add(history_entry)
+            if user_id is not None:
+                await db.execute(
+                    update(User)
+                    .where(User.id == user_id)
+                    .values(history_version=User.history_version + 1)
+                    .execution_options(synchronize_session=False)
                 )
-                
-                # Add to database and commit
-                db.add(history_entry)
-                db.commit()
-                db.refresh(history_entry)
-                
-                logger.info(f"Saved prompt history entry with ID: {history_entry.id}")
-            finally:
-                # Close the database session
-                db.close()
+            await db.commit()
+            
+            logger.info(f"Saved prompt history entry with ID: {history_entry.id}")
         except Exception as e:
+            await db.rollback()
             logger.error(f"Error saving to history: {str(e)}")
             # Don't raise the exception to avoid breaking the main functionality
     
-    async def get_history(self, skip: int = 0, limit: int = 100, user_id: Optional[int] = None) -> tuple:
+    async def get_history(self, db: AsyncSession, skip: int = 0, limit: int = 100, user_id: Optional[int] = None,
+                          cursor: Optional[str] = None, include_total: bool = True, summary: bool = False) -> tuple:
         """
-        Get prompt improvement history
+        Get prompt improvement history, newest first
         
         Args:
-            skip: Number of records to skip
+            db: Request-scoped database session
+            skip: Number of records to skip (ignored when a cursor is given)
             limit: Maximum number of records to return
             user_id: Optional user ID to filter by
+            cursor: Keyset cursor returned with the previous page
+            include_total: Whether to count all matching records
+            summary: Return PromptHistorySummary dicts (prompt previews only)
+                instead of PromptHistory rows
             
         Returns:
-            Tuple of (history_items, total_count)
+            Tuple of (history_items, total_count, next_cursor); total_count is
+            None when include_total is False
         """
         try:
-            # Create a new database session
-            db = SessionLocal()
+            # Filter by user_id if provided
+            conditions = [PromptHistory.user_id == user_id] if user_id is not None else []
+            
+            # Get total count only when asked for
+            total = None
+            if include_total:
+                total = await db.scalar(
+                    select(func.count()).select_from(PromptHistory).filter(*conditions)
+                )
+            
+            if summary:
+                query = select(
+                    PromptHistory.id,
+                    PromptHistory.title,
+                    PromptHistory.description,
+                    PromptHistory.url,
+                    PromptHistory.user_id,
+                    PromptHistory.created_at,
+                    preview_column(PromptHistory.original_prompt, "original_preview"),
+                    preview_column(PromptText.content, "improved_preview")
+                ).join(
+                    PromptText, PromptText.hash == PromptHistory.improved_hash
+                ).filter(*conditions)
+            else:
+                query = select(PromptHistory).filter(*conditions)
+            
+            # Get history items
+            query = apply_keyset(query, PromptHistory.created_at, PromptHistory.id, cursor, limit)
+            if not cursor and skip:
+                query = query.offset(skip)
+            result = await db.execute(query)
+            
+            if not summary:
+                history, next_cursor = paginate(result.scalars().all(), limit)
+                return history, total, next_cursor
             
-            try:
-                # Create base query
-                query = db.query(PromptHistory)
-                
-                # Filter by user_id if provided
-                if user_id is not None:
-                    query = query.filter(PromptHistory.user_id == user_id)
-                
-                # Get total count
-                total = query.count()
-                
-                # Get history items
-                history = query.order_by(
-                    PromptHistory.created_at.desc()
-                ).offset(skip).limit(limit).all()
-                
-                return history, total
-            finally:
-                # Close the database session
-                db.close()
+            rows, next_cursor = paginate(result.all(), limit)
+            history = []
+            for row in rows:
+                entry = row._asdict()
+                entry["original_preview"], entry["original_truncated"] = make_preview(entry["original_preview"])
+                entry["improved_preview"], entry["improved_truncated"] = make_preview(entry["improved_preview"])
+                history.append(entry)
+            return history, total, next_cursor
         except Exception as e:
             logger.error(f"Error getting history: {str(e)}")
             raise
@@ -0,0 +1,170 @@
+"""
+Prompt Text Service
+
+Content-addressed storage of long prompt texts. Library item contents and
+the improved prompts of history entries are stored once per distinct text
+in prompt_texts, keyed by the SHA-256 of the UTF-8 content, and referenced
+by hash: saving a history entry to the library, or saving the same prompt
+again, adds a reference instead of another copy. Reads load the text with
+the referencing row through one join.
+
+Texts are never updated. Unreferenced texts (after library edits, or once
+history partitions are dropped) are deleted by purge_unreferenced, which
+the history retention job runs.
+"""
+
+import hashlib
+import logging
+from typing import Dict, Iterable, List
+
+from sqlalchemy import delete, exists, func, select, union_all
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.models.models import PromptHistory, PromptText, UserLibrary
+
+logger = logging.getLogger(__name__)
+
+def content_hash(content: str) -> bytes:
+    """
+    Key of a text in prompt_texts
+    """
+    return hashlib.sha256(content.encode("utf-8")).digest()
+
+class PromptTextService:
+    """
+    Service for storing, deduplicating and collecting prompt texts
+    """
+
+    @staticmethod
+    async def store_many(db: AsyncSession, contents: Iterable[str]) -> List[bytes]:
+        """
+        Make sure the texts exist in prompt_texts, inside the caller's transaction
+
+        Existing texts are locked with FOR KEY SHARE until the caller commits,
+        so purge_unreferenced cannot delete them before the new references
+        are written; missing texts are inserted with one statement.
+
+        Args:
+            db: Database session
+            contents: Texts to store
+
+        Returns:
+            The hash of each text, in input order
+        """
+        contents = list(contents)
+        hashes = [content_hash(content) for content in contents]
+        texts: Dict[bytes, str] = dict(zip(hashes, contents))
+        if not texts:
+            return hashes
+
+        result = await db.execute(
+            select(PromptText.hash)
+            .where(PromptText.hash.in_(texts))
+            .with_for_update(key_share=True)
+        )
+        existing = set(result.scalars().all())
+
+        missing = [
+            {"hash": key, "content": content, "size": len(content.encode("utf-8"))}
+            for key, content in texts.items() if key not in existing
+        ]
+        if missing:
+            await db.execute(
+                pg_insert(PromptText).on_conflict_do_nothing(index_elements=[PromptText.hash]),
+                missing
+            )
+        return hashes
+
+    @staticmethod
+    async def store(db: AsyncSession, content: str) -> bytes:
+        """
+        Make sure one text exists in prompt_texts (see store_many)
+
+        Returns:
+            The hash of the text
+        """
+        return (await PromptTextService.store_many(db, [content]))[0]
+
+    @staticmethod
+    async def get_storage_stats(db: AsyncSession, user_id: int) -> Dict[str, int]:
+        """
+        How much text storage deduplication saves for a user
+
+        Counts the references from the user's live library items and history
+        entries against the distinct texts they point to.
+
+        Args:
+            db: Database session
+            user_id: User ID
+
+        Returns:
+            Dict with references, texts, referenced_bytes (size without
+            deduplication), stored_bytes and saved_bytes
+        """
+        references = union_all(
+            select(UserLibrary.content_hash.label("hash"))
+            .where(UserLibrary.user_id == user_id, UserLibrary.deleted_at.is_(None)),
+            select(PromptHistory.improved_hash.label("hash"))
+            .where(PromptHistory.user_id == user_id)
+        ).subquery()
+
+        referenced = (await db.execute(
+            select(func.count(), func.coalesce(func.sum(PromptText.size), 0))
+            .select_from(references)
+            .join(PromptText, PromptText.hash == references.c.hash)
+        )).one()
+        stored = (await db.execute(
+            select(func.count(), func.coalesce(func.sum(PromptText.size), 0))
+            .where(PromptText.hash.in_(select(references.c.hash)))
+        )).one()
+
+        return {
+            "references": referenced[0],
+            "texts": stored[0],
+            "referenced_bytes": referenced[1],
+            "stored_bytes": stored[1],
+            "saved_bytes": referenced[1] - stored[1],
+        }
+
+    @staticmethod
+    async def purge_unreferenced(engine: AsyncEngine, batch_size: int = 5000, dry_run: bool = False) -> int:
+        """
+        Delete the texts no library item or history entry references
+
+        Deletes in batches, each in its own transaction. Texts locked by a
+        concurrent store_many are skipped and looked at again next time.
+
+        Args:
+            engine: Database engine
+            batch_size: Number of texts deleted per transaction
+            dry_run: Only count the texts that would be deleted
+
+        Returns:
+            Number of texts deleted (or that would be deleted)
+        """
+        unreferenced = select(PromptText.hash).where(
+            ~exists().where(UserLibrary.content_hash == PromptText.hash),
+            ~exists().where(PromptHistory.improved_hash == PromptText.hash)
+        )
+
+        if dry_run:
+            async with engine.connect() as connection:
+                return await connection.scalar(select(func.count()).select_from(unreferenced.subquery()))
+
+        deleted = 0
+        while True:
+            async with engine.begin() as connection:
+                batch = unreferenced.limit(batch_size).with_for_update(skip_locked=True)
+                result = await connection.execute(
+                    delete(PromptText).where(PromptText.hash.in_(batch))
+                )
+            deleted += result.rowcount
+            if result.rowcount < batch_size:
+                break
+
+        logger.info(f"Deleted {deleted} unreferenced prompt texts")
+        return deleted
+
+# Create a singleton instance
+prompt_text_service = PromptTextService()
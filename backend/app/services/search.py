@@ -0,0 +1,181 @@
+"""
+Search Service
+
+Full-text search over the user library and the improvement history,
+backed by the trigger-maintained search_vector columns and their GIN
+indexes (PostgreSQL only).
+
+Matches are ranked with ts_rank_cd. Snippets are produced by ts_headline,
+which is expensive, so it only runs on the rows of the requested page.
+Snippets are HTML-escaped, with highlighted terms wrapped in
+HIGHLIGHT_START / HIGHLIGHT_STOP: ts_headline marks matches with control
+characters that are removed from the text beforehand, and the markers
+are replaced after escaping, so stored markup never reaches the client
+as HTML.
+"""
+
+import html
+import logging
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.models import SEARCH_CONFIG, PromptHistory, PromptText, UserLibrary
+
+logger = logging.getLogger(__name__)
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_STOP = "</mark>"
+
+# Match markers of ts_headline; stripped from the text first, so they
+# cannot come from the user's text
+MATCH_START = "\x02"
+MATCH_STOP = "\x03"
+
+# ts_headline options: up to two fragments of about 10-25 words each
+HEADLINE_OPTIONS = (
+    f"StartSel=\"{MATCH_START}\", StopSel=\"{MATCH_STOP}\", "
+    "MaxWords=25, MinWords=10, MaxFragments=2, FragmentDelimiter=\" … \""
+)
+
+# Snippet columns of the search results
+SNIPPETS = ("title_highlight", "snippet", "original_snippet", "improved_snippet")
+
+def _headline(column, tsquery):
+    text = func.translate(func.coalesce(column, ""), MATCH_START + MATCH_STOP, "")
+    return func.ts_headline(SEARCH_CONFIG, text, tsquery, HEADLINE_OPTIONS)
+
+def _highlight(snippet: str) -> str:
+    """
+    HTML-escaped snippet with the matched terms wrapped in HIGHLIGHT_START / HIGHLIGHT_STOP
+    """
+    return html.escape(snippet).replace(MATCH_START, HIGHLIGHT_START).replace(MATCH_STOP, HIGHLIGHT_STOP)
+
+def _result(row) -> Dict[str, Any]:
+    result = dict(row)
+    for key in SNIPPETS:
+        if key in result:
+            result[key] = _highlight(result[key])
+    return result
+
+class SearchService:
+    """
+    Service for full-text search over library items and history entries
+    """
+
+    @staticmethod
+    async def search_library(
+        db: AsyncSession,
+        user_id: int,
+        query: str,
+        skip: int = 0,
+        limit: int = 20
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Search the user's library by title, description and content
+
+        Title matches rank above description matches, which rank above
+        content matches.
+
+        Args:
+            db: Database session
+            user_id: User ID
+            query: Search text in web search syntax ("quoted phrases", or, -excluded)
+            skip: Number of results to skip
+            limit: Maximum number of results to return
+
+        Returns:
+            Tuple of (results, has_more)
+        """
+        tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, query)
+        rank = func.ts_rank_cd(UserLibrary.search_vector, tsquery)
+
+        # Rank and page on the index alone, then build snippets for the page
+        ranked = (
+            select(UserLibrary.id, rank.label("rank"))
+            .where(
+                UserLibrary.user_id == user_id,
+                UserLibrary.deleted_at.is_(None),
+                UserLibrary.search_vector.op("@@")(tsquery)
+            )
+            .order_by(rank.desc(), UserLibrary.id.desc())
+            .offset(skip)
+            .limit(limit + 1)
+            .subquery()
+        )
+        statement = (
+            select(
+                UserLibrary.id,
+                UserLibrary.title,
+                UserLibrary.description,
+                UserLibrary.icon_id,
+                UserLibrary.color_id,
+                UserLibrary.created_at,
+                ranked.c.rank,
+                _headline(UserLibrary.title, tsquery).label("title_highlight"),
+                _headline(PromptText.content, tsquery).label("snippet"),
+            )
+            .join(ranked, ranked.c.id == UserLibrary.id)
+            .join(PromptText, PromptText.hash == UserLibrary.content_hash)
+            .order_by(ranked.c.rank.desc(), UserLibrary.id.desc())
+        )
+
+        rows = (await db.execute(statement)).mappings().all()
+        logger.info(f"Library search for user_id={user_id} returned {len(rows)} rows")
+        return [_result(row) for row in rows[:limit]], len(rows) > limit
+
+    @staticmethod
+    async def search_history(
+        db: AsyncSession,
+        user_id: int,
+        query: str,
+        skip: int = 0,
+        limit: int = 20
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Search the user's improvement history by original and improved prompt
+
+        Args:
+            db: Database session
+            user_id: User ID
+            query: Search text in web search syntax ("quoted phrases", or, -excluded)
+            skip: Number of results to skip
+            limit: Maximum number of results to return
+
+        Returns:
+            Tuple of (results, has_more)
+        """
+        tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, query)
+        rank = func.ts_rank_cd(PromptHistory.search_vector, tsquery)
+
+        ranked = (
+            select(PromptHistory.id, PromptHistory.created_at, rank.label("rank"))
+            .where(PromptHistory.user_id == user_id, PromptHistory.search_vector.op("@@")(tsquery))
+            .order_by(rank.desc(), PromptHistory.id.desc())
+            .offset(skip)
+            .limit(limit + 1)
+            .subquery()
+        )
+        statement = (
+            select(
+                PromptHistory.id,
+                PromptHistory.title,
+                PromptHistory.url,
+                PromptHistory.created_at,
+                ranked.c.rank,
+                _headline(PromptHistory.original_prompt, tsquery).label("original_snippet"),
+                _headline(PromptText.content, tsquery).label("improved_snippet"),
+            )
+            # Joining on the full primary key lets each lookup prune to one partition
+            .join(ranked, (ranked.c.id == PromptHistory.id) & (ranked.c.created_at == PromptHistory.created_at))
+            .join(PromptText, PromptText.hash == PromptHistory.improved_hash)
+            .order_by(ranked.c.rank.desc(), PromptHistory.id.desc())
+        )
+
+        rows = (await db.execute(statement)).mappings().all()
+        logger.info(f"History search for user_id={user_id} returned {len(rows)} rows")
+        return [_result(row) for row in rows[:limit]], len(rows) > limit
+
+# Create a singleton instance
+search_service = SearchService()
@@ -0,0 +1,384 @@
+"""
+Stripe Event Service
+
+Stripe webhooks are acknowledged as soon as the verified event is stored
+in stripe_events; the payment status updates they carry are applied
+afterwards by a worker, so webhook latency does not depend on Stripe API
+calls and the database work they trigger.
+
+- Events are keyed by their Stripe ID, so redeliveries are stored once
+  and applied at most once.
+- Events of one customer are applied in the order Stripe created them:
+  an event waits while an earlier event of its customer is pending, and
+  an event that arrives after a later one was applied is skipped as
+  superseded.
+- An event is applied and marked processed in one transaction. Failures
+  are retried with exponential backoff, up to STRIPE_EVENT_MAX_ATTEMPTS.
+- Subscription events find their user by users.stripe_customer_id, which
+  is set when the user's checkout completes; only customers no user is
+  linked to are looked up in the Stripe API (by email, cached).
+
+Events are claimed with FOR UPDATE SKIP LOCKED, so workers of several
+instances can run at the same time.
+"""
+
+import json
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import exists, func, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.metrics import registry
+from app.models.models import StripeEvent, User
+
+logger = logging.getLogger(__name__)
+
+EVENTS_RECEIVED = registry.counter("stripe_events_received", "Stripe webhook events stored")
+EVENTS_DUPLICATE = registry.counter("stripe_events_duplicate", "Stripe webhook events delivered again and ignored")
+EVENTS_PROCESSED = registry.counter("stripe_events_processed", "Stripe events applied or skipped as superseded")
+EVENT_FAILURES = registry.counter("stripe_event_failures", "Failed attempts to apply a Stripe event")
+
+# Backoff of failed events: RETRY_BASE_DELAY * 2^(attempts - 1), at most RETRY_MAX_DELAY
+RETRY_BASE_DELAY = 30
+RETRY_MAX_DELAY = 3600
+
+# Subscription statuses that grant the paid plan
+PAID_SUBSCRIPTION_STATUSES = ("active", "trialing")
+
+# Emails of Stripe customers unknown locally, fetched from the Stripe API
+CUSTOMER_CACHE_TTL = 3600  # Seconds
+CUSTOMER_CACHE_SIZE = 10000
+
+CUSTOMER_API_LOOKUPS = registry.counter(
+    "stripe_customer_api_lookups",
+    "Stripe customers fetched from the Stripe API because no user had their ID"
+)
+
+@lru_cache(maxsize=1)
+def get_stripe():
+    """
+    Import and configure the Stripe SDK on first use (keeps it off the cold-start path)
+    """
+    import stripe
+
+    # Configure Stripe with API key
+    stripe.api_key = settings.STRIPE_API_KEY
+    return stripe
+
+def _object_customer(data: Dict[str, Any]) -> Optional[str]:
+    """
+    Stripe customer ID of the object an event is about
+    """
+    customer = data.get("customer")
+    if isinstance(customer, dict):
+        # Expanded customer object
+        return customer.get("id")
+    return customer
+
+class StripeEventService:
+    """
+    Service for storing Stripe webhook events and applying them in the background
+    """
+
+    def __init__(self):
+        self._drain_lock = asyncio.Lock()
+        self._drain_wanted = False
+        # customer ID -> (email, fetched_at in time.monotonic() seconds)
+        self._customer_emails: Dict[str, Tuple[Optional[str], float]] = {}
+
+    @staticmethod
+    async def record(db: AsyncSession, payload: bytes) -> bool:
+        """
+        Store a verified webhook event
+
+        Args:
+            db: Database session
+            payload: Event as delivered (signature already verified)
+
+        Returns:
+            bool: True if the event is new, False for a redelivery
+        """
+        event = json.loads(payload)
+        result = await db.execute(
+            pg_insert(StripeEvent)
+            .values(
+                id=event["id"],
+                type=event["type"],
+                customer_id=_object_customer(event["data"]["object"]),
+                created=datetime.fromtimestamp(event["created"], tz=timezone.utc),
+                payload=event,
+            )
+            .on_conflict_do_nothing(index_elements=[StripeEvent.id])
+            .returning(StripeEvent.id)
+        )
+        inserted = result.scalar() is not None
+        await db.commit()
+
+        (EVENTS_RECEIVED if inserted else EVENTS_DUPLICATE).inc()
+        return inserted
+
+    async def drain(self) -> None:
+        """
+        Apply pending events until none is due
+
+        Concurrent calls on one instance collapse into the running drain,
+        which makes another pass for events stored in the meantime.
+        """
+        self._drain_wanted = True
+        if self._drain_lock.locked():
+            return
+        async with self._drain_lock:
+            while self._drain_wanted:
+                self._drain_wanted = False
+                while await self.process_next():
+                    pass
+
+    async def run(self) -> None:
+        """
+        Worker loop: drain every STRIPE_EVENT_POLL_INTERVAL seconds, for
+        retries and for events whose immediate drain did not finish
+        """
+        while True:
+            try:
+                await self.drain()
+            except Exception as e:
+                logger.error(f"Error processing Stripe events: {str(e)}")
+            await asyncio.sleep(settings.STRIPE_EVENT_POLL_INTERVAL)
+
+    @staticmethod
+    def _claim_statement():
+        """
+        Oldest due pending event with no earlier pending event of its customer, locked
+        """
+        earlier = aliased(StripeEvent)
+        return (
+            select(StripeEvent)
+            .where(
+                StripeEvent.status == "pending",
+                StripeEvent.next_attempt_at <= func.now(),
+                ~exists().where(
+                    earlier.customer_id == StripeEvent.customer_id,
+                    earlier.status == "pending",
+                    tuple_(earlier.created, earlier.received_at) < tuple_(StripeEvent.created, StripeEvent.received_at)
+                )
+            )
+            .order_by(StripeEvent.created, StripeEvent.received_at)
+            .limit(1)
+            .with_for_update(skip_locked=True, of=StripeEvent)
+        )
+
+    async def process_next(self) -> bool:
+        """
+        Claim and apply one due event
+
+        Returns:
+            bool: True if an event was claimed (applied or not), False if none is due
+        """
+        async with AsyncSessionLocal() as db:
+            event = (await db.execute(self._claim_statement())).scalars().first()
+            if event is None:
+                return False
+            event_id, attempts = event.id, event.attempts + 1
+
+            try:
+                if await self._superseded(db, event):
+                    logger.info(f"Skipping Stripe event {event.id}: a later event of {event.customer_id} was applied")
+                    event.status = "skipped"
+                else:
+                    await self._apply(db, event.payload)
+                    event.status = "processed"
+                event.attempts = attempts
+                event.last_error = None
+                event.processed_at = func.now()
+                await db.commit()
+                EVENTS_PROCESSED.inc()
+            except Exception as e:
+                await db.rollback()
+                EVENT_FAILURES.inc()
+                await self._record_failure(db, event_id, attempts, str(e))
+            return True
+
+    @staticmethod
+    async def _superseded(db: AsyncSession, event: StripeEvent) -> bool:
+        """
+        Whether a later event of the same customer has already been applied
+        """
+        if event.customer_id is None:
+            return False
+        later = await db.scalar(
+            select(StripeEvent.id)
+            .where(
+                StripeEvent.customer_id == event.customer_id,
+                StripeEvent.status == "processed",
+                tuple_(StripeEvent.created, StripeEvent.received_at) > tuple_(event.created, event.received_at)
+            )
+            .limit(1)
+        )
+        return later is not None
+
+    @staticmethod
+    async def _record_failure(db: AsyncSession, event_id: str, attempts: int, error: str) -> None:
+        """
+        Schedule the next attempt of a failed event, or give up after the last one
+        """
+        failed = attempts >= settings.STRIPE_EVENT_MAX_ATTEMPTS
+        delay = min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+        await db.execute(
+            update(StripeEvent)
+            .where(StripeEvent.id == event_id)
+            .values(
+                status="failed" if failed else "pending",
+                attempts=attempts,
+                last_error=error,
+                next_attempt_at=func.now() + timedelta(seconds=delay),
+            )
+        )
+        await db.commit()
+        if failed:
+            logger.error(f"Giving up on Stripe event {event_id} after {attempts} attempts: {error}")
+        else:
+            logger.warning(f"Stripe event {event_id} failed (attempt {attempts}), retrying in {delay}s: {error}")
+
+    async def _apply(self, db: AsyncSession, event: Dict[str, Any]) -> None:
+        """
+        Apply an event inside the caller's transaction (the caller commits)
+        """
+        event_type = event["type"]
+        data = event["data"]["object"]
+        if event_type == "checkout.session.completed":
+            # Payment is successful and the subscription is created
+            await self.handle_checkout_session_completed(db, data)
+        elif event_type == "customer.subscription.updated":
+            # Subscription was updated
+            payment_status = "paid" if data.get("status") in PAID_SUBSCRIPTION_STATUSES else "unpaid"
+            await self.handle_subscription_change(db, data, payment_status)
+        elif event_type == "customer.subscription.deleted":
+            # Subscription was canceled
+            await self.handle_subscription_change(db, data, "unpaid")
+
+    @staticmethod
+    async def _get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
+        result = await db.execute(select(User).where(User.email == email))
+        return result.scalars().first()
+
+    @staticmethod
+    async def _get_user_by_customer(db: AsyncSession, customer_id: str) -> Optional[User]:
+        result = await db.execute(select(User).where(User.stripe_customer_id == customer_id))
+        return result.scalars().first()
+
+    async def _link_customer(self, db: AsyncSession, user: User, customer_id: Optional[str]) -> None:
+        """
+        Record the Stripe customer of a user, unless another user already has it
+        """
+        if not customer_id or user.stripe_customer_id == customer_id:
+            return
+        owner = await self._get_user_by_customer(db, customer_id)
+        if owner is not None:
+            logger.warning(f"Stripe customer {customer_id} already belongs to user {owner.id}, not linking user {user.id}")
+            return
+        user.stripe_customer_id = customer_id
+
+    async def _fetch_customer_email(self, customer_id: str) -> Optional[str]:
+        """
+        Email of a Stripe customer from the Stripe API, cached for CUSTOMER_CACHE_TTL
+
+        The blocking SDK call runs in a worker thread. Stripe errors
+        propagate (and the event is retried); they are not cached.
+        """
+        now = time.monotonic()
+        cached = self._customer_emails.get(customer_id)
+        if cached is not None and now - cached[1] < CUSTOMER_CACHE_TTL:
+            return cached[0]
+
+        CUSTOMER_API_LOOKUPS.inc()
+        stripe = get_stripe()
+        customer = await asyncio.to_thread(stripe.Customer.retrieve, customer_id)
+        email = customer.get("email")
+
+        if len(self._customer_emails) >= CUSTOMER_CACHE_SIZE:
+            self._customer_emails = {
+                key: value for key, value in self._customer_emails.items() if now - value[1] < CUSTOMER_CACHE_TTL
+            }
+        self._customer_emails[customer_id] = (email, now)
+        return email
+
+    async def _resolve_customer(self, db: AsyncSession, customer_id: str) -> Optional[User]:
+        """
+        User of a Stripe customer
+
+        Looked up by stripe_customer_id; customers no user is linked to yet
+        (e.g. subscribed before customer IDs were recorded) are resolved by
+        their email through the Stripe API and linked for next time.
+        """
+        user = await self._get_user_by_customer(db, customer_id)
+        if user is not None:
+            return user
+
+        customer_email = await self._fetch_customer_email(customer_id)
+        if not customer_email:
+            logger.warning(f"No email found for customer: {customer_id}")
+            return None
+
+        user = await self._get_user_by_email(db, customer_email)
+        if not user:
+            logger.warning(f"User with email {customer_email} not found")
+            return None
+
+        await self._link_customer(db, user, customer_id)
+        return user
+
+    async def handle_checkout_session_completed(self, db: AsyncSession, session: Dict[str, Any]) -> None:
+        """
+        Mark the user who completed a checkout session as paid and link
+        them to the session's Stripe customer
+
+        Args:
+            db: Database session
+            session: Stripe checkout session object
+        """
+        customer_email = (session.get("customer_details") or {}).get("email")
+        if not customer_email:
+            logger.warning(f"No customer email found in session: {session.get('id')}")
+            return
+
+        user = await self._get_user_by_email(db, customer_email)
+        if not user:
+            logger.warning(f"User with email {customer_email} not found")
+            return
+
+        user.payment_status = "paid"
+        await self._link_customer(db, user, _object_customer(session))
+        logger.info(f"Updated payment status to 'paid' for user {user.id}")
+
+    async def handle_subscription_change(self, db: AsyncSession, subscription: Dict[str, Any], payment_status: str) -> None:
+        """
+        Set the payment status of the customer of a subscription
+
+        Args:
+            db: Database session
+            subscription: Stripe subscription object
+            payment_status: New payment status ("paid" or "unpaid")
+        """
+        customer_id = _object_customer(subscription)
+        if not customer_id:
+            logger.warning(f"No customer ID found in subscription: {subscription.get('id')}")
+            return
+
+        user = await self._resolve_customer(db, customer_id)
+        if user is None:
+            return
+
+        user.payment_status = payment_status
+        logger.info(f"Updated payment status to '{payment_status}' for user {user.id}")
+
+# Create a singleton instance
+stripe_event_service = StripeEventService()
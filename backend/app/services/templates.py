@@ -0,0 +1,158 @@
+"""
+Template Service
+
+Library prompts use {{variable}} placeholders. Content is parsed once into
+a CompiledTemplate (literal segments and variable names) that is cached in
+an LRU keyed by the content hash, so extracting variables on create and
+update and rendering the same content many times never re-scans it.
+"""
+
+import re
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+VARIABLE_PATTERN = re.compile(r"{{([^{}]+)}}")
+
+TEMPLATE_CACHE_HITS = registry.counter(
+    "template_cache_hits",
+    "Template compilations served from the cache"
+)
+TEMPLATE_CACHE_MISSES = registry.counter(
+    "template_cache_misses",
+    "Templates parsed because they were not cached"
+)
+
+class CompiledTemplate:
+    """
+    Parsed prompt content
+
+    segments holds the literal text around the placeholders (one more
+    segment than placeholders); placeholders holds each occurrence as
+    (name, original_text); variables holds the distinct names in order of
+    first occurrence.
+    """
+    __slots__ = ("segments", "placeholders", "variables")
+
+    def __init__(self, content: str):
+        segments = []
+        placeholders = []
+        position = 0
+        for match in VARIABLE_PATTERN.finditer(content):
+            segments.append(content[position:match.start()])
+            placeholders.append((match.group(1).strip(), match.group(0)))
+            position = match.end()
+        segments.append(content[position:])
+
+        self.segments: Tuple[str, ...] = tuple(segments)
+        self.placeholders: Tuple[Tuple[str, str], ...] = tuple(placeholders)
+        self.variables: Tuple[str, ...] = tuple(dict.fromkeys(name for name, _ in placeholders))
+
+    def render(self, values: Mapping[str, Optional[str]]) -> Tuple[str, List[str]]:
+        """
+        Fill the placeholders
+
+        Placeholders without a value (missing or None) are left as they are.
+
+        Args:
+            values: Variable values by name
+
+        Returns:
+            Tuple of (rendered_text, names_of_unfilled_variables)
+        """
+        if not self.placeholders:
+            return self.segments[0], []
+
+        parts = [self.segments[0]]
+        missing = []
+        for (name, original), segment in zip(self.placeholders, self.segments[1:]):
+            value = values.get(name)
+            if value is None:
+                value = original
+                if name not in missing:
+                    missing.append(name)
+            parts.append(value)
+            parts.append(segment)
+        return "".join(parts), missing
+
+class TemplateService:
+    """
+    Service for compiling and rendering prompt templates
+    """
+
+    def __init__(self, cache_size: int = 1024):
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[bytes, CompiledTemplate]" = OrderedDict()
+
+    def compile(self, content: str) -> CompiledTemplate:
+        """
+        Get the compiled form of prompt content, parsing it only on a cache miss
+
+        Args:
+            content: Prompt content
+
+        Returns:
+            CompiledTemplate
+        """
+        key = hashlib.blake2b(content.encode("utf-8"), digest_size=16).digest()
+        template = self._cache.get(key)
+        if template is not None:
+            self._cache.move_to_end(key)
+            TEMPLATE_CACHE_HITS.inc()
+            return template
+
+        TEMPLATE_CACHE_MISSES.inc()
+        template = CompiledTemplate(content)
+        if self.cache_size > 0:
+            self._cache[key] = template
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return template
+
+    def extract_variables(self, content: str, existing_variables=None) -> List[Dict[str, str]]:
+        """
+        List the distinct variables of prompt content, preserving existing values
+
+        Args:
+            content: Prompt content
+            existing_variables: Existing variables to preserve values from
+
+        Returns:
+            List of {"name", "value"} variables in order of first occurrence
+        """
+        existing_values = {}
+        if existing_variables:
+            existing_values = {variable.get("name"): variable.get("value", "") for variable in existing_variables}
+
+        return [
+            {"name": name, "value": existing_values.get(name, "")}
+            for name in self.compile(content).variables
+        ]
+
+    def render(self, content: str, values: Mapping[str, Optional[str]]) -> Tuple[str, List[str]]:
+        """
+        Render prompt content with the given variable values
+
+        Args:
+            content: Prompt content
+            values: Variable values by name
+
+        Returns:
+            Tuple of (rendered_text, names_of_unfilled_variables)
+        """
+        return self.compile(content).render(values)
+
+    def clear(self) -> None:
+        """
+        Drop all cached templates
+        """
+        self._cache.clear()
+
+# Create a singleton instance
+template_service = TemplateService(cache_size=settings.TEMPLATE_CACHE_SIZE)
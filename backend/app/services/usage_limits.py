@@ -3,13 +3,21 @@ Usage Limits Service
 
 This service handles verification of user limits for free users,
 including counting prompts and improvements and checking against defined limits.
+
+Usage is tracked in per-user counters on the users row, so limit checks
+are O(1). Improvements reserve a slot with a single conditional UPDATE
+before calling Claude, which keeps concurrent requests from exceeding
+the free limit; the slot is released again if the improvement fails.
 """
 
 import logging
 from typing import Dict, Any
 
-from app.core.database import SessionLocal
-from app.models.models import User, UserLibrary, PromptHistory
+from sqlalchemy import or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.models.models import User
 
 logger = logging.getLogger(__name__)
 
@@ -21,162 +29,188 @@ class UsageLimitsService:
     MAX_FREE_PROMPTS = 10
     MAX_FREE_IMPROVEMENTS = 3
     
-    async def check_prompt_limit(self, user_id: int) -> bool:
+    async def check_prompt_limit(self, user: User) -> bool:
         """
         Check if a user has reached their prompt limit
         
         Args:
-            user_id: The ID of the user to check
+            user: The already-loaded user to check
             
         Returns:
             bool: True if the limit has been reached, False otherwise
         """
-        try:
-            # Create a new database session
-            db = SessionLocal()
-            
-            try:
-                # Get user to check payment status
-                user = db.query(User).filter(User.id == user_id).first()
-                if not user:
-                    logger.warning(f"User with ID {user_id} not found")
-                    return False
-                
-                # Paid users have no limits
-                if user.payment_status == "paid":
-                    return False
-                
-                # Count user's prompts
-                prompt_count = db.query(UserLibrary).filter(
-                    UserLibrary.user_id == user_id
-                ).count()
-                
-                # Check if limit reached
-                return prompt_count >= self.MAX_FREE_PROMPTS
-            finally:
-                db.close()
-        except Exception as e:
-            logger.error(f"Error checking prompt limit: {str(e)}")
-            # In case of error, allow the operation to proceed
+        # Paid users have no limits
+        if user.payment_status == "paid":
             return False
+        
+        return (user.prompts_count or 0) >= self.MAX_FREE_PROMPTS
     
-    async def check_improvement_limit(self, user_id: int) -> bool:
+    async def check_improvement_limit(self, user: User) -> bool:
         """
         Check if a user has reached their improvement limit
         
         Args:
-            user_id: The ID of the user to check
+            user: The already-loaded user to check
             
         Returns:
             bool: True if the limit has been reached, False otherwise
         """
+        # Paid users have no limits
+        if user.payment_status == "paid":
+            return False
+        
+        return (user.improvements_count or 0) >= self.MAX_FREE_IMPROVEMENTS
+    
+    async def reserve_improvement(self, db: AsyncSession, user: User) -> bool:
+        """
+        Atomically reserve one improvement slot for a user
+        
+        The counter is incremented with a single conditional UPDATE ... RETURNING
+        and committed immediately, so concurrent requests cannot all pass the
+        limit check. Paid users always get a slot.
+        
+        Args:
+            db: Request-scoped database session
+            user: The already-loaded user
+            
+        Returns:
+            bool: True if a slot was reserved, False if the limit has been reached
+        """
+        result = await db.execute(
+            update(User)
+            .where(
+                User.id == user.id,
+                or_(
+                    User.payment_status == "paid",
+                    User.improvements_count < self.MAX_FREE_IMPROVEMENTS
+                )
+            )
+            .values(improvements_count=User.improvements_count + 1)
+            .returning(User.improvements_count)
+            .execution_options(synchronize_session=False)
+        )
+        improvements_count = result.scalar_one_or_none()
+        await db.commit()
+        
+        if improvements_count is None:
+            return False
+        
+        set_committed_value(user, "improvements_count", improvements_count)
+        return True
+    
+    async def release_improvement(self, db: AsyncSession, user: User) -> None:
+        """
+        Release an improvement slot reserved by reserve_improvement
+        
+        Args:
+            db: Request-scoped database session
+            user: The already-loaded user
+        """
         try:
-            # Create a new database session
-            db = SessionLocal()
+            result = await db.execute(
+                update(User)
+                .where(User.id == user.id, User.improvements_count > 0)
+                .values(improvements_count=User.improvements_count - 1)
+                .returning(User.improvements_count)
+                .execution_options(synchronize_session=False)
+            )
+            improvements_count = result.scalar_one_or_none()
+            await db.commit()
             
-            try:
-                # Get user to check payment status
-                user = db.query(User).filter(User.id == user_id).first()
-                if not user:
-                    logger.warning(f"User with ID {user_id} not found")
-                    return False
-                
-                # Paid users have no limits
-                if user.payment_status == "paid":
-                    return False
-                
-                # Count user's improvements
-                improvement_count = db.query(PromptHistory).filter(
-                    PromptHistory.user_id == user_id
-                ).count()
-                
-                # Check if limit reached
-                return improvement_count >= self.MAX_FREE_IMPROVEMENTS
-            finally:
-                db.close()
+            if improvements_count is not None:
+                set_committed_value(user, "improvements_count", improvements_count)
         except Exception as e:
-            logger.error(f"Error checking improvement limit: {str(e)}")
-            # In case of error, allow the operation to proceed
-            return False
+            await db.rollback()
+            logger.error(f"Error releasing improvement slot: {str(e)}")
     
-    async def get_user_limits(self, user_id: int) -> Dict[str, Any]:
+    async def adjust_prompts_count(self, db: AsyncSession, user_id: int, delta: int) -> None:
         """
-        Get a user's current usage and limits
+        Adjust a user's prompt counter inside the caller's transaction
+        
+        Must be called in the same transaction as the library insert or delete
+        it accounts for; the caller is responsible for committing.
         
         Args:
+            db: Request-scoped database session
             user_id: The ID of the user
+            delta: Number of prompts added (positive) or removed (negative)
+        """
+        await db.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(prompts_count=User.prompts_count + delta)
+            .execution_options(synchronize_session=False)
+        )
+    
+    async def reserve_prompts(self, db: AsyncSession, user_id: int, requested: int) -> int:
+        """
+        Reserve up to `requested` prompt slots inside the caller's transaction
+        
+        The user row is locked until the caller commits, so concurrent imports
+        and creates cannot exceed the free limit together; the counter is
+        incremented by the number of slots granted. The caller must insert
+        exactly that many items in the same transaction.
+        
+        Args:
+            db: Request-scoped database session
+            user_id: The ID of the user
+            requested: Number of prompts the caller wants to add
             
         Returns:
-            Dict containing usage and limit information
+            int: Number of slots granted (0 when the limit has been reached)
         """
-        try:
-            # Create a new database session
-            db = SessionLocal()
+        row = (await db.execute(
+            select(User.payment_status, User.prompts_count)
+            .where(User.id == user_id)
+            .with_for_update()
+        )).first()
+        if row is None:
+            return 0
+        
+        payment_status, prompts_count = row
+        granted = requested
+        if payment_status != "paid":
+            granted = max(0, min(requested, self.MAX_FREE_PROMPTS - (prompts_count or 0)))
+        
+        if granted:
+            await self.adjust_prompts_count(db, user_id, granted)
+        return granted
+    
+    async def get_user_limits(self, user: User) -> Dict[str, Any]:
+        """
+        Get a user's current usage and limits
+        
+        Args:
+            user: The already-loaded user
             
-            try:
-                # Get user to check payment status
-                user = db.query(User).filter(User.id == user_id).first()
-                if not user:
-                    logger.warning(f"User with ID {user_id} not found")
-                    return {
-                        "isPaidUser": False,
-                        "promptsCount": 0,
-                        "improvementsCount": 0,
-                        "maxFreePrompts": self.MAX_FREE_PROMPTS,
-                        "maxFreeImprovements": self.MAX_FREE_IMPROVEMENTS,
-                        "promptsLeft": self.MAX_FREE_PROMPTS,
-                        "improvementsLeft": self.MAX_FREE_IMPROVEMENTS,
-                        "hasReachedPromptsLimit": False,
-                        "hasReachedImprovementsLimit": False
-                    }
-                
-                # Check if user is paid
-                is_paid_user = user.payment_status == "paid"
-                
-                # Count user's prompts and improvements
-                prompts_count = db.query(UserLibrary).filter(
-                    UserLibrary.user_id == user_id
-                ).count()
-                
-                improvements_count = db.query(PromptHistory).filter(
-                    PromptHistory.user_id == user_id
-                ).count()
-                
-                # Calculate remaining resources
-                prompts_left = float('inf') if is_paid_user else max(0, self.MAX_FREE_PROMPTS - prompts_count)
-                improvements_left = float('inf') if is_paid_user else max(0, self.MAX_FREE_IMPROVEMENTS - improvements_count)
-                
-                # Check if limits reached
-                has_reached_prompts_limit = not is_paid_user and prompts_count >= self.MAX_FREE_PROMPTS
-                has_reached_improvements_limit = not is_paid_user and improvements_count >= self.MAX_FREE_IMPROVEMENTS
-                
-                return {
-                    "isPaidUser": is_paid_user,
-                    "promptsCount": prompts_count,
-                    "improvementsCount": improvements_count,
-                    "maxFreePrompts": self.MAX_FREE_PROMPTS,
-                    "maxFreeImprovements": self.MAX_FREE_IMPROVEMENTS,
-                    "promptsLeft": prompts_left if prompts_left != float('inf') else -1,  # Use -1 to represent infinity in JSON
-                    "improvementsLeft": improvements_left if improvements_left != float('inf') else -1,
-                    "hasReachedPromptsLimit": has_reached_prompts_limit,
-                    "hasReachedImprovementsLimit": has_reached_improvements_limit
-                }
-            finally:
-                db.close()
-        except Exception as e:
-            logger.error(f"Error getting user limits: {str(e)}")
-            # Return default values in case of error
-            return {
-                "isPaidUser": False,
-                "promptsCount": 0,
-                "improvementsCount": 0,
-                "maxFreePrompts": self.MAX_FREE_PROMPTS,
-                "maxFreeImprovements": self.MAX_FREE_IMPROVEMENTS,
-                "promptsLeft": self.MAX_FREE_PROMPTS,
-                "improvementsLeft": self.MAX_FREE_IMPROVEMENTS,
-                "hasReachedPromptsLimit": False,
-                "hasReachedImprovementsLimit": False
-            }
+        Returns:
+            Dict containing usage and limit information
+        """
+        # Check if user is paid
+        is_paid_user = user.payment_status == "paid"
+        
+        prompts_count = user.prompts_count or 0
+        improvements_count = user.improvements_count or 0
+        
+        # Calculate remaining resources
+        prompts_left = float('inf') if is_paid_user else max(0, self.MAX_FREE_PROMPTS - prompts_count)
+        improvements_left = float('inf') if is_paid_user else max(0, self.MAX_FREE_IMPROVEMENTS - improvements_count)
+        
+        # Check if limits reached
+        has_reached_prompts_limit = not is_paid_user and prompts_count >= self.MAX_FREE_PROMPTS
+        has_reached_improvements_limit = not is_paid_user and improvements_count >= self.MAX_FREE_IMPROVEMENTS
+        
+        return {
+            "isPaidUser": is_paid_user,
+            "promptsCount": prompts_count,
+            "improvementsCount": improvements_count,
+            "maxFreePrompts": self.MAX_FREE_PROMPTS,
+            "maxFreeImprovements": self.MAX_FREE_IMPROVEMENTS,
+            "promptsLeft": prompts_left if prompts_left != float('inf') else -1,  # Use -1 to represent infinity in JSON
+            "improvementsLeft": improvements_left if improvements_left != float('inf') else -1,
+            "hasReachedPromptsLimit": has_reached_prompts_limit,
+            "hasReachedImprovementsLimit": has_reached_improvements_limit
+        }
 
 # Create a singleton instance
 usage_limits_service = UsageLimitsService()
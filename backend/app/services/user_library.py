@@ -1,51 +1,272 @@
-import re
+import base64
 import logging
 from typing import List, Optional, Tuple, Dict, Any
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models.models import UserLibrary
+from app.core.pagination import apply_keyset, paginate
+from app.core.projection import make_preview, preview_column
+from app.models.models import PromptText, User, UserLibrary
 from app.schemas.user_library import UserLibraryCreate, UserLibraryUpdate, PromptVariable
+from app.services.library_tags import library_tag_service
+from app.services.prompt_texts import content_hash, prompt_text_service
+from app.services.templates import template_service
+from app.services.usage_limits import usage_limits_service
 
 logger = logging.getLogger(__name__)
 
+class DuplicateContentError(Exception):
+    """
+    Raised when an item would duplicate the content of existing library items
+    """
+    def __init__(self, item_ids: List[int]):
+        super().__init__(f"The library already contains this prompt (items {item_ids})")
+        self.item_ids = item_ids
+
+def encode_sync_token(version: int) -> str:
+    """
+    Encode a library version into an opaque sync token
+    """
+    return base64.urlsafe_b64encode(f"v1|{version}".encode()).decode().rstrip("=")
+
+def decode_sync_token(token: str) -> int:
+    """
+    Decode a sync token produced by encode_sync_token
+    
+    Raises:
+        ValueError: If the token is malformed
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        prefix, version = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        if prefix != "v1":
+            raise ValueError
+        return int(version)
+    except Exception:
+        raise ValueError("Invalid sync token")
+
 class UserLibraryService:
     """
     Service for managing user library items
+    
+    Every write takes the next value of the user's library_version (which
+    locks the user row until commit) and stores it in the item's change_seq,
+    so per-user changes commit in change_seq order and GET /library/sync can
+    return everything after a client's last seen version. Deletes are soft:
+    the row stays as a tombstone with deleted_at set.
+    
+    Contents are stored in prompt_texts (see the prompt text service) and
+    referenced by content_hash; items load their text through one join.
     """
     
     @staticmethod
-    def get_library_items(
-        db: Session, 
+    async def next_change_seq(db: AsyncSession, user_id: int, count: int = 1) -> int:
+        """
+        Advance the user's library version inside the caller's transaction
+        
+        The user row stays locked until the caller commits. The changed items
+        get the versions (result - count + 1) .. result.
+        
+        Args:
+            db: Database session
+            user_id: User ID
+            count: Number of item changes to allocate versions for
+            
+        Returns:
+            The new library version
+        """
+        return await db.scalar(
+            update(User)
+            .where(User.id == user_id)
+            .values(library_version=User.library_version + count)
+            .returning(User.library_version)
+            .execution_options(synchronize_session=False)
+        )
+    
+    @staticmethod
+    def new_item_values(item: UserLibraryCreate, user_id: int, text_hash: bytes) -> Dict[str, Any]:
+        """
+        Build the insert values for a new item, like create_library_item does
+        
+        Used by the batched inserts (batch create, NDJSON import), which store
+        the contents with prompt_text_service.store_many first.
+        """
+        if item.variables:
+            variables = [variable.model_dump() for variable in item.variables]
+        else:
+            variables = UserLibraryService.extract_variables(item.content)
+        
+        return {
+            "title": item.title,
+            "description": item.description,
+            "content_hash": text_hash,
+            "variables": variables,
+            "icon_id": item.iconId or item.icon_id,
+            "color_id": item.colorId or item.color_id,
+            "user_id": user_id,
+        }
+    
+    @staticmethod
+    def _item_to_dict(item: UserLibrary, tags: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Convert a library item to the API representation
+        """
+        return {
+            "id": item.id,
+            "title": item.title,
+            "description": item.description,
+            "content": item.content,
+            "variables": item.variables,
+            "icon_id": item.icon_id,
+            "color_id": item.color_id,
+            "user_id": item.user_id,
+            "created_at": item.created_at,
+            "updated_at": item.updated_at,
+            "tags": tags or []
+        }
+    
+    @staticmethod
+    async def find_duplicates(db: AsyncSession, user_id: int, text_hash: bytes) -> List[int]:
+        """
+        IDs of the user's live items with the given content, oldest first
+        
+        Args:
+            db: Database session
+            user_id: User ID
+            text_hash: Content hash (see content_hash)
+            
+        Returns:
+            List of item IDs
+        """
+        result = await db.execute(
+            select(UserLibrary.id)
+            .filter(
+                UserLibrary.content_hash == text_hash,
+                UserLibrary.user_id == user_id,
+                UserLibrary.deleted_at.is_(None)
+            )
+            .order_by(UserLibrary.id)
+        )
+        return list(result.scalars().all())
+    
+    @staticmethod
+    async def get_changes(
+        db: AsyncSession,
+        user: User,
+        since: Optional[int] = None,
+        limit: int = 500
+    ) -> Dict[str, Any]:
+        """
+        Get the library changes after a version, in change order
+        
+        Without a version (or with a version the server never issued) all live
+        items are returned and full_resync is set: the client must replace its
+        copy. When the client is already at the user's current version no
+        query runs.
+        
+        Args:
+            db: Database session
+            user: The already-loaded user
+            since: Library version the client has synced up to
+            limit: Maximum number of changes to return
+            
+        Returns:
+            Dict with changed items, deleted item IDs, the sync token to
+            send next time, whether more changes are pending and whether
+            this is a full resync
+        """
+        current_version = user.library_version or 0
+        if since is not None and since > current_version:
+            since = None
+        if since == current_version:
+            return {
+                "items": [], "deleted": [], "sync_token": encode_sync_token(since),
+                "has_more": False, "full_resync": False
+            }
+        
+        query = select(UserLibrary).filter(UserLibrary.user_id == user.id)
+        if since is None:
+            query = query.filter(UserLibrary.deleted_at.is_(None))
+        else:
+            query = query.filter(UserLibrary.change_seq > since)
+        query = query.order_by(UserLibrary.change_seq).limit(limit + 1)
+        
+        rows = (await db.execute(query)).scalars().all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        if rows:
+            version = rows[-1].change_seq if has_more else max(rows[-1].change_seq, current_version)
+        else:
+            version = current_version
+        
+        live_ids = [row.id for row in rows if row.deleted_at is None]
+        tags = await library_tag_service.get_tags_for_items(db, live_ids)
+        return {
+            "items": [UserLibraryService._item_to_dict(row, tags.get(row.id)) for row in rows if row.deleted_at is None],
+            "deleted": [row.id for row in rows if row.deleted_at is not None],
+            "sync_token": encode_sync_token(version),
+            "has_more": has_more,
+            "full_resync": since is None
+        }
+    
+    @staticmethod
+    async def get_library_items(
+        db: AsyncSession, 
         user_id: int, 
         skip: int = 0, 
-        limit: int = 100
-    ) -> Tuple[List[Dict[str, Any]], int]:
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        summary: bool = False,
+        tags: Optional[List[str]] = None,
+        match_all: bool = True
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
         """
-        Get user library items
+        Get user library items, newest first
+        
+        The total count is not computed here: it is kept in the user's
+        prompts_count counter. Tag filters are semi-joins on the
+        (tag_id, item_id) index, so keyset pagination works unchanged.
         
         Args:
             db: Database session
             user_id: User ID
-            skip: Number of items to skip
+            skip: Number of items to skip (ignored when a cursor is given)
             limit: Maximum number of items to return
+            cursor: Keyset cursor returned with the previous page
+            summary: Return UserLibrarySummary items (content preview only)
+            tags: Only items with these tags
+            match_all: Require all of the tags instead of any of them
             
         Returns:
-            Tuple of (items, total_count)
+            Tuple of (items, next_cursor)
         """
         try:
-            logger.info(f"Getting library items for user_id={user_id}, skip={skip}, limit={limit}")
+            logger.info(f"Getting library items for user_id={user_id}, skip={skip}, limit={limit}, cursor={cursor}, tags={tags}")
+            
+            conditions = [
+                UserLibrary.user_id == user_id,
+                UserLibrary.deleted_at.is_(None)
+            ]
+            if tags:
+                tag_conditions = await library_tag_service.filter_conditions(db, user_id, tags, match_all)
+                if tag_conditions is None:
+                    return [], None
+                conditions.extend(tag_conditions)
+            
+            if summary:
+                return await UserLibraryService._get_library_summaries(db, conditions, skip, limit, cursor)
             
             # Create base query
-            query = db.query(UserLibrary).filter(UserLibrary.user_id == user_id)
+            query = select(UserLibrary).filter(*conditions)
+            query = apply_keyset(query, UserLibrary.created_at, UserLibrary.id, cursor, limit)
+            if not cursor and skip:
+                query = query.offset(skip)
             logger.debug(f"Query: {str(query)}")
             
-            # Get total count
-            total = query.count()
-            logger.info(f"Total items found: {total}")
-            
             # Get items with pagination
-            items = query.order_by(desc(UserLibrary.created_at)).offset(skip).limit(limit).all()
+            result = await db.execute(query)
+            items, next_cursor = paginate(result.scalars().all(), limit)
             logger.info(f"Retrieved {len(items)} items after pagination")
             
             # Convert to list of dictionaries
@@ -71,8 +292,9 @@ class UserLibraryService:
                 
                 result.append(item_dict)
             
+            await library_tag_service.attach_tags(db, result)
             logger.info(f"Returning {len(result)} items")
-            return result, total
+            return result, next_cursor
         
         except Exception as e:
             logger.error(f"Error getting library items: {str(e)}")
@@ -81,7 +303,48 @@ class UserLibraryService:
             raise
     
     @staticmethod
-    def get_library_item(db: Session, item_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+    async def _get_library_summaries(
+        db: AsyncSession,
+        conditions: list,
+        skip: int,
+        limit: int,
+        cursor: Optional[str]
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Summary variant of get_library_items: selects only the listed columns
+        """
+        query = select(
+            UserLibrary.id,
+            UserLibrary.title,
+            UserLibrary.description,
+            UserLibrary.icon_id,
+            UserLibrary.color_id,
+            UserLibrary.user_id,
+            UserLibrary.created_at,
+            UserLibrary.updated_at,
+            preview_column(PromptText.content, "content_preview")
+        ).join(
+            PromptText, PromptText.hash == UserLibrary.content_hash
+        ).filter(*conditions)
+        query = apply_keyset(query, UserLibrary.created_at, UserLibrary.id, cursor, limit)
+        if not cursor and skip:
+            query = query.offset(skip)
+        
+        result = await db.execute(query)
+        rows, next_cursor = paginate(result.all(), limit)
+        
+        items = []
+        for row in rows:
+            item = row._asdict()
+            item["content_preview"], item["content_truncated"] = make_preview(item["content_preview"])
+            items.append(item)
+        
+        await library_tag_service.attach_tags(db, items)
+        logger.info(f"Returning {len(items)} item summaries")
+        return items, next_cursor
+    
+    @staticmethod
+    async def get_library_item(db: AsyncSession, item_id: int, user_id: int) -> Optional[Dict[str, Any]]:
         """
         Get a specific library item
         
@@ -95,10 +358,14 @@ class UserLibraryService:
         """
         try:
             # Get item
-            item = db.query(UserLibrary).filter(
-                UserLibrary.id == item_id,
-                UserLibrary.user_id == user_id
-            ).first()
+            result = await db.execute(
+                select(UserLibrary).filter(
+                    UserLibrary.id == item_id,
+                    UserLibrary.user_id == user_id,
+                    UserLibrary.deleted_at.is_(None)
+                )
+            )
+            item = result.scalars().first()
             
             if not item:
                 return None
@@ -121,6 +388,7 @@ class UserLibraryService:
             if hasattr(item, 'color_id'):
                 item_dict["color_id"] = item.color_id
             
+            await library_tag_service.attach_tags(db, [item_dict])
             return item_dict
         
         except Exception as e:
@@ -128,19 +396,36 @@ class UserLibraryService:
             raise
     
     @staticmethod
-    def create_library_item(db: Session, item: UserLibraryCreate, user_id: int) -> Dict[str, Any]:
+    async def create_library_item(
+        db: AsyncSession,
+        item: UserLibraryCreate,
+        user_id: int,
+        reject_duplicates: bool = False
+    ) -> Dict[str, Any]:
         """
         Create a new library item
         
+        The content is stored once however many items share it.
+        
         Args:
             db: Database session
             item: Item data
             user_id: User ID
+            reject_duplicates: Fail instead of creating an item whose content
+                is already in the user's library
             
         Returns:
             Created library item
+            
+        Raises:
+            DuplicateContentError: If reject_duplicates is set and the content is a duplicate
         """
         try:
+            if reject_duplicates:
+                duplicates = await UserLibraryService.find_duplicates(db, user_id, content_hash(item.content))
+                if duplicates:
+                    raise DuplicateContentError(duplicates)
+            
             # Extract variables from content if not provided
             variables = item.variables
             if not variables:
@@ -150,7 +435,7 @@ class UserLibraryService:
             db_item_data = {
                 "title": item.title,
                 "description": item.description,
-                "content": item.content,
+                "content_hash": await prompt_text_service.store(db, item.content),
                 "variables": variables,
                 "user_id": user_id
             }
@@ -170,12 +455,18 @@ class UserLibraryService:
                 elif item.color_id:
                     db_item_data["color_id"] = item.color_id
             
+            db_item_data["change_seq"] = await UserLibraryService.next_change_seq(db, user_id)
             db_item = UserLibrary(**db_item_data)
             
-            # Add to database
+            # Add to database and count it in the same transaction
             db.add(db_item)
-            db.commit()
-            db.refresh(db_item)
+            await usage_limits_service.adjust_prompts_count(db, user_id, 1)
+            tags = []
+            if item.tags:
+                await db.flush()
+                tags = await library_tag_service.set_item_tags(db, user_id, db_item.id, item.tags)
+            await db.commit()
+            await db.refresh(db_item)
             
             # Convert to dictionary
             item_dict = {
@@ -186,7 +477,8 @@ class UserLibraryService:
                 "variables": db_item.variables,
                 "user_id": db_item.user_id,
                 "created_at": db_item.created_at,
-                "updated_at": db_item.updated_at
+                "updated_at": db_item.updated_at,
+                "tags": tags
             }
             
             # Добавляем поля icon_id и color_id, если они есть
@@ -198,13 +490,13 @@ class UserLibraryService:
             return item_dict
         
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             logger.error(f"Error creating library item: {str(e)}")
             raise
     
     @staticmethod
-    def update_library_item(
-        db: Session, 
+    async def update_library_item(
+        db: AsyncSession, 
         item_id: int, 
         item: UserLibraryUpdate, 
         user_id: int
@@ -223,16 +515,21 @@ class UserLibraryService:
         """
         try:
             # Get item
-            db_item = db.query(UserLibrary).filter(
-                UserLibrary.id == item_id,
-                UserLibrary.user_id == user_id
-            ).first()
+            result = await db.execute(
+                select(UserLibrary).filter(
+                    UserLibrary.id == item_id,
+                    UserLibrary.user_id == user_id,
+                    UserLibrary.deleted_at.is_(None)
+                )
+            )
+            db_item = result.scalars().first()
             
             if not db_item:
                 return None
             
             # Update fields
             update_data = item.dict(exclude_unset=True)
+            new_tags = update_data.pop("tags", None)
             
             # Extract variables from content if content is updated and variables are not provided
             if "content" in update_data and "variables" not in update_data:
@@ -249,12 +546,21 @@ class UserLibraryService:
             if hasattr(item, 'colorId') and item.colorId is not None:
                 update_data["color_id"] = item.colorId
             
+            content = update_data.pop("content", None)
+            if content is not None:
+                update_data["content_hash"] = await prompt_text_service.store(db, content)
+            
             # Update item
             for key, value in update_data.items():
                 setattr(db_item, key, value)
+            db_item.change_seq = await UserLibraryService.next_change_seq(db, user_id)
+            if new_tags is not None:
+                tags = await library_tag_service.set_item_tags(db, user_id, db_item.id, new_tags)
+            else:
+                tags = (await library_tag_service.get_tags_for_items(db, [db_item.id])).get(db_item.id, [])
             
-            db.commit()
-            db.refresh(db_item)
+            await db.commit()
+            await db.refresh(db_item)
             
             # Convert to dictionary
             item_dict = {
@@ -265,7 +571,8 @@ class UserLibraryService:
                 "variables": db_item.variables,
                 "user_id": db_item.user_id,
                 "created_at": db_item.created_at,
-                "updated_at": db_item.updated_at
+                "updated_at": db_item.updated_at,
+                "tags": tags
             }
             
             # Добавляем поля icon_id и color_id, если они есть
@@ -277,12 +584,12 @@ class UserLibraryService:
             return item_dict
         
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             logger.error(f"Error updating library item: {str(e)}")
             raise
     
     @staticmethod
-    def delete_library_item(db: Session, item_id: int, user_id: int) -> bool:
+    async def delete_library_item(db: AsyncSession, item_id: int, user_id: int) -> bool:
         """
         Delete a library item
         
@@ -296,49 +603,334 @@ class UserLibraryService:
         """
         try:
             # Get item
-            db_item = db.query(UserLibrary).filter(
-                UserLibrary.id == item_id,
-                UserLibrary.user_id == user_id
-            ).first()
+            result = await db.execute(
+                select(UserLibrary).filter(
+                    UserLibrary.id == item_id,
+                    UserLibrary.user_id == user_id,
+                    UserLibrary.deleted_at.is_(None)
+                )
+            )
+            db_item = result.scalars().first()
             
             if not db_item:
                 return False
             
-            # Delete item
-            db.delete(db_item)
-            db.commit()
+            # Soft-delete the item (it stays as a sync tombstone) and uncount it
+            # in the same transaction
+            db_item.deleted_at = func.now()
+            db_item.change_seq = await UserLibraryService.next_change_seq(db, user_id)
+            await usage_limits_service.adjust_prompts_count(db, user_id, -1)
+            await library_tag_service.remove_items(db, [db_item.id])
+            await db.commit()
             
             return True
         
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             logger.error(f"Error deleting library item: {str(e)}")
             raise
     
     @staticmethod
-    def create_from_history(db: Session, history_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+    async def _get_owned_items(db: AsyncSession, user_id: int, item_ids: List[int]) -> Dict[int, UserLibrary]:
+        """
+        Load the live items among item_ids that belong to the user, in one query
+        """
+        result = await db.execute(
+            select(UserLibrary).filter(
+                UserLibrary.id.in_(set(item_ids)),
+                UserLibrary.user_id == user_id,
+                UserLibrary.deleted_at.is_(None)
+            )
+        )
+        return {item.id: item for item in result.scalars().all()}
+    
+    @staticmethod
+    async def get_library_items_by_ids(db: AsyncSession, user_id: int, item_ids: List[int]) -> List[Dict[str, Any]]:
+        """
+        Get several library items by ID
+        
+        Args:
+            db: Database session
+            user_id: User ID
+            item_ids: Item IDs
+            
+        Returns:
+            One result per requested ID, in request order (see UserLibraryBatchItemResult)
+        """
+        items = await UserLibraryService._get_owned_items(db, user_id, item_ids)
+        tags = await library_tag_service.get_tags_for_items(db, list(items))
+        return [
+            {"id": item_id, "status": 200, "item": UserLibraryService._item_to_dict(items[item_id], tags.get(item_id))}
+            if item_id in items else
+            {"id": item_id, "status": 404, "error": "Library item not found"}
+            for item_id in item_ids
+        ]
+    
+    @staticmethod
+    async def batch_create(db: AsyncSession, user_id: int, items: List[UserLibraryCreate]) -> List[Dict[str, Any]]:
+        """
+        Create several library items in one transaction
+        
+        Prompt slots are reserved once for the whole batch; when the user's
+        free limit does not cover all items, the first ones are created and
+        the rest are rejected with status 403.
+        
+        Args:
+            db: Database session
+            user_id: User ID
+            items: Items to create
+            
+        Returns:
+            One result per requested item, in request order
+        """
+        try:
+            granted = await usage_limits_service.reserve_prompts(db, user_id, len(items))
+            created: List[UserLibrary] = []
+            tags: Dict[int, List[str]] = {}
+            if granted:
+                hashes = await prompt_text_service.store_many(db, [item.content for item in items[:granted]])
+                last_seq = await UserLibraryService.next_change_seq(db, user_id, granted)
+                rows = []
+                for offset, (item, text_hash) in enumerate(zip(items, hashes)):
+                    row = UserLibraryService.new_item_values(item, user_id, text_hash)
+                    row["change_seq"] = last_seq - granted + 1 + offset
+                    rows.append(row)
+                result = await db.scalars(
+                    insert(UserLibrary).returning(UserLibrary.id, sort_by_parameter_order=True),
+                    rows
+                )
+                created_ids = list(result.all())
+                # Load the new items with their texts in one query
+                loaded = await UserLibraryService._get_owned_items(db, user_id, created_ids)
+                created = [loaded[item_id] for item_id in created_ids]
+                for db_item, item in zip(created, items):
+                    if item.tags:
+                        tags[db_item.id] = await library_tag_service.set_item_tags(db, user_id, db_item.id, item.tags)
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Error creating library items: {str(e)}")
+            raise
+        
+        logger.info(f"Batch created {granted} of {len(items)} library items for user_id={user_id}")
+        results = [
+            {"id": item.id, "status": 201, "item": UserLibraryService._item_to_dict(item, tags.get(item.id))}
+            for item in created
+        ]
+        results.extend(
+            {"status": 403, "error": "Free prompt limit reached"}
+            for _ in items[granted:]
+        )
+        return results
+    
+    @staticmethod
+    async def batch_update(db: AsyncSession, user_id: int, items: List[Any]) -> List[Dict[str, Any]]:
+        """
+        Update several library items in one transaction
+        
+        Ownership of all items is checked with one query; items that do not
+        exist or belong to another user are reported with status 404.
+        
+        Args:
+            db: Database session
+            user_id: User ID
+            items: UserLibraryBatchUpdateItem objects (UserLibraryUpdate plus id)
+            
+        Returns:
+            One result per requested item, in request order
+        """
+        try:
+            owned = await UserLibraryService._get_owned_items(db, user_id, [item.id for item in items])
+            updates = [item for item in items if item.id in owned]
+            
+            if updates:
+                contents = [item.content for item in updates if item.content is not None]
+                hashes = dict(zip(contents, await prompt_text_service.store_many(db, contents)))
+                last_seq = await UserLibraryService.next_change_seq(db, user_id, len(updates))
+                for offset, item in enumerate(updates):
+                    db_item = owned[item.id]
+                    update_data = item.model_dump(exclude_unset=True, exclude={"id", "iconId", "colorId", "tags"})
+                    if "content" in update_data and "variables" not in update_data:
+                        update_data["variables"] = UserLibraryService.extract_variables(
+                            update_data["content"],
+                            db_item.variables
+                        )
+                    if item.iconId is not None:
+                        update_data["icon_id"] = item.iconId
+                    if item.colorId is not None:
+                        update_data["color_id"] = item.colorId
+                    content = update_data.pop("content", None)
+                    if content is not None:
+                        update_data["content_hash"] = hashes[content]
+                    
+                    for key, value in update_data.items():
+                        setattr(db_item, key, value)
+                    db_item.change_seq = last_seq - len(updates) + 1 + offset
+                    if item.tags is not None:
+                        await library_tag_service.set_item_tags(db, user_id, db_item.id, item.tags)
+                
+                # Flush, then reload the updated rows (updated_at is set by the
+                # database, texts may have changed) with one query instead of
+                # a refresh per item
+                await db.flush()
+                await db.execute(
+                    select(UserLibrary)
+                    .filter(UserLibrary.id.in_(owned.keys()))
+                    .execution_options(populate_existing=True)
+                )
+            tags = await library_tag_service.get_tags_for_items(db, list(owned))
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Error updating library items: {str(e)}")
+            raise
+        
+        return [
+            {"id": item.id, "status": 200, "item": UserLibraryService._item_to_dict(owned[item.id], tags.get(item.id))}
+            if item.id in owned else
+            {"id": item.id, "status": 404, "error": "Library item not found"}
+            for item in items
+        ]
+    
+    @staticmethod
+    async def batch_delete(db: AsyncSession, user_id: int, item_ids: List[int]) -> List[Dict[str, Any]]:
+        """
+        Delete several library items in one transaction
+        
+        Args:
+            db: Database session
+            user_id: User ID
+            item_ids: Item IDs
+            
+        Returns:
+            One result per requested ID, in request order; repeated IDs after
+            the first are reported with status 404
+        """
+        try:
+            owned = await UserLibraryService._get_owned_items(db, user_id, item_ids)
+            
+            if owned:
+                # Soft-delete like delete_library_item, with one version per item
+                last_seq = await UserLibraryService.next_change_seq(db, user_id, len(owned))
+                for offset, db_item in enumerate(owned.values()):
+                    db_item.deleted_at = func.now()
+                    db_item.change_seq = last_seq - len(owned) + 1 + offset
+                await usage_limits_service.adjust_prompts_count(db, user_id, -len(owned))
+                await library_tag_service.remove_items(db, list(owned))
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Error deleting library items: {str(e)}")
+            raise
+        
+        results = []
+        deleted = set()
+        for item_id in item_ids:
+            if item_id in owned and item_id not in deleted:
+                deleted.add(item_id)
+                results.append({"id": item_id, "status": 200})
+            else:
+                results.append({"id": item_id, "status": 404, "error": "Library item not found"})
+        return results
+    
+    @staticmethod
+    async def render_items(db: AsyncSession, user_id: int, items: List[Any]) -> List[Dict[str, Any]]:
+        """
+        Render library items or ad-hoc templates with one or more value sets
+        
+        Library items are loaded with one query. Variables missing from a
+        value set are filled from the item's saved values when
+        use_saved_values is set, otherwise left as placeholders.
+        
+        Args:
+            db: Database session
+            user_id: User ID
+            items: UserLibraryRenderItem objects
+            
+        Returns:
+            One result per requested item, in request order (see UserLibraryRenderResult)
+        """
+        item_ids = [item.id for item in items if item.id is not None]
+        owned = await UserLibraryService._get_owned_items(db, user_id, item_ids) if item_ids else {}
+        
+        results = []
+        for item in items:
+            db_item = owned.get(item.id) if item.id is not None else None
+            content = item.content if item.content is not None else getattr(db_item, "content", None)
+            if content is None:
+                if item.id is None:
+                    results.append({"status": 400, "error": "Either id or content is required"})
+                else:
+                    results.append({"id": item.id, "status": 404, "error": "Library item not found"})
+                continue
+            
+            saved_values = {}
+            if db_item is not None and item.use_saved_values and db_item.variables:
+                saved_values = {
+                    variable.get("name"): variable.get("value") or None
+                    for variable in db_item.variables
+                }
+            
+            template = template_service.compile(content)
+            rendered = []
+            for values in item.values:
+                text, missing = template.render({**saved_values, **values} if saved_values else values)
+                rendered.append({"text": text, "missing": missing})
+            
+            results.append({
+                "id": item.id,
+                "status": 200,
+                "variables": list(template.variables),
+                "rendered": rendered
+            })
+        return results
+    
+    @staticmethod
+    async def create_from_history(
+        db: AsyncSession,
+        history_id: int,
+        user_id: int,
+        reject_duplicates: bool = False
+    ) -> Optional[Dict[str, Any]]:
         """
         Create a library item from history
         
+        The item references the history entry's stored improved prompt, so
+        the text is not copied.
+        
         Args:
             db: Database session
             history_id: History ID
             user_id: User ID
+            reject_duplicates: Fail instead of creating an item whose content
+                is already in the user's library
             
         Returns:
-            Created library item or None if history not found
+            Created library item or None if the user has no such history entry
+            
+        Raises:
+            DuplicateContentError: If reject_duplicates is set and the content is a duplicate
         """
         from app.models.models import PromptHistory
         
         try:
-            # Get history item
-            history_item = db.query(PromptHistory).filter(
-                PromptHistory.id == history_id
-            ).first()
+            # Get history item; other users' entries are treated as not found
+            result = await db.execute(
+                select(PromptHistory).filter(
+                    PromptHistory.id == history_id,
+                    PromptHistory.user_id == user_id
+                )
+            )
+            history_item = result.scalars().first()
             
             if not history_item:
                 return None
             
+            if reject_duplicates:
+                duplicates = await UserLibraryService.find_duplicates(db, user_id, history_item.improved_hash)
+                if duplicates:
+                    raise DuplicateContentError(duplicates)
+            
             # Extract variables from improved prompt
             variables = UserLibraryService.extract_variables(history_item.improved_prompt)
             
@@ -346,7 +938,8 @@ class UserLibraryService:
             db_item_data = {
                 "title": history_item.title or "Untitled Prompt",
                 "description": history_item.description,
-                "content": history_item.improved_prompt,
+                # Locks the shared text against cleanup until commit; nothing is inserted
+                "content_hash": await prompt_text_service.store(db, history_item.improved_prompt),
                 "variables": variables,
                 "user_id": user_id
             }
@@ -357,12 +950,14 @@ class UserLibraryService:
             if hasattr(UserLibrary, 'color_id'):
                 db_item_data["color_id"] = "cobalt"         # Значение по умолчанию
             
+            db_item_data["change_seq"] = await UserLibraryService.next_change_seq(db, user_id)
             db_item = UserLibrary(**db_item_data)
             
-            # Add to database
+            # Add to database and count it in the same transaction
             db.add(db_item)
-            db.commit()
-            db.refresh(db_item)
+            await usage_limits_service.adjust_prompts_count(db, user_id, 1)
+            await db.commit()
+            await db.refresh(db_item)
             
             # Convert to dictionary
             item_dict = {
@@ -373,7 +968,8 @@ class UserLibraryService:
                 "variables": db_item.variables,
                 "user_id": db_item.user_id,
                 "created_at": db_item.created_at,
-                "updated_at": db_item.updated_at
+                "updated_at": db_item.updated_at,
+                "tags": []
             }
             
             # Добавляем поля icon_id и color_id, если они есть
@@ -385,14 +981,17 @@ class UserLibraryService:
             return item_dict
         
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             logger.error(f"Error creating library item from history: {str(e)}")
             raise
     
     @staticmethod
     def extract_variables(content: str, existing_variables=None) -> List[Dict[str, str]]:
         """
-        Extract variables from prompt content, preserving existing values
+        Extract the distinct variables of prompt content, preserving existing values
+        
+        The content is parsed by the template service, which caches the
+        compiled template by content hash.
         
         Args:
             content: Prompt content
@@ -402,28 +1001,7 @@ class UserLibraryService:
             List of variables
         """
         try:
-            # Find all variables in the format {{variable_name}}
-            pattern = r"{{([^{}]+)}}"
-            matches = re.findall(pattern, content)
-            
-            # Create a dictionary of existing variables for quick lookup
-            existing_vars_dict = {}
-            if existing_variables:
-                existing_vars_dict = {v.get("name"): v for v in existing_variables}
-            
-            # Create variables list
-            variables = []
-            for match in matches:
-                name = match.strip()
-                existing_var = existing_vars_dict.get(name, {})
-                
-                variable = {
-                    "name": name,
-                    "value": existing_var.get("value", "")
-                }
-                variables.append(variable)
-            
-            return variables
+            return template_service.extract_variables(content, existing_variables)
         
         except Exception as e:
             logger.error(f"Error extracting variables: {str(e)}")
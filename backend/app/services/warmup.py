@@ -0,0 +1,149 @@
+"""
+Warm-up Service
+
+Prepares a fresh instance before it takes traffic: opens the minimum
+number of pooled database connections, configures the ORM mappers, runs
+the hot queries once so their compiled forms are cached, loads the shared
+catalog snapshot, and primes the TLS sessions of the shared Anthropic and
+Google HTTP clients.
+
+The warm-up runs in the background on startup and is awaited by the
+readiness endpoint, which reports the latency of every step.
+"""
+
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from sqlalchemy import text
+from sqlalchemy.orm import configure_mappers
+from sqlalchemy.pool import QueuePool
+
+from app.core.config import settings
+from app.core.database import engine, AsyncSessionLocal, pool_limits
+from app.core.http_clients import get_async_http_client, get_requests_session
+from app.core.security import GOOGLE_CERTS_URL
+from app.models import models  # noqa: F401  (registers all mappers)
+from app.services.auth import AuthService
+from app.services.prompt_catalog import prompt_catalog_service
+from app.services.prompt_improvement import prompt_improvement_service
+from app.services.user_library import user_library_service
+
+logger = logging.getLogger(__name__)
+
+# Steps that must succeed before the instance reports ready; the external
+# HTTP clients are primed on a best-effort basis so that an Anthropic or
+# Google outage does not take every instance out of rotation
+REQUIRED_STEPS = ("orm", "database", "queries")
+
+# User ID that never exists; used to run the hot queries without returning rows
+WARMUP_USER_ID = 0
+
+class WarmupService:
+    """
+    Service for warming up an instance before it receives traffic
+    """
+    def __init__(self):
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.completed = False
+        self._lock = asyncio.Lock()
+
+    @property
+    def ready(self) -> bool:
+        """
+        Whether all required warm-up steps have succeeded
+        """
+        return self.completed and all(
+            self.results.get(step, {}).get("ok") for step in REQUIRED_STEPS
+        )
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Readiness report with per-dependency warm-up latency
+        """
+        return {"ready": self.ready, "dependencies": self.results}
+
+    async def run(self) -> None:
+        """
+        Run the warm-up once; later calls retry only while the instance is not ready
+        """
+        async with self._lock:
+            if self.ready:
+                return
+
+            await self._measure("orm", self._warm_orm)
+            await asyncio.gather(
+                self._warm_database_and_queries(),
+                self._measure("anthropic", self._warm_anthropic),
+                self._measure("google", self._warm_google),
+            )
+            self.completed = True
+            logger.info(f"Warm-up finished: {self.report()}")
+
+    async def _measure(self, step: str, warm: Callable[[], Awaitable[None]]) -> bool:
+        """
+        Run one warm-up step and record its latency and outcome
+        """
+        started = time.perf_counter()
+        try:
+            await warm()
+            self.results[step] = {"ok": True, "latency_ms": round((time.perf_counter() - started) * 1000, 1)}
+            return True
+        except Exception as e:
+            logger.warning(f"Warm-up step {step} failed: {str(e)}")
+            self.results[step] = {
+                "ok": False,
+                "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+                "error": str(e)
+            }
+            return False
+
+    async def _warm_database_and_queries(self) -> None:
+        if await self._measure("database", self._warm_database):
+            await self._measure("queries", self._warm_queries)
+
+    async def _warm_orm(self) -> None:
+        # Resolve all relationships now instead of on the first request
+        configure_mappers()
+
+    async def _warm_database(self) -> None:
+        # Hold DB_POOL_MIN connections at once so the pool keeps them open
+        target = 1
+        if isinstance(engine.pool, QueuePool):
+            target = max(1, min(settings.DB_POOL_MIN, pool_limits()[0]))
+
+        connections = await asyncio.gather(
+            *(engine.connect() for _ in range(target)),
+            return_exceptions=True
+        )
+        try:
+            for connection in connections:
+                if isinstance(connection, BaseException):
+                    raise connection
+                await connection.execute(text("SELECT 1"))
+        finally:
+            for connection in connections:
+                if not isinstance(connection, BaseException):
+                    await connection.close()
+
+    async def _warm_queries(self) -> None:
+        # Run the hot-path queries once so their compiled SQL is cached
+        async with AsyncSessionLocal() as db:
+            await AuthService().get_user(db, WARMUP_USER_ID)
+            await user_library_service.get_library_items(db, user_id=WARMUP_USER_ID)
+            await prompt_improvement_service.get_history(db, user_id=WARMUP_USER_ID, include_total=False)
+        # Load the shared catalog snapshot before the first feed request
+        await prompt_catalog_service.refresh()
+
+    async def _warm_anthropic(self) -> None:
+        # Constructs the client and completes the TLS handshake; the status code is irrelevant
+        client = prompt_improvement_service.client
+        await get_async_http_client().head(str(client.base_url))
+
+    async def _warm_google(self) -> None:
+        session = get_requests_session()
+        await asyncio.to_thread(session.head, GOOGLE_CERTS_URL, timeout=10)
+
+# Create a singleton instance
+warmup_service = WarmupService()
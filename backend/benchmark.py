@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+"""
+Benchmarks for the Prompt Mixer API.
+
+Runs one of the benchmarks in the benchmarks package; the arguments after
+the mode are passed on to it:
+
+    python benchmark.py concurrency --levels 1,8,64
+    python benchmark.py importtime --budget-ms 1500
+    python benchmark.py search --db-url postgresql://localhost/scratch
+    python benchmark.py serialization --items 1000
+    python benchmark.py templates --iterations 2000
+
+`python benchmark.py <mode> --help` lists the options of a mode.
+"""
+
+import sys
+import argparse
+import importlib
+
+# Benchmark modules, by mode
+MODES = {
+    'concurrency': 'Throughput vs. in-flight requests',
+    'importtime': 'Cold-start import profile with a time budget',
+    'search': 'Full-text search latency on a synthetic corpus',
+    'serialization': 'Response encoding cost of the list endpoints',
+    'templates': 'Template extraction and rendering cost',
+}
+
+
+def main():
+    """
+    Parse the mode and run the selected benchmark
+    """
+    parser = argparse.ArgumentParser(
+        description='Benchmarks for the Prompt Mixer API',
+        epilog='Modes: ' + '; '.join(f'{mode}: {help}' for mode, help in MODES.items())
+    )
+    parser.add_argument('mode', choices=MODES, help='Benchmark to run')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='Arguments of the benchmark')
+    args = parser.parse_args()
+
+    module = importlib.import_module(f'benchmarks.{args.mode}')
+    module.main(args.args)
+
+
+if __name__ == "__main__":
+    main()
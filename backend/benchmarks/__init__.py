@@ -0,0 +1,13 @@
+"""
+Benchmarks for the Prompt Mixer API
+
+One module per concern, each runnable on its own from the backend
+directory with `python -m benchmarks.<module>` (see the module
+docstrings), or through `python benchmark.py <module>`:
+
+    concurrency    Throughput vs. in-flight requests against a running server
+    importtime     Cold-start import profile of app.main with a time budget
+    search         Full-text search latency on a synthetic corpus
+    serialization  Response encoding cost of the list endpoints
+    templates      Template extraction and rendering cost
+"""
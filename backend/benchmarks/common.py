@@ -0,0 +1,34 @@
+"""
+Helpers shared by the benchmarks
+"""
+
+import time
+from statistics import median
+
+# Synthetic corpus vocabulary: a few frequent prompt words (repeated to skew
+# their frequency) plus a long tail of rare terms
+COMMON_WORDS = (
+    "write summarize explain translate review refactor python code email article "
+    "story list steps example table customer product marketing data report bug "
+    "test function class question answer tone formal friendly short detailed"
+).split()
+RARE_WORDS = [f"term{n}" for n in range(5000)]
+
+
+def time_call(function, runs: int) -> float:
+    """
+    Median wall time of `function()` over `runs` calls, in milliseconds
+    """
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return median(timings) * 1000
+
+
+def percentile(samples: list, fraction: float) -> float:
+    """
+    Value below which `fraction` of the sorted `samples` fall
+    """
+    return samples[max(0, int(len(samples) * fraction) - 1)]
@@ -0,0 +1,119 @@
+"""
+Concurrency benchmark
+
+Measures request throughput against a running server while increasing
+the number of in-flight requests. With a non-blocking database layer
+throughput should keep scaling until the connection pool or the
+database saturates. Exits 1 if any request failed.
+
+Usage (from the backend directory):
+    python -m benchmarks.concurrency --base-url http://localhost:8000 --levels 1,8,64
+"""
+
+import sys
+import time
+import asyncio
+import argparse
+from statistics import median
+
+import httpx
+
+from benchmarks.common import percentile
+from generate_token import generate_token
+
+
+async def _run_level(client: httpx.AsyncClient, path: str, headers: dict, concurrency: int, total: int) -> dict:
+    """
+    Run `total` requests against `path` with at most `concurrency` in flight.
+
+    Returns:
+        dict: throughput and latency figures for this level
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one_request():
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.get(path, headers=headers)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_request() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "rps": total / elapsed if elapsed else 0.0,
+        "p50_ms": median(latencies) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+    }
+
+
+async def benchmark_concurrency(base_url: str, path: str, user_id: str, levels: list, requests_per_level: int) -> list:
+    """
+    Measure throughput for each concurrency level
+    """
+    headers = {"Authorization": f"Bearer {generate_token(user_id)}"}
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    results = []
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        # Warm up connections and server-side pools before measuring
+        await _run_level(client, path, headers, max(levels), max(levels))
+
+        for level in levels:
+            result = await _run_level(client, path, headers, level, requests_per_level)
+            results.append(result)
+            print(
+                f"concurrency={result['concurrency']:>4}  "
+                f"rps={result['rps']:>9.1f}  "
+                f"p50={result['p50_ms']:>8.1f}ms  "
+                f"p95={result['p95_ms']:>8.1f}ms  "
+                f"errors={result['errors']}"
+            )
+
+    return results
+
+
+def main(argv=None):
+    """
+    Parse arguments and run the concurrency benchmark
+    """
+    parser = argparse.ArgumentParser(description='Throughput vs. in-flight requests')
+    parser.add_argument('--base-url', type=str, default='http://localhost:8000',
+                        help='Base URL of a running API server')
+    parser.add_argument('--path', type=str, default='/api/v1/library?limit=20',
+                        help='Authenticated endpoint to exercise')
+    parser.add_argument('--user-id', type=str, default='1',
+                        help='User ID to issue the benchmark token for')
+    parser.add_argument('--levels', type=str, default='1,2,4,8,16,32,64',
+                        help='Comma-separated list of concurrency levels')
+    parser.add_argument('--requests', type=int, default=500,
+                        help='Number of requests per concurrency level')
+    args = parser.parse_args(argv)
+
+    levels = [int(level) for level in args.levels.split(',') if level]
+    print(f"\n=== Concurrency benchmark: GET {args.path} ===")
+    results = asyncio.run(
+        benchmark_concurrency(args.base_url, args.path, args.user_id, levels, args.requests)
+    )
+    if results and results[0]["rps"]:
+        scaling = results[-1]["rps"] / results[0]["rps"]
+        print(f"\nThroughput scaling {levels[0]} -> {levels[-1]} in-flight: x{scaling:.1f}")
+    if any(result["errors"] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Import-time benchmark
+
+Profiles `import app.main` with `python -X importtime` in a fresh
+interpreter and fails (exit 1) when the import exceeds a time budget or
+pulls in SDKs that must only be imported on first use. Suitable as a CI
+gate for cold-start regressions on a known machine; tests/test_importtime.py
+runs only the lazy-import check, which does not depend on timing.
+
+Usage (from the backend directory):
+    python -m benchmarks.importtime --budget-ms 1500
+"""
+
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+# Directory app.main is imported from
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# SDKs that must stay off the import path of app.main (dotenv is not one:
+# pydantic_settings imports it)
+LAZY_MODULES = ("stripe", "anthropic", "google.auth", "google.oauth2", "passlib")
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile_imports(module: str = "app.main") -> list:
+    """
+    Import a module in a fresh interpreter with -X importtime
+
+    Returns:
+        list: (module_name, self_us, cumulative_us, depth) for every import
+    """
+    env = dict(os.environ, FAST_STARTUP="true")
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr}")
+
+    imports = []
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            imports.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return imports
+
+
+def check_import_budget(budget_ms: float, top: int) -> bool:
+    """
+    Report the import profile of app.main and check it against the budget
+
+    Returns:
+        bool: True if the import is within budget and no lazy SDK was imported
+    """
+    imports = profile_imports()
+    total_ms = total_import_ms(imports)
+
+    print(f"Slowest {top} imports (cumulative):")
+    for name, _, cumulative, _ in sorted(imports, key=lambda item: item[2], reverse=True)[:top]:
+        print(f"  {cumulative / 1000:>8.1f}ms  {name}")
+
+    eager = eager_lazy_modules(imports)
+
+    print(f"\nTotal import time: {total_ms:.1f}ms (budget {budget_ms:.0f}ms)")
+    ok = total_ms <= budget_ms
+    if not ok:
+        print("FAIL: import time exceeds budget")
+    if eager:
+        print(f"FAIL: modules imported eagerly: {', '.join(eager)}")
+    return ok and not eager
+
+
+def eager_lazy_modules(imports: list) -> list:
+    """
+    Modules of LAZY_MODULES that appear in an import profile
+    """
+    return sorted({
+        name for name, _, _, _ in imports
+        if any(name == lazy or name.startswith(f"{lazy}.") for lazy in LAZY_MODULES)
+    })
+
+
+def total_import_ms(imports: list) -> float:
+    """
+    Cumulative time of the top-level imports of a profile, in milliseconds
+    """
+    return sum(cumulative for _, _, cumulative, depth in imports if depth == 0) / 1000
+
+
+def main(argv=None):
+    """
+    Parse arguments and run the import-time check
+    """
+    parser = argparse.ArgumentParser(description='Cold-start import profile with a time budget')
+    parser.add_argument('--budget-ms', type=float, default=1500,
+                        help='Maximum cumulative import time of app.main in milliseconds')
+    parser.add_argument('--top', type=int, default=15,
+                        help='Number of slowest imports to list')
+    args = parser.parse_args(argv)
+
+    print("\n=== Import-time profile: app.main ===")
+    if not check_import_budget(args.budget_ms, args.top):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
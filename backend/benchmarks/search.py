@@ -0,0 +1,218 @@
+"""
+Full-text search benchmark
+
+Seeds a synthetic corpus (default one million library rows and one
+million history rows) into a scratch PostgreSQL database migrated to
+head, and times ranked full-text search through the search service
+against an unindexed ILIKE scan.
+
+Usage (from the backend directory):
+    python -m benchmarks.search --db-url postgresql://localhost/scratch --rows 100000
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+from statistics import median
+
+from benchmarks.common import COMMON_WORDS, RARE_WORDS, percentile
+
+SEARCH_QUERIES = ("summarize", "python code", '"step by step"', "term42", "translate or review -email")
+SEARCH_EMAIL_DOMAIN = "search-benchmark.invalid"
+
+
+def _random_text(words: int) -> str:
+    """
+    SQL expression producing `words` random vocabulary words for each generated row
+    """
+    # The reference to g makes PostgreSQL evaluate the subquery per row
+    return (
+        "(SELECT string_agg(vocab.words[1 + floor(random() * array_length(vocab.words, 1))::int], ' ') "
+        f"FROM generate_series(1, {words}) WHERE g IS NOT NULL)"
+    )
+
+
+async def seed_search_corpus(engine, rows: int, users: int, batch: int = 100000) -> list:
+    """
+    Insert benchmark users and `rows` library and history rows spread across them
+
+    Existing benchmark rows are reused, so re-runs only top the corpus up.
+
+    Returns:
+        list: IDs of the benchmark users
+    """
+    from sqlalchemy import text
+
+    vocabulary = " ".join(COMMON_WORDS * 20 + RARE_WORDS)
+    async with engine.begin() as connection:
+        await connection.execute(text(
+            "INSERT INTO users (email, display_name, payment_status) "
+            f"SELECT 'user' || g || '@{SEARCH_EMAIL_DOMAIN}', 'Search benchmark ' || g, 'unpaid' "
+            "FROM generate_series(1, CAST(:users AS integer)) g ON CONFLICT (email) DO NOTHING"
+        ), {"users": users})
+        user_ids = (await connection.execute(text(
+            f"SELECT id FROM users WHERE email LIKE '%@{SEARCH_EMAIL_DOMAIN}' ORDER BY id"
+        ))).scalars().all()
+
+    # Per table: the staged short text column, the generated title, short text
+    # and long text (body), and the inserted columns
+    seeds = {
+        "user_library": (
+            "description",
+            f"{_random_text(4)}, {_random_text(12)}, {_random_text(60)}",
+            "title, description, content_hash, user_id, created_at",
+        ),
+        "prompt_history": (
+            "original_prompt",
+            f"{_random_text(4)}, {_random_text(30)}, {_random_text(90)}",
+            "title, original_prompt, improved_hash, user_id, created_at",
+        ),
+    }
+    for table, (short_text, generated, columns) in seeds.items():
+        async with engine.connect() as connection:
+            existing = (await connection.execute(
+                text(f"SELECT COUNT(*) FROM {table} WHERE user_id = ANY(:user_ids)"),
+                {"user_ids": user_ids}
+            )).scalar()
+        for start in range(existing, rows, batch):
+            stop = min(start + batch, rows)
+            async with engine.begin() as connection:
+                # Long texts live in prompt_texts, so stage the rows and store their texts first
+                await connection.execute(text(
+                    f"CREATE TEMP TABLE seed_rows (title text, {short_text} text, body text, "
+                    "user_id integer, created_at timestamptz) ON COMMIT DROP"
+                ))
+                await connection.execute(
+                    text(
+                        "WITH vocab AS (SELECT string_to_array(:vocabulary, ' ') AS words) "
+                        f"INSERT INTO seed_rows SELECT {generated}, "
+                        "(CAST(:user_ids AS integer[]))[1 + g % :users], now() - g * interval '1 second' "
+                        "FROM generate_series(CAST(:start AS integer), CAST(:stop AS integer) - 1) g, vocab"
+                    ),
+                    {"vocabulary": vocabulary, "user_ids": user_ids, "users": len(user_ids),
+                     "start": start, "stop": stop}
+                )
+                await connection.execute(text(
+                    "INSERT INTO prompt_texts (hash, content, size) "
+                    "SELECT sha256(convert_to(body, 'UTF8')), body, octet_length(body) FROM seed_rows "
+                    "ON CONFLICT (hash) DO NOTHING"
+                ))
+                await connection.execute(text(
+                    f"INSERT INTO {table} ({columns}) "
+                    f"SELECT title, {short_text}, sha256(convert_to(body, 'UTF8')), user_id, created_at FROM seed_rows"
+                ))
+            print(f"  {table}: {stop}/{rows} rows")
+
+    async with engine.connect() as connection:
+        await connection.execution_options(isolation_level="AUTOCOMMIT")
+        await connection.execute(text("ANALYZE user_library"))
+        await connection.execute(text("ANALYZE prompt_history"))
+
+    return list(user_ids)
+
+
+async def _time_search(search, user_ids: list, query: str, runs: int) -> dict:
+    """
+    Run `search(user_id, query)` `runs` times for random users
+
+    Returns:
+        dict: latency figures in milliseconds
+    """
+    import random
+
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        await search(random.choice(user_ids), query)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return {
+        "p50_ms": median(latencies) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+    }
+
+
+async def benchmark_search(db_url: str, rows: int, users: int, runs: int, keep: bool) -> None:
+    """
+    Time the indexed full-text search against an ILIKE scan on a synthetic corpus
+    """
+    from sqlalchemy import or_, select, text
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+    from app.core.config import to_async_url
+    from app.models.models import PromptText, UserLibrary
+    from app.services.search import search_service
+
+    engine = create_async_engine(to_async_url(db_url), pool_size=2)
+    try:
+        print(f"Seeding {rows} library and history rows across {users} users...")
+        user_ids = await seed_search_corpus(engine, rows, users)
+
+        async with AsyncSession(engine) as db:
+            async def indexed_library(user_id, query):
+                await search_service.search_library(db, user_id, query)
+
+            async def indexed_history(user_id, query):
+                await search_service.search_history(db, user_id, query)
+
+            async def ilike_library(user_id, query):
+                # Baseline: what a non-indexed search of the same fields costs
+                word = "%" + query.strip('"').split()[0] + "%"
+                await db.execute(
+                    select(UserLibrary.id)
+                    .where(
+                        UserLibrary.user_id == user_id,
+                        or_(UserLibrary.title.ilike(word), UserLibrary.description.ilike(word),
+                            PromptText.content.ilike(word))
+                    )
+                    .join(PromptText, PromptText.hash == UserLibrary.content_hash)
+                    .order_by(UserLibrary.created_at.desc())
+                    .limit(20)
+                )
+
+            for query in SEARCH_QUERIES:
+                for name, search in (("library", indexed_library), ("history", indexed_history),
+                                     ("library ILIKE", ilike_library)):
+                    result = await _time_search(search, user_ids, query, runs)
+                    print(
+                        f"{name:<14} {query!r:<30} "
+                        f"p50={result['p50_ms']:>8.1f}ms  p95={result['p95_ms']:>8.1f}ms"
+                    )
+
+        if not keep:
+            async with engine.begin() as connection:
+                await connection.execute(text("DELETE FROM user_library WHERE user_id = ANY(:ids)"), {"ids": user_ids})
+                await connection.execute(text("DELETE FROM prompt_history WHERE user_id = ANY(:ids)"), {"ids": user_ids})
+                await connection.execute(text("DELETE FROM users WHERE id = ANY(:ids)"), {"ids": user_ids})
+    finally:
+        await engine.dispose()
+
+
+def main(argv=None):
+    """
+    Parse arguments and run the search benchmark
+    """
+    parser = argparse.ArgumentParser(description='Full-text search latency on a synthetic corpus')
+    parser.add_argument('--db-url', type=str, default=os.getenv("DATABASE_URL"),
+                        help='Scratch PostgreSQL database migrated to head (defaults to DATABASE_URL)')
+    parser.add_argument('--rows', type=int, default=1000000,
+                        help='Number of library rows and of history rows to seed')
+    parser.add_argument('--users', type=int, default=100,
+                        help='Number of benchmark users the rows are spread across')
+    parser.add_argument('--runs', type=int, default=50,
+                        help='Number of timed searches per query')
+    parser.add_argument('--keep', action='store_true',
+                        help='Keep the seeded corpus for later runs')
+    args = parser.parse_args(argv)
+
+    if not args.db_url:
+        print("Error: Database URL not provided. Use --db-url argument or set DATABASE_URL environment variable.")
+        sys.exit(1)
+    print("\n=== Full-text search benchmark ===")
+    asyncio.run(benchmark_search(args.db_url, args.rows, args.users, args.runs, args.keep))
+
+
+if __name__ == "__main__":
+    main()
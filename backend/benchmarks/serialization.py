@@ -0,0 +1,146 @@
+"""
+Serialization benchmark
+
+Encodes full pages (default 1000 full prompts) of the library and
+history list endpoints through the standard response_model path and the
+orjson fast path, and reports gzip and brotli sizes and times for the
+encoded body.
+
+Usage (from the backend directory):
+    python -m benchmarks.serialization --items 1000
+"""
+
+import argparse
+
+from benchmarks.common import COMMON_WORDS, RARE_WORDS, time_call
+
+
+def _serialization_pages(items: int) -> dict:
+    """
+    Synthetic full pages of the library and history list endpoints
+    """
+    import random
+    from datetime import datetime, timedelta
+    from types import SimpleNamespace
+
+    def text(words: int) -> str:
+        return " ".join(random.choice(COMMON_WORDS + RARE_WORDS[:200]) for _ in range(words))
+
+    now = datetime.now()
+    library = [
+        {
+            "id": n,
+            "title": text(4),
+            "description": text(12),
+            "content": text(300) + " {{topic}} " + text(100),
+            "variables": [{"name": "topic", "value": None}],
+            "icon_id": "document",
+            "color_id": "blue",
+            "user_id": 1,
+            "created_at": now - timedelta(minutes=n),
+            "updated_at": now - timedelta(minutes=n),
+        }
+        for n in range(items)
+    ]
+    # History rows come from the ORM; attribute access matches that
+    history = [
+        SimpleNamespace(
+            id=n, title=text(4), description=text(12), original_prompt=text(150),
+            improved_prompt=text(450), url="https://chat.openai.com/", user_id=1,
+            created_at=now - timedelta(minutes=n)
+        )
+        for n in range(items)
+    ]
+    return {
+        "library": {"items": library, "total": items, "next_cursor": "bmV4dA"},
+        "history": {"items": history, "total": items, "next_cursor": "bmV4dA"},
+    }
+
+
+def benchmark_serialization(items: int, runs: int) -> None:
+    """
+    Time the standard and fast serialization paths of the list endpoints
+    """
+    import json
+    import zlib
+
+    from app.schemas.prompts import PromptHistory, PromptHistoryList
+    from app.schemas.user_library import UserLibraryList
+
+    try:
+        import orjson
+    except ImportError:
+        orjson = None
+        print("orjson is not installed: only the standard path is measured")
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+        print("brotli is not installed: only gzip is measured")
+
+    history_fields = tuple(PromptHistory.model_fields)
+    pages = _serialization_pages(items)
+
+    def standard(schema, page):
+        # What FastAPI does for a response_model: validate, dump in JSON mode, json.dumps
+        def run():
+            data = schema.model_validate(page, from_attributes=True).model_dump(mode="json")
+            return json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+        return run
+
+    def fast_library():
+        return orjson.dumps(pages["library"], option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+
+    def fast_history():
+        page = pages["history"]
+        content = dict(page, items=[
+            {field: getattr(entry, field) for field in history_fields} for entry in page["items"]
+        ])
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+
+    endpoints = (
+        ("GET /library", standard(UserLibraryList, pages["library"]), fast_library),
+        ("GET /prompts/history", standard(PromptHistoryList, pages["history"]), fast_history),
+    )
+    for name, standard_path, fast_path in endpoints:
+        body = standard_path()
+        print(f"\n{name} ({items} items, {len(body) / 1024:.0f} KiB)")
+        standard_ms = time_call(standard_path, runs)
+        print(f"  {'standard (pydantic + json)':<28} {standard_ms:>8.2f}ms")
+        if orjson is not None:
+            fast_ms = time_call(fast_path, runs)
+            print(f"  {'fast (orjson)':<28} {fast_ms:>8.2f}ms  x{standard_ms / fast_ms:.1f}")
+
+        def gzip_body():
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+            return compressor.compress(body) + compressor.flush()
+
+        encoders = [("gzip level 6", gzip_body)]
+        if brotli is not None:
+            encoders.append(("brotli quality 4", lambda: brotli.compress(body, quality=4)))
+        for encoder_name, encode in encoders:
+            size = len(encode())
+            encode_ms = time_call(encode, runs)
+            print(
+                f"  {encoder_name:<28} {encode_ms:>8.2f}ms  "
+                f"{size / 1024:.0f} KiB ({size / len(body):.0%} of the body)"
+            )
+
+
+def main(argv=None):
+    """
+    Parse arguments and run the serialization benchmark
+    """
+    parser = argparse.ArgumentParser(description='Response encoding cost of the list endpoints')
+    parser.add_argument('--items', type=int, default=1000,
+                        help='Number of items per page')
+    parser.add_argument('--runs', type=int, default=20,
+                        help='Number of timed runs per path')
+    args = parser.parse_args(argv)
+
+    print("\n=== Serialization benchmark ===")
+    benchmark_serialization(args.items, args.runs)
+
+
+if __name__ == "__main__":
+    main()
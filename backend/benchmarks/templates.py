@@ -0,0 +1,90 @@
+"""
+Template benchmark
+
+Compares variable extraction and rendering through the compiled template
+cache with the previous per-call regex scan, on synthetic prompts of
+several sizes.
+
+Usage (from the backend directory):
+    python -m benchmarks.templates --iterations 2000
+"""
+
+import re
+import argparse
+
+from benchmarks.common import COMMON_WORDS, time_call
+
+
+def _regex_extract_variables(content: str, existing_variables=None) -> list:
+    """
+    The variable extraction used before compiled templates (one regex scan per call)
+    """
+    matches = re.findall(r"{{([^{}]+)}}", content)
+    existing = {variable.get("name"): variable for variable in existing_variables or []}
+    return [{"name": match.strip(), "value": existing.get(match.strip(), {}).get("value", "")} for match in matches]
+
+
+def _regex_render(content: str, values: dict) -> str:
+    """
+    Straightforward regex substitution, as a client would render
+    """
+    return re.sub(
+        r"{{([^{}]+)}}",
+        lambda match: values.get(match.group(1).strip(), match.group(0)),
+        content
+    )
+
+
+def benchmark_templates(runs: int, iterations: int) -> None:
+    """
+    Time regex extraction and rendering against the compiled template cache
+    """
+    import random
+
+    from app.services.templates import TemplateService
+
+    sizes = (("short", 50, 2), ("medium", 400, 6), ("long", 3000, 20))
+    for label, words, variable_count in sizes:
+        names = [f"var{n}" for n in range(variable_count)]
+        tokens = [random.choice(COMMON_WORDS) for _ in range(words)]
+        for name in names * 2:
+            tokens.insert(random.randrange(len(tokens)), "{{" + name + "}}")
+        content = " ".join(tokens)
+        existing = [{"name": name, "value": f"saved {name}"} for name in names]
+        values = {name: f"value of {name}" for name in names}
+
+        templates = TemplateService(cache_size=1024)
+        templates.compile(content)
+
+        cases = (
+            ("extract, regex", lambda: _regex_extract_variables(content, existing)),
+            ("extract, compiled", lambda: templates.extract_variables(content, existing)),
+            ("render, regex", lambda: _regex_render(content, values)),
+            ("render, compiled", lambda: templates.render(content, values)),
+        )
+        print(f"\n{label} prompt ({len(content)} chars, {variable_count} variables used twice each)")
+        for name, function in cases:
+            def batch():
+                for _ in range(iterations):
+                    function()
+            elapsed_ms = time_call(batch, runs)
+            print(f"  {name:<20} {elapsed_ms * 1000 / iterations:>8.2f}us per call")
+
+
+def main(argv=None):
+    """
+    Parse arguments and run the template benchmark
+    """
+    parser = argparse.ArgumentParser(description='Template extraction and rendering cost')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='Number of timed runs per case')
+    parser.add_argument('--iterations', type=int, default=2000,
+                        help='Calls per timed run')
+    args = parser.parse_args(argv)
+
+    print("\n=== Template benchmark ===")
+    benchmark_templates(args.runs, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Test configuration
+
+Tests that need a database run against the PostgreSQL database named by
+TEST_DATABASE_URL, which is migrated to head and used as scratch space;
+they are skipped when it is not set:
+
+    TEST_DATABASE_URL=postgresql://postgres@localhost/prompt_mixer_test pytest
+"""
+
+import os
+
+import pytest
+
+from helpers import auth_headers_for, create_user, run
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+# The settings are read at import time, so configure them before the app is imported.
+# NullPool engines (DB_PGBOUNCER_MODE): every test runs its own event loop, and
+# pooled asyncpg connections cannot move between loops
+os.environ["DATABASE_URL"] = TEST_DATABASE_URL or "postgresql://localhost/prompt_mixer_test"
+os.environ["DATABASE_REPLICA_URLS"] = "[]"
+os.environ["DB_PGBOUNCER_MODE"] = "true"
+os.environ["FAST_STARTUP"] = "true"
+os.environ["WARMUP_ON_STARTUP"] = "false"
+os.environ["STRIPE_EVENT_WORKER_ENABLED"] = "false"
+os.environ["RATE_LIMIT_BACKEND"] = "memory"
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(scope="session")
+def database() -> str:
+    """
+    The test database, migrated to head
+    """
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(os.path.join(BACKEND_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(BACKEND_DIR, "alembic"))
+    config.set_main_option("sqlalchemy.url", TEST_DATABASE_URL.replace("%", "%%"))
+    command.upgrade(config, "head")
+    return TEST_DATABASE_URL
+
+@pytest.fixture
+def user(database):
+    """
+    A fresh user (left in the scratch database after the test)
+    """
+    return run(create_user())
+
+@pytest.fixture
+def auth_headers(user) -> dict:
+    """
+    Bearer token headers of the fresh user
+    """
+    return auth_headers_for(user)
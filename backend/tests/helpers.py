@@ -0,0 +1,65 @@
+"""
+Helpers shared by the tests
+"""
+
+import asyncio
+from contextlib import contextmanager
+from typing import Iterator, List
+from uuid import uuid4
+
+def run(coroutine):
+    """
+    Run a coroutine to completion in a fresh event loop
+    """
+    return asyncio.run(coroutine)
+
+async def create_user():
+    """
+    Insert a user with a unique email
+    """
+    from app.core.database import AsyncSessionLocal
+    from app.models.models import User
+
+    async with AsyncSessionLocal() as db:
+        user = User(email=f"{uuid4().hex}@test.invalid", display_name="Test user", payment_status="unpaid")
+        db.add(user)
+        await db.commit()
+        return user
+
+def auth_headers_for(user) -> dict:
+    """
+    Bearer token headers of a user
+    """
+    from app.services.auth import AuthService
+
+    return {"Authorization": f"Bearer {AuthService().create_access_token_for_user(user.id)}"}
+
+def client():
+    """
+    HTTP client calling the app in process
+    """
+    import httpx
+
+    from app.main import app
+
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+@contextmanager
+def count_queries() -> Iterator[List[str]]:
+    """
+    Collect the statements the app's engine executes inside the block
+    """
+    from sqlalchemy import event
+
+    from app.core.database import engine
+
+    statements: List[str] = []
+
+    def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
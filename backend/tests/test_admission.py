@@ -0,0 +1,69 @@
+"""
+Admission control of prompt improvement
+"""
+
+from fastapi import HTTPException
+
+from app.core.admission import AdmissionController, improve_admission
+from app.core.config import settings
+from helpers import client, run
+
+def controller() -> AdmissionController:
+    """
+    One slot, calls taking 4 s; authenticated calls have 10 s, anonymous ones 5 s
+    """
+    return AdmissionController(
+        "test_admission",
+        max_concurrency=1,
+        max_queue=10,
+        deadline=10.0,
+        anonymous_deadline_factor=0.5,
+        initial_latency=4.0,
+    )
+
+def admit(admission: AdmissionController, anonymous: bool) -> int:
+    """
+    Status of a call: 200 when admitted, else the status it was rejected with
+    """
+    async def admitted():
+        try:
+            async with admission.admit(anonymous=anonymous):
+                return 200
+        except HTTPException as e:
+            return e.status_code
+
+    return run(admitted())
+
+def test_free_slot_admits_anonymous():
+    assert admit(controller(), anonymous=True) == 200
+
+def test_anonymous_shed_first():
+    admission = controller()
+    # The slot is taken: a new call waits about one call duration
+    admission.in_flight = 1
+
+    assert admit(admission, anonymous=True) == 503
+    assert admit(admission, anonymous=False) == 200
+
+def improve(headers: dict) -> int:
+    async def post():
+        async with client() as http:
+            response = await http.post("/api/v1/prompts/improve", headers=headers, json={"prompt": "Write a poem"})
+            return response.status_code
+
+    return run(post())
+
+def test_anonymous_call_rejected(database):
+    assert improve({}) == 401
+
+def test_invalid_token_rejected(database):
+    assert improve({"Authorization": "Bearer invalid"}) == 401
+
+def test_shed_call_not_rate_limited(auth_headers, monkeypatch):
+    # Every slot taken by calls that run past the deadline
+    monkeypatch.setattr(improve_admission, "in_flight", improve_admission.max_concurrency)
+    monkeypatch.setattr(improve_admission, "latency", improve_admission.deadline)
+    calls = settings.IMPROVE_RATE_USER_BURST + 1
+
+    # Shed calls are refunded, so none of them runs into the rate limit
+    assert [improve(auth_headers) for _ in range(calls)] == [503] * calls
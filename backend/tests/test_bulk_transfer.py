@@ -0,0 +1,43 @@
+"""
+NDJSON export and import of the library
+"""
+
+import json
+
+from helpers import auth_headers_for, client, create_user, run
+
+ITEMS = [
+    {"title": "Essay", "content": "Write an essay about {{topic}}", "tags": ["writing", "school"]},
+    {"title": "Email", "content": "Write an email to {{name}}", "tags": ["writing"]},
+    {"title": "Untagged", "content": "Summarize {{text}}"},
+]
+
+def test_export_import_round_trip(user, auth_headers):
+    other_headers = auth_headers_for(run(create_user()))
+
+    async def round_trip():
+        async with client() as http:
+            for item in ITEMS:
+                response = await http.post("/api/v1/library", headers=auth_headers, json=item)
+                assert response.status_code == 200, response.text
+
+            exported = await http.get("/api/v1/library/export", headers=auth_headers)
+            assert exported.status_code == 200
+
+            imported = await http.post("/api/v1/library/import", headers=other_headers, content=exported.content)
+            assert imported.status_code == 200, imported.text
+
+            library = await http.get("/api/v1/library", headers=other_headers)
+            tags = await http.get("/api/v1/library/tags", headers=other_headers)
+            return exported, imported.json(), library.json(), tags.json()
+
+    exported, summary, library, tags = run(round_trip())
+
+    assert [json.loads(line)["tags"] for line in exported.text.splitlines()] == [["school", "writing"], ["writing"], []]
+    assert summary["imported"] == len(ITEMS)
+    assert {item["title"]: item["tags"] for item in library["items"]} == {
+        "Essay": ["school", "writing"],
+        "Email": ["writing"],
+        "Untagged": [],
+    }
+    assert {tag["name"]: tag["count"] for tag in tags["items"]} == {"writing": 2, "school": 1}
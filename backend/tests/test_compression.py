@@ -0,0 +1,65 @@
+"""
+Decompression of request bodies by the compression middleware
+"""
+
+import gzip
+
+import pytest
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from app.core.compression import CompressionMiddleware, bounded_brotli, load_brotli
+from helpers import run
+
+LIMIT = 1024 * 1024
+
+brotli = load_brotli()
+needs_bounded_brotli = pytest.mark.skipif(not bounded_brotli(brotli), reason="brotli 1.2 or later is not installed")
+
+async def echo_size(request: Request) -> PlainTextResponse:
+    return PlainTextResponse(str(len(await request.body())))
+
+def post(body: bytes, encoding: str, limit: int = LIMIT):
+    """
+    POST a compressed body through the middleware to an app that answers with the body's size
+    """
+    import httpx
+
+    app = CompressionMiddleware(Starlette(routes=[Route("/", echo_size, methods=["POST"])]), max_request_body=limit)
+
+    async def send():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+            return await http.post("/", content=body, headers={"Content-Encoding": encoding})
+
+    return run(send())
+
+def test_gzip_body():
+    response = post(gzip.compress(b"a" * 1000), "gzip")
+
+    assert response.status_code == 200
+    assert response.text == "1000"
+
+def test_gzip_bomb_rejected():
+    assert post(gzip.compress(b"\0" * (LIMIT * 64)), "gzip").status_code == 413
+
+@needs_bounded_brotli
+def test_brotli_body():
+    response = post(brotli.compress(b"a" * LIMIT), "br")
+
+    assert response.status_code == 200
+    assert response.text == str(LIMIT)
+
+@needs_bounded_brotli
+def test_brotli_bomb_rejected():
+    # Well under a kilobyte that would expand to 64 times the limit
+    body = brotli.compress(b"\0" * (LIMIT * 64))
+    assert len(body) < 1024
+
+    assert post(body, "br").status_code == 413
+
+def test_brotli_without_bounded_output_unsupported(monkeypatch):
+    monkeypatch.setattr("app.core.compression.bounded_brotli", lambda brotli: False)
+
+    assert post(b"\x0b\x00\x80", "br").status_code == 415
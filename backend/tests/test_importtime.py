@@ -0,0 +1,22 @@
+"""
+Lazy imports of app.main
+
+Runs `python -X importtime -c "import app.main"` in a fresh interpreter,
+like `python -m benchmarks.importtime`, and fails when the import loads
+an SDK that must only be imported on first use. The import-time budget
+is wall-clock and machine dependent, so it is checked by the benchmark
+rather than here.
+"""
+
+import pytest
+
+from benchmarks.importtime import LAZY_MODULES, profile_imports
+
+@pytest.fixture(scope="module")
+def imports() -> list:
+    return profile_imports()
+
+@pytest.mark.parametrize("module", LAZY_MODULES)
+def test_sdk_not_imported(imports, module):
+    loaded = [name for name, _, _, _ in imports if name == module or name.startswith(f"{module}.")]
+    assert loaded == []
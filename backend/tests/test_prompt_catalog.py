@@ -0,0 +1,68 @@
+"""
+Shared prompt catalog: access to the feed, and the fingerprint of the
+feed snapshot, which the shared feed ETags are built from
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.services.prompt_catalog import SharedFeedSnapshot
+from helpers import client, run
+
+CREATED_AT = datetime(2026, 10, 1, tzinfo=timezone.utc)
+
+def shared_prompts(count: int = 3) -> dict:
+    return {
+        n: {
+            "id": n,
+            "title": f"Prompt {n}",
+            "tags": ["writing"],
+            "created_at": CREATED_AT + timedelta(minutes=n),
+            "updated_at": None,
+        }
+        for n in range(1, count + 1)
+    }
+
+def test_same_prompts_same_fingerprint():
+    # As on two instances that loaded the same prompts in a different order
+    prompts = shared_prompts()
+    reordered = dict(reversed(list(shared_prompts().items())))
+
+    assert SharedFeedSnapshot(prompts).fingerprint == SharedFeedSnapshot(reordered).fingerprint
+
+def test_update_changes_fingerprint():
+    prompts = shared_prompts()
+    updated = shared_prompts()
+    updated[2]["updated_at"] = CREATED_AT + timedelta(days=1)
+
+    assert SharedFeedSnapshot(prompts).fingerprint != SharedFeedSnapshot(updated).fingerprint
+
+def test_tags_change_fingerprint():
+    prompts = shared_prompts()
+    retagged = shared_prompts()
+    retagged[1]["tags"] = ["writing", "email"]
+
+    assert SharedFeedSnapshot(prompts).fingerprint != SharedFeedSnapshot(retagged).fingerprint
+
+def test_removal_changes_fingerprint():
+    prompts = shared_prompts()
+    removed = shared_prompts()
+    del removed[3]
+
+    assert SharedFeedSnapshot(prompts).fingerprint != SharedFeedSnapshot(removed).fingerprint
+
+def get(path: str, headers: dict) -> int:
+    async def request():
+        async with client() as http:
+            return (await http.get(path, headers=headers)).status_code
+
+    return run(request())
+
+@pytest.mark.parametrize("path", ["/api/v1/prompts/shared", "/api/v1/prompts/shared/tags"])
+def test_shared_feed_requires_sign_in(database, path):
+    assert get(path, {}) == 401
+
+@pytest.mark.parametrize("path", ["/api/v1/prompts/shared", "/api/v1/prompts/shared/tags"])
+def test_shared_feed(auth_headers, path):
+    assert get(path, auth_headers) == 200
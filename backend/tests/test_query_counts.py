@@ -0,0 +1,132 @@
+"""
+Query counts of the list endpoints
+
+Each list endpoint answers with a fixed number of statements however many
+items it returns: a regression to per-item loading (N+1) shows up as a
+count that grows with the page size.
+"""
+
+import pytest
+
+from helpers import client, count_queries, run
+
+ITEMS = 30
+
+# Statements per request, starting with the user lookup of get_current_user:
+# the page, then the tags of all its items in one query
+LIBRARY_QUERIES = 3
+# The tag IDs of the filter, the page, the tags of its items, the tag counts for the total
+LIBRARY_BY_TAG_QUERIES = 5
+# The page and the total
+HISTORY_QUERIES = 3
+# With a cursor the total is not counted again
+HISTORY_NEXT_PAGE_QUERIES = 2
+# The user's tags with their counters
+TAGS_QUERIES = 2
+
+@pytest.fixture
+def library(user, auth_headers):
+    """
+    ITEMS library items of the user, each with two tags
+    """
+    async def create():
+        async with client() as http:
+            for n in range(ITEMS):
+                response = await http.post("/api/v1/library", headers=auth_headers, json={
+                    "title": f"Prompt {n}",
+                    "description": f"Description {n}",
+                    "content": f"Write about {{{{topic}}}} in {n} words",
+                    "tags": ["writing", f"group-{n % 3}"],
+                })
+                assert response.status_code == 200, response.text
+
+    run(create())
+
+@pytest.fixture
+def history(user):
+    """
+    ITEMS history entries of the user
+    """
+    from app.core.database import AsyncSessionLocal
+    from app.models.models import PromptHistory
+    from app.services.prompt_texts import prompt_text_service
+
+    async def create():
+        async with AsyncSessionLocal() as db:
+            for n in range(ITEMS):
+                db.add(PromptHistory(
+                    title=f"Prompt {n}",
+                    original_prompt=f"Original prompt {n}",
+                    improved_hash=await prompt_text_service.store(db, f"Improved prompt {n}"),
+                    user_id=user.id,
+                ))
+            await db.commit()
+
+    run(create())
+
+def get_counted(path: str, headers: dict):
+    """
+    GET a path and return the response with the statements it executed
+    """
+    async def get():
+        async with client() as http:
+            # Warm up: the first request initializes the dialect and caches
+            await http.get(path, headers=headers)
+            with count_queries() as statements:
+                response = await http.get(path, headers=headers)
+            return response, statements
+
+    return run(get())
+
+@pytest.mark.parametrize("limit", [1, ITEMS])
+@pytest.mark.parametrize("fields", ["full", "summary"])
+def test_library_list(library, auth_headers, limit, fields):
+    response, statements = get_counted(f"/api/v1/library?limit={limit}&fields={fields}", auth_headers)
+
+    assert response.status_code == 200
+    assert len(response.json()["items"]) == limit
+    assert len(statements) == LIBRARY_QUERIES, statements
+
+@pytest.mark.parametrize("limit", [1, ITEMS])
+def test_library_list_by_tag(library, auth_headers, limit):
+    response, statements = get_counted(f"/api/v1/library?limit={limit}&tags=writing", auth_headers)
+
+    assert response.status_code == 200
+    assert response.json()["total"] == ITEMS
+    assert len(statements) == LIBRARY_BY_TAG_QUERIES, statements
+
+@pytest.mark.parametrize("limit", [1, ITEMS])
+@pytest.mark.parametrize("fields", ["full", "summary"])
+def test_history_list(history, auth_headers, limit, fields):
+    response, statements = get_counted(f"/api/v1/prompts/history?limit={limit}&fields={fields}", auth_headers)
+
+    assert response.status_code == 200
+    assert len(response.json()["items"]) == limit
+    assert len(statements) == HISTORY_QUERIES, statements
+
+def test_history_next_page(history, auth_headers):
+    first, _ = get_counted("/api/v1/prompts/history?limit=10", auth_headers)
+    cursor = first.json()["next_cursor"]
+
+    response, statements = get_counted(f"/api/v1/prompts/history?limit=10&cursor={cursor}", auth_headers)
+
+    assert response.status_code == 200
+    assert len(response.json()["items"]) == 10
+    assert len(statements) == HISTORY_NEXT_PAGE_QUERIES, statements
+
+def test_library_tags(library, auth_headers):
+    response, statements = get_counted("/api/v1/library/tags", auth_headers)
+
+    assert response.status_code == 200
+    assert {tag["name"]: tag["count"] for tag in response.json()["items"]}["writing"] == ITEMS
+    assert len(statements) == TAGS_QUERIES, statements
+
+def test_not_modified_skips_the_page_query(library, auth_headers):
+    first, _ = get_counted("/api/v1/library?limit=10", auth_headers)
+    headers = dict(auth_headers, **{"If-None-Match": first.headers["ETag"]})
+
+    response, statements = get_counted("/api/v1/library?limit=10", headers)
+
+    assert response.status_code == 304
+    # Only the user lookup
+    assert len(statements) == 1, statements
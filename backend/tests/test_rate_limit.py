@@ -0,0 +1,162 @@
+"""
+Token buckets and in-flight slots of the rate limiter, on the in-memory backend
+"""
+
+import pytest
+from fastapi import HTTPException, Response
+from starlette.requests import Request
+
+from app.core import rate_limit
+from app.core.rate_limit import (
+    Bucket,
+    MemoryRateLimitBackend,
+    RateLimitBackend,
+    RateLimiter,
+    RateLimitPolicy,
+)
+from helpers import run
+
+# 3 calls at once, then one every 10 seconds
+BUCKET = Bucket(capacity=3.0, rate=0.1)
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Frozen time.monotonic() of the rate limiter; advance it by setting clock["now"]
+    """
+    clock = {"now": 1000.0}
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: clock["now"])
+    return clock
+
+def take(backend: MemoryRateLimitBackend, calls: int) -> list:
+    async def take_all():
+        return [(await backend.take("key", BUCKET)).allowed for _ in range(calls)]
+
+    return run(take_all())
+
+def test_backend_is_abstract():
+    with pytest.raises(TypeError):
+        RateLimitBackend()
+
+def test_burst(clock):
+    backend = MemoryRateLimitBackend()
+
+    assert take(backend, 4) == [True, True, True, False]
+
+def test_refill(clock):
+    backend = MemoryRateLimitBackend()
+    take(backend, 3)
+
+    clock["now"] += 5
+    assert take(backend, 1) == [False]
+    clock["now"] += 5
+    assert take(backend, 2) == [True, False]
+
+def test_refill_stops_at_capacity(clock):
+    backend = MemoryRateLimitBackend()
+    take(backend, 3)
+
+    clock["now"] += 3600
+    assert take(backend, 4) == [True, True, True, False]
+
+def test_refund(clock):
+    backend = MemoryRateLimitBackend()
+    take(backend, 3)
+
+    run(backend.refund("key", BUCKET))
+    assert take(backend, 2) == [True, False]
+
+def test_in_flight_release(clock):
+    backend = MemoryRateLimitBackend()
+    first = run(backend.acquire("key", 2, ttl=60))
+    assert run(backend.acquire("key", 2, ttl=60)) is not None
+    assert run(backend.acquire("key", 2, ttl=60)) is None
+
+    run(backend.release("key", first))
+    assert run(backend.acquire("key", 2, ttl=60)) is not None
+
+def test_in_flight_lease_expires(clock):
+    # A slot whose release never ran, as when the request was cancelled mid-way
+    backend = MemoryRateLimitBackend()
+    assert run(backend.acquire("key", 1, ttl=60)) is not None
+    assert run(backend.acquire("key", 1, ttl=60)) is None
+
+    clock["now"] += 61
+    assert run(backend.acquire("key", 1, ttl=60)) is not None
+
+def request() -> Request:
+    return Request({"type": "http", "method": "POST", "path": "/", "headers": [], "client": ("10.0.0.1", 1234)})
+
+def call(limiter: RateLimiter, policy: RateLimitPolicy, user_id=None) -> int:
+    """
+    Status of a call under a policy: 200 when admitted, else the status it was rejected with
+    """
+    async def limited():
+        try:
+            async with limiter.limit(policy, request(), Response(), user_id=user_id):
+                return 200
+        except HTTPException as e:
+            return e.status_code
+
+    return run(limited())
+
+def test_global_rejection_refunds_user_bucket(clock):
+    backend = MemoryRateLimitBackend()
+    limiter = RateLimiter(backend)
+    policy = RateLimitPolicy(scope="test", user=BUCKET, anonymous=None, total=Bucket(1.0, 0.001), max_in_flight=0)
+
+    assert call(limiter, policy, user_id=1) == 200
+    assert call(limiter, policy, user_id=2) == 429
+
+    # Rejected by the global bucket, user 2 still has all of their calls
+    assert [run(backend.take("test:user:2", BUCKET)).allowed for _ in range(4)] == [True, True, True, False]
+
+def test_in_flight_rejection_refunds_user_bucket(clock):
+    backend = MemoryRateLimitBackend()
+    limiter = RateLimiter(backend)
+    policy = RateLimitPolicy(scope="test", user=BUCKET, anonymous=None, total=None, max_in_flight=1)
+    lease = run(backend.acquire("test:in_flight:user:1", 1, ttl=60))
+    assert lease is not None
+
+    assert call(limiter, policy, user_id=1) == 429
+
+    run(backend.release("test:in_flight:user:1", lease))
+    assert [call(limiter, policy, user_id=1) for _ in range(4)] == [200, 200, 200, 429]
+
+def test_anonymous_callers_limited_per_ip(clock):
+    limiter = RateLimiter(MemoryRateLimitBackend())
+    policy = RateLimitPolicy(scope="test", user=None, anonymous=Bucket(1.0, 0.001), total=None, max_in_flight=0)
+
+    assert call(limiter, policy) == 200
+    assert call(limiter, policy) == 429
+
+def call_rejected_with(limiter: RateLimiter, policy: RateLimitPolicy, status_code: int) -> int:
+    """
+    Status of a call whose endpoint rejects it with status_code after admission
+    """
+    async def limited():
+        try:
+            async with limiter.limit(policy, request(), Response(), user_id=1):
+                raise HTTPException(status_code=status_code)
+        except HTTPException as e:
+            return e.status_code
+
+    return run(limited())
+
+@pytest.mark.parametrize("status_code", [403, 503])
+def test_endpoint_rejection_refunded(clock, status_code):
+    backend = MemoryRateLimitBackend()
+    limiter = RateLimiter(backend)
+    policy = RateLimitPolicy(scope="test", user=BUCKET, anonymous=None, total=BUCKET, max_in_flight=1)
+
+    assert [call_rejected_with(limiter, policy, status_code) for _ in range(4)] == [status_code] * 4
+
+    # Neither the user's nor the global bucket was charged, and the slot is free
+    assert [call(limiter, policy, user_id=1) for _ in range(4)] == [200, 200, 200, 429]
+
+def test_endpoint_failure_charged(clock):
+    limiter = RateLimiter(MemoryRateLimitBackend())
+    policy = RateLimitPolicy(scope="test", user=BUCKET, anonymous=None, total=None, max_in_flight=0)
+
+    assert [call_rejected_with(limiter, policy, 500) for _ in range(3)] == [500] * 3
+    assert call(limiter, policy, user_id=1) == 429
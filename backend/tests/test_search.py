@@ -0,0 +1,33 @@
+"""
+Highlighted snippets of library search results
+"""
+
+from helpers import client, run
+
+def search(auth_headers: dict, item: dict, query: str) -> dict:
+    async def create_and_search():
+        async with client() as http:
+            response = await http.post("/api/v1/library", headers=auth_headers, json=item)
+            assert response.status_code == 200, response.text
+            response = await http.get("/api/v1/library/search", headers=auth_headers, params={"q": query})
+            assert response.status_code == 200, response.text
+            return response.json()["items"][0]
+
+    return run(create_and_search())
+
+def test_snippet_markup_is_escaped(auth_headers):
+    result = search(auth_headers, {
+        "title": "Essay <b>bold</b>",
+        "content": "Write an essay about <img src=x onerror=alert(1)> & <script>alert(1)</script> cats",
+    }, "essay")
+
+    assert "<mark>essay</mark>" in result["snippet"].lower()
+    assert "<mark>essay</mark>" in result["title_highlight"].lower()
+    for snippet in (result["snippet"], result["title_highlight"]):
+        assert "<" not in snippet.replace("<mark>", "").replace("</mark>", "")
+
+def test_markers_in_text_are_not_highlights(auth_headers):
+    result = search(auth_headers, {"title": "Markers", "content": "Write a \x02poem\x03 about the sea"}, "sea")
+
+    assert result["snippet"].count("<mark>") == 1
+    assert "\x02" not in result["snippet"] and "\x03" not in result["snippet"]
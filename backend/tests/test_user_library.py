@@ -0,0 +1,50 @@
+"""
+Library items created from history entries
+"""
+
+import pytest
+
+from helpers import auth_headers_for, client, create_user, run
+
+@pytest.fixture
+def history_entry(user) -> int:
+    """
+    A history entry of the user
+    """
+    from app.core.database import AsyncSessionLocal
+    from app.models.models import PromptHistory
+    from app.services.prompt_texts import prompt_text_service
+
+    async def create() -> int:
+        async with AsyncSessionLocal() as db:
+            entry = PromptHistory(
+                title="Improved",
+                original_prompt="Write about {{topic}}",
+                improved_hash=await prompt_text_service.store(db, "Write a short essay about {{topic}}"),
+                user_id=user.id,
+            )
+            db.add(entry)
+            await db.commit()
+            return entry.id
+
+    return run(create())
+
+def post_from_history(history_id: int, headers: dict):
+    async def post():
+        async with client() as http:
+            return await http.post(f"/api/v1/library/from-history/{history_id}", headers=headers)
+
+    return run(post())
+
+def test_create_from_own_history(history_entry, auth_headers):
+    response = post_from_history(history_entry, auth_headers)
+
+    assert response.status_code == 200, response.text
+    assert response.json()["content"] == "Write a short essay about {{topic}}"
+
+def test_create_from_other_users_history_is_not_found(history_entry):
+    other_user = run(create_user())
+
+    response = post_from_history(history_entry, auth_headers_for(other_user))
+
+    assert response.status_code == 404